@@ -0,0 +1,59 @@
+"""Custo de (de)serializar o histórico de um contato: json da stdlib vs codec.
+
+Uso::
+
+    python -m benchmarks.bench_codec [--messages 1000] [--rounds 50]
+"""
+
+import argparse
+import json
+import time
+
+from zoi_ia import codec
+from zoi_ia.codec import MessageEvent
+
+
+def _make_store(n: int) -> dict:
+    msgs = [
+        {
+            "direction": "inbound" if i % 2 else "outbound",
+            "body": f"mensagem número {i} com acentuação " * 4,
+            "conversationId": "conv",
+        }
+        for i in range(n)
+    ]
+    return {"messages": msgs, "context": "resumo " * 50, "flow": {"current_step": "", "checklist": []}}
+
+
+def _timeit(fn, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    store = _make_store(args.messages)
+    raw = codec.dumpb(store, pretty=True)
+    event = json.dumps({"type": "InboundMessage", "contactId": "c1", "conversationId": "conv", "body": "oi"}).encode()
+    rows = {
+        "stdlib dumps": lambda: json.dumps(store, ensure_ascii=False, indent=2).encode("utf-8"),
+        "codec dumpb": lambda: codec.dumpb(store, pretty=True),
+        "stdlib loads": lambda: json.loads(raw.decode("utf-8")),
+        "codec loads": lambda: codec.loads(raw),
+        "stdlib digest": lambda: [json.dumps(m, ensure_ascii=False, sort_keys=True) for m in store["messages"]],
+        "codec digest": lambda: [codec.dumpb(m, sort_keys=True) for m in store["messages"]],
+        "event decode x1000": lambda: [codec.decode(event, MessageEvent) for _ in range(1000)],
+    }
+    print(f"backend={codec.BACKEND} messages={args.messages} bytes={len(raw)}")
+    for name, fn in rows.items():
+        print(f"{name:>20}: {_timeit(fn, args.rounds):8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
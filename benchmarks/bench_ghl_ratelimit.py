@@ -0,0 +1,101 @@
+"""Vazão contra um GHL simulado que responde 429 acima da quota.
+
+Compara o backoff exponencial antigo (agendador desativado) com o token
+bucket + Retry-After, disparando buscas de histórico e envios ao mesmo tempo.
+
+Uso::
+
+    python -m benchmarks.bench_ghl_ratelimit [--fetches 100] [--sends 20] [--quota 20] [--window 0.5]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from zoi_ia.clients import ghl_client, http
+from zoi_ia.clients.ratelimit import PRIORITY_FETCH, PRIORITY_SEND, RateLimiter
+
+
+class FakeGhl:
+    """Janela fixa de ``quota`` requisições a cada ``window`` segundos."""
+
+    def __init__(self, quota: int, window: float) -> None:
+        self.quota = quota
+        self.window = window
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.rejected = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        now = time.monotonic()
+        if now - self.window_start >= self.window:
+            self.window_start, self.used = now, 0
+        reset = self.window - (now - self.window_start)
+        headers = {"X-RateLimit-Interval-Milliseconds": str(int(self.window * 1000))}
+        if self.used >= self.quota:
+            self.rejected += 1
+            headers["Retry-After"] = f"{reset:.3f}"
+            headers["X-RateLimit-Remaining"] = "0"
+            return httpx.Response(429, headers=headers)
+        self.used += 1
+        headers["X-RateLimit-Remaining"] = str(self.quota - self.used)
+        await asyncio.sleep(0.005)
+        return httpx.Response(200, headers=headers, json={"messages": []})
+
+
+async def _run(mode: str, args: argparse.Namespace) -> dict:
+    server = FakeGhl(args.quota, args.window)
+    rate = args.quota / args.window if mode == "bucket" else 0
+    ghl_client.GHL_LIMITER = RateLimiter(rate=rate, burst=args.quota)
+    http.start(transport=httpx.MockTransport(server))
+    latencies = {"send": [], "fetch": []}
+    failed = 0
+
+    async def one(kind: str, i: int) -> None:
+        nonlocal failed
+        priority = PRIORITY_SEND if kind == "send" else PRIORITY_FETCH
+        started = time.perf_counter()
+        try:
+            await ghl_client._request_with_retries("GET", f"https://ghl.test/{kind}/{i}", priority=priority)
+            latencies[kind].append(time.perf_counter() - started)
+        except httpx.HTTPStatusError:
+            failed += 1
+
+    started = time.perf_counter()
+    jobs = [one("fetch", i) for i in range(args.fetches)] + [one("send", i) for i in range(args.sends)]
+    await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - started
+    await http.close()
+
+    def p50(values):
+        return round(statistics.median(values) * 1000, 1) if values else None
+
+    done = len(latencies["send"]) + len(latencies["fetch"])
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 2),
+        "ok": done,
+        "failed": failed,
+        "req_per_s": round(done / elapsed, 1),
+        "429s": server.rejected,
+        "send_p50_ms": p50(latencies["send"]),
+        "fetch_p50_ms": p50(latencies["fetch"]),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fetches", type=int, default=100)
+    parser.add_argument("--sends", type=int, default=20)
+    parser.add_argument("--quota", type=int, default=20)
+    parser.add_argument("--window", type=float, default=0.5)
+    args = parser.parse_args()
+    for mode in ("backoff", "bucket"):
+        print(asyncio.run(_run(mode, args)))
+
+
+if __name__ == "__main__":
+    main()
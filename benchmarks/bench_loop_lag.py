@@ -0,0 +1,62 @@
+"""Lag do event loop ao salvar históricos grandes: I/O síncrono vs pool de I/O.
+
+Uso::
+
+    python -m benchmarks.bench_loop_lag [--messages 5000] [--saves 40]
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from zoi_ia import async_storage, storage
+from zoi_ia.metrics import LoopLagMonitor
+
+
+def _make_store(n: int) -> dict:
+    msgs = [
+        {"direction": "inbound" if i % 2 else "outbound", "body": f"mensagem {i} " * 8, "conversationId": "conv"}
+        for i in range(n)
+    ]
+    return {"messages": msgs, "context": "resumo " * 50, "flow": {"current_step": "", "checklist": []}}
+
+
+async def _run(mode: str, store: dict, saves: int) -> dict:
+    monitor = LoopLagMonitor(interval=0.002)
+    monitor.start()
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+
+    async def one(i: int) -> None:
+        cid = f"c{i % 8}"
+        if mode == "sync":
+            storage.save_contact_messages(cid, store)
+            await asyncio.sleep(0)
+        else:
+            await async_storage.save_contact_messages(cid, store)
+
+    await asyncio.gather(*(one(i) for i in range(saves)))
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    return {"mode": mode, "elapsed_s": round(elapsed, 3), **monitor.snapshot()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--saves", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.MESSAGES_DIR = Path(tmp)
+        store = _make_store(args.messages)
+        for mode in ("sync", "pool"):
+            print(asyncio.run(_run(mode, store, args.saves)))
+    async_storage.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Montagem do prompt: leitura dos arquivos a cada resposta vs prefixo pré-compilado.
+
+Mede o tempo de montar as mensagens do chat e a estabilidade do início do
+prompt entre respostas consecutivas (quanto do prompt serializado é idêntico
+ao anterior, que é o que o cache de prompt do provedor aproveita).
+
+Uso::
+
+    python -m benchmarks.bench_prompt [--turns 500]
+"""
+
+import argparse
+import os
+import time
+
+from zoi_ia import ai_agent, codec
+from zoi_ia.conversation import ConversationBuffer
+
+
+def _legacy_messages(store: dict, extra_context: str) -> list:
+    # leitura dos arquivos a cada resposta e ordem de antes do PromptTemplate
+    history = ConversationBuffer.coerce(store.get("messages"))
+    convo = history.last(15, lambda m: m.get("direction") in {"inbound", "outbound"})
+    msgs = [{"role": "system", "content": ai_agent._system_prompt()}]
+    msgs.extend(ai_agent._fewshots())
+    if store.get("context"):
+        msgs.append({"role": "assistant", "content": f"Memória (não compartilhar com o cliente):\n{store['context']}"})
+    if extra_context:
+        msgs.append({"role": "assistant", "content": f"Contexto recuperado (não compartilhar com o cliente):\n{extra_context}"})
+    msgs.append({
+        "role": "assistant",
+        "content": "Memória de processo (não compartilhar com o cliente):\n" + codec.dumps(store["flow"]),
+    })
+    for m in convo:
+        role = "user" if m.get("direction") == "inbound" else "assistant"
+        msgs.append({"role": role, "content": str(m.get("body") or "")})
+    return msgs
+
+
+def _legacy_prefix(_store: dict, _extra: str) -> list:
+    return [{"role": "system", "content": ai_agent._system_prompt()}, *ai_agent._fewshots()]
+
+
+def _compiled_prefix(_store: dict, _extra: str) -> list:
+    return list(ai_agent.PROMPT.prefix())
+
+
+def _turns(n: int):
+    messages = []
+    for i in range(n):
+        messages.insert(0, {"direction": "inbound" if i % 2 == 0 else "outbound", "body": f"mensagem {i}"})
+        store = {
+            "messages": list(messages),
+            "context": "Cliente procura um SUV até 120 mil.",
+            "flow": {"current_step": "qualificação", "checklist": ["orçamento", "modelo"]},
+        }
+        yield store, f"- (inbound) trecho recuperado {i % 7}"
+
+
+def _common_prefix(a: bytes, b: bytes) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _run(name: str, build, turns: int) -> None:
+    elapsed = 0.0
+    prev = None
+    shared = total = 0
+    for store, extra in _turns(turns):
+        started = time.perf_counter()
+        msgs = build(store, extra)
+        elapsed += time.perf_counter() - started
+        raw = codec.dumpb(msgs)
+        if prev is not None:
+            shared += _common_prefix(prev, raw)
+            total += len(raw)
+        prev = raw
+    print(
+        f"{name:>10}: {elapsed / turns * 1e6:8.1f} µs/montagem  "
+        f"prefixo comum {shared / max(total, 1):6.1%}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    print("prefixo fixo (system + few-shots):")
+    _run("legado", _legacy_prefix, args.turns)
+    _run("compilado", _compiled_prefix, args.turns)
+    print("prompt completo:")
+    _run("legado", _legacy_messages, args.turns)
+    _run("compilado", ai_agent._build_chat_messages, args.turns)
+    print(f"recompilações do prefixo: {ai_agent.PROMPT.compiles} ({ai_agent.PROMPT.fingerprint})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Vazão de um webhook com a assinatura desligada, verificada como antes e com o WebhookVerifier.
+
+Sobe um servidor aiohttp local com uma rota que lê o corpo, confere o
+``X-Wh-Signature`` e responde 202, e dispara requisições concorrentes contra
+ele. Modos:
+
+- ``off``: sem verificação;
+- ``legado``: importa o ``cryptography`` e carrega a chave PEM a cada
+  requisição, verificando no event loop;
+- ``verifier``: chave carregada uma vez;
+- ``verifier+thread``: idem, com a verificação sempre numa thread.
+
+Requer ``cryptography`` (gera um par RSA 4096 só para o teste).
+
+Uso::
+
+    python -m benchmarks.bench_signature [--requests 2000] [--concurrency 32] [--payload-kb 2]
+"""
+
+import argparse
+import asyncio
+import base64
+import time
+
+from aiohttp import ClientSession, web
+
+from zoi_ia.signature import WebhookVerifier
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+except Exception:  # pragma: no cover
+    rsa = None  # type: ignore
+
+
+def _legacy_verify(pem: bytes, payload: bytes, signature_b64: str) -> bool:
+    # o que o tag_tracker fazia por requisição
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives import hashes
+
+    try:
+        pub = load_pem_public_key(pem)
+        pub.verify(base64.b64decode(signature_b64), payload, padding.PKCS1v15(), hashes.SHA256())
+        return True
+    except Exception:
+        return False
+
+
+def _app(check) -> web.Application:
+    async def handle(request: web.Request):
+        raw = await request.read()
+        if not await check(raw, request.headers.get("X-Wh-Signature", "")):
+            return web.json_response({"error": "invalid signature"}, status=401)
+        return web.json_response({"ok": True, "queued": True}, status=202)
+
+    app = web.Application()
+    app.add_routes([web.post("/hook", handle)])
+    return app
+
+
+async def _run(name: str, check, payload: bytes, signature: str, args) -> None:
+    runner = web.AppRunner(_app(check), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/hook"
+    failed = 0
+    remaining = args.requests
+
+    async with ClientSession() as session:
+
+        async def worker() -> None:
+            nonlocal failed, remaining
+            while remaining > 0:
+                remaining -= 1
+                async with session.post(url, data=payload, headers={"X-Wh-Signature": signature}) as resp:
+                    await resp.read()
+                    failed += resp.status != 202
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    await runner.cleanup()
+    print(f"{name:>16}: {args.requests / elapsed:8.0f} req/s  falhas {failed}")
+
+
+async def main_async(args) -> None:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=4096)
+    pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    payload = b'{"type":"InboundMessage","body":"' + b"x" * (args.payload_kb * 1024) + b'"}'
+    signature = base64.b64encode(key.sign(payload, padding.PKCS1v15(), hashes.SHA256())).decode()
+
+    async def off(_raw, _sig):
+        return True
+
+    async def legacy(raw, sig):
+        return _legacy_verify(pem, raw, sig)
+
+    cached = WebhookVerifier(pem, enabled=True, offload_bytes=0)
+    threaded = WebhookVerifier(pem, enabled=True, offload_bytes=1)
+
+    await _run("off", off, payload, signature, args)
+    await _run("legado", legacy, payload, signature, args)
+    await _run("verifier", cached.verify_async, payload, signature, args)
+    await _run("verifier+thread", threaded.verify_async, payload, signature, args)
+    snap = cached.snapshot()
+    print(f"verificação: p50 {snap['verifyP50Us']} µs  p99 {snap['verifyP99Us']} µs")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--payload-kb", type=int, default=2)
+    args = parser.parse_args()
+    if rsa is None:
+        print("instale 'cryptography' para rodar este benchmark")
+        return
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -176,6 +176,24 @@ class TokenBundle:
     location_id: Optional[str] = None
 
 
+def _bundle_from_payload(payload: dict) -> TokenBundle:
+    # calcula expires_at (se houver expires_in)
+    expires_at = None
+    if "expires_in" in payload:
+        expires_at = (datetime.utcnow() + timedelta(seconds=int(payload["expires_in"]))).isoformat() + "Z"
+
+    return TokenBundle(
+        access_token=payload.get("access_token"),
+        token_type=payload.get("token_type", "Bearer"),
+        refresh_token=payload.get("refresh_token"),
+        scope=payload.get("scope"),
+        user_type=payload.get("userType") or payload.get("user_type"),
+        expires_at=expires_at,
+        company_id=payload.get("companyId"),
+        location_id=payload.get("locationId"),
+    )
+
+
 async def exchange_code_for_tokens(
     client: httpx.AsyncClient,
     code: str,
@@ -204,23 +222,43 @@ async def exchange_code_for_tokens(
         timeout=30.0,
     )
     resp.raise_for_status()
-    payload = resp.json()
+    return _bundle_from_payload(resp.json())
 
-    # calcula expires_at (se houver expires_in)
-    expires_at = None
-    if "expires_in" in payload:
-        expires_at = (datetime.utcnow() + timedelta(seconds=int(payload["expires_in"]))).isoformat() + "Z"
 
-    return TokenBundle(
-        access_token=payload.get("access_token"),
-        token_type=payload.get("token_type", "Bearer"),
-        refresh_token=payload.get("refresh_token"),
-        scope=payload.get("scope"),
-        user_type=payload.get("userType") or payload.get("user_type"),
-        expires_at=expires_at,
-        company_id=payload.get("companyId"),
-        location_id=payload.get("locationId"),
+async def refresh_access_token(
+    client: httpx.AsyncClient,
+    bundle: dict,
+    client_id: str,
+    client_secret: str,
+) -> TokenBundle:
+    """
+    Renova um token salvo (Agência ou Location) usando o refresh_token.
+    O refresh_token antigo deixa de valer: persista o novo bundle.
+    """
+    refresh_token = bundle.get("refresh_token")
+    if not refresh_token:
+        raise ValueError("token sem refresh_token")
+    data = {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "user_type": bundle.get("user_type") or "Location",
+    }
+
+    resp = await client.post(
+        f"{GHL_API_URL}/oauth/token",
+        data=data,
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        timeout=30.0,
     )
+    resp.raise_for_status()
+    tokens = _bundle_from_payload(resp.json())
+    # o payload do refresh nem sempre repete os ids
+    tokens.company_id = tokens.company_id or bundle.get("company_id")
+    tokens.location_id = tokens.location_id or bundle.get("location_id")
+    tokens.refresh_token = tokens.refresh_token or refresh_token
+    return tokens
 
 
 async def get_location_access_token(
@@ -248,22 +286,7 @@ async def get_location_access_token(
         timeout=30.0,
     )
     resp.raise_for_status()
-    payload = resp.json()
-
-    expires_at = None
-    if "expires_in" in payload:
-        expires_at = (datetime.utcnow() + timedelta(seconds=int(payload["expires_in"]))).isoformat() + "Z"
-
-    return TokenBundle(
-        access_token=payload.get("access_token"),
-        token_type=payload.get("token_type", "Bearer"),
-        refresh_token=payload.get("refresh_token"),
-        scope=payload.get("scope"),
-        user_type=payload.get("userType") or payload.get("user_type"),
-        expires_at=expires_at,
-        company_id=payload.get("companyId"),
-        location_id=payload.get("locationId"),
-    )
+    return _bundle_from_payload(resp.json())
 
 
 async def run_oauth_flow(
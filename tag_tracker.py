@@ -1,31 +1,51 @@
-import base64
-import json
+import hmac
 import logging
+import os
+from dataclasses import asdict
+
 from aiohttp import web
 
-from zoi_ia.ai_agent import generate_reply
+import oauth
+from zoi_ia import async_storage, codec, metrics, resilience
+from zoi_ia.ai_agent import CONTEXT_STATS, PROMPT, REPLY_STATS, generate_reply
+from zoi_ia.conversation import ConversationBuffer
+from zoi_ia.signature import WebhookVerifier
+from zoi_ia.tokens import warm_up as warm_up_tokenizer
 from zoi_ia.config import (
     TAG_NAME,
     PORT,
-    VERIFY_SIGNATURE,
-    PUBLIC_KEY_PEM,
+    CONTEXT_MAX_TURNS,
     RAG_ENABLED,
     RAG_K,
     RAG_MIN_SIM,
     TRANSCRIBE_AUDIO,
+    DESCRIBE_IMAGES,
+    MEDIA_CONCURRENCY,
     LOG_WEBHOOKS,
+    LOOP_LAG_INTERVAL,
+    AGENCY_TOKEN_PATH,
+    GHL_CLIENT_ID,
+    GHL_CLIENT_SECRET,
+    ADMIN_TOKEN,
+    INGEST_MODE,
 )
-from zoi_ia.storage import (
-    load_store,
-    save_store,
-    load_contact_messages,
-    save_contact_messages,
-)
-from zoi_ia.clients.ghl_client import (
-    fetch_conversation_messages,
-    send_outbound_message,
-)
-from zoi_ia.services.context_service import update_context
+from zoi_ia.codec import ContactTagEvent, MessageEvent
+from zoi_ia.clients import http
+from zoi_ia.clients.ratelimit import GHL_LIMITER
+from zoi_ia.clients.ghl_client import send_outbound_message
+from zoi_ia.clients.openai_gateway import GATEWAY
+from zoi_ia.services.active_contacts import ActiveContactRegistry
+from zoi_ia.services.dedup import DedupStore
+from zoi_ia.services.echo import EchoTable
+from zoi_ia.services.debounce import Burst, ReplyDebouncer
+from zoi_ia.services.context_service import SummaryScheduler, needs_context_update, update_context
+from zoi_ia.services.ingest import IngestQueue
+from zoi_ia.services.history_sync import SYNC_KEY, sync_into_store
+from zoi_ia.services.locks import KeyedLockManager
+from zoi_ia.services.outbox import Outbox
+from zoi_ia.services.pipeline import PipelineStats, StageGraph, bounded_gather
+from zoi_ia.services.token_refresher import TokenRefresher, set_location_refresher
+from zoi_ia.storage import get_token_provider
 from zoi_ia.rag.index import upsert_messages
 from zoi_ia.rag.retriever import retrieve_context
 from zoi_ia.transcriber import extract_audio_urls, transcribe_from_url
@@ -34,116 +54,433 @@ from zoi_ia.vision import extract_image_urls, describe_image_from_url
 # Configurações
 # =========================
 
-PROCESSED_TAGS = set()
-PROCESSED_MESSAGES = set()
-PROCESSED_OUTBOUND_MESSAGES = set()
-AI_GENERATED_MESSAGES = set()
+# webhookIds já processados e respostas da IA aguardando o eco (com TTL)
+PROCESSED_TAGS = DedupStore("contact-tag")
+PROCESSED_MESSAGES = DedupStore("inbound")
+PROCESSED_OUTBOUND_MESSAGES = DedupStore("outbound")
+AI_GENERATED_MESSAGES = EchoTable("ai-replies")
+DEDUP_STORES = (PROCESSED_TAGS, PROCESSED_MESSAGES, PROCESSED_OUTBOUND_MESSAGES, *AI_GENERATED_MESSAGES.stores)
+ACTIVE_CONTACTS = ActiveContactRegistry()
+# Serializa eventos do mesmo contato (load -> mutate -> save, índice RAG)
+CONTACT_LOCKS = KeyedLockManager()
+metrics.register("contactLocks", CONTACT_LOCKS.snapshot)
+metrics.register("dedup", lambda: {store.name: store.snapshot() for store in DEDUP_STORES})
+metrics.register("echo", AI_GENERATED_MESSAGES.snapshot)
+LOOP_LAG = metrics.LoopLagMonitor(LOOP_LAG_INTERVAL)
+metrics.register("eventLoopLag", LOOP_LAG.snapshot)
+metrics.register("ghlRateLimit", GHL_LIMITER.snapshot)
+metrics.register("breakers", resilience.snapshot)
+metrics.register("openai", GATEWAY.snapshot)
+metrics.register("replyGeneration", REPLY_STATS.snapshot)
+metrics.register("prompt", PROMPT.snapshot)
+metrics.register("promptTokens", CONTEXT_STATS.snapshot)
+# Respostas da IA: enfileiradas no webhook, entregues em background
+OUTBOX = Outbox(send_outbound_message, on_delivered=lambda item: record_delivered_reply(item))
+metrics.register("outbox", OUTBOX.snapshot)
+# Resumo do contexto em background e tempos por estágio do inbound
+SUMMARIES = SummaryScheduler(CONTACT_LOCKS)
+metrics.register("summaries", SUMMARIES.snapshot)
+INBOUND_STATS = PipelineStats()
+metrics.register("inboundPipeline", INBOUND_STATS.snapshot)
+# Rajadas de mensagens do mesmo contato recebem uma resposta só
+DEBOUNCER = ReplyDebouncer(lambda burst: respond_to_burst(burst))
+metrics.register("inboundDebounce", DEBOUNCER.snapshot)
+# Webhooks aceitos com 202 e processados por workers (INGEST_MODE=queue)
+INGEST = IngestQueue(lambda item: process_ingested(item))
+metrics.register("ingest", INGEST.snapshot)
+
+
+async def _refresh_oauth_bundle(bundle: dict) -> dict:
+    async with http.client() as client:
+        tokens = await oauth.refresh_access_token(client, bundle, GHL_CLIENT_ID, GHL_CLIENT_SECRET)
+    return asdict(tokens)
+
+
+def _build_token_refreshers() -> list:
+    """Refreshers dos tokens de Agência e Location (exige GHL_CLIENT_ID/SECRET)."""
+    if not (GHL_CLIENT_ID and GHL_CLIENT_SECRET):
+        logging.info("GHL_CLIENT_ID/GHL_CLIENT_SECRET ausentes; tokens não serão renovados automaticamente")
+        return []
+    location = TokenRefresher(get_token_provider(), _refresh_oauth_bundle, name="location")
+    agency = TokenRefresher(get_token_provider(AGENCY_TOKEN_PATH), _refresh_oauth_bundle, name="agency")
+    set_location_refresher(location)
+    metrics.register("oauth", lambda: {r.name: r.snapshot() for r in (location, agency)})
+    return [location, agency]
+
+
+TOKEN_REFRESHERS = _build_token_refreshers()
+# Chaves públicas dos webhooks: lidas uma vez aqui
+VERIFIER = WebhookVerifier()
+metrics.register("webhookSignature", VERIFIER.snapshot)
+
+async def process_contact_tag(contact_id: str, has_tag_now: bool) -> None:
+    """Aplica a mudança de tag do contato (chamar com o lock do contato)."""
+    had_tag = contact_id in ACTIVE_CONTACTS
 
-def verify_signature(payload_bytes: bytes, signature_b64: str) -> bool:
-    if not VERIFY_SIGNATURE:
+    if has_tag_now and not had_tag:
+        ACTIVE_CONTACTS.add(contact_id)
+        msg_store = await async_storage.load_contact_messages(contact_id)
+        # garante estrutura mínima do fluxo
+        msg_store.setdefault("flow", {"current_step": "", "checklist": []})
+        conversation_id = msg_store.get("conversationId")
+        if conversation_id:
+            # busca só o que é novo desde a última sincronização (indexando no RAG)
+            await sync_into_store(contact_id, msg_store, conversation_id)
+        await update_context(msg_store, flush_all=True)
+        await async_storage.save_contact_messages(contact_id, msg_store)
+    elif not has_tag_now and had_tag:
+        ACTIVE_CONTACTS.discard(contact_id)
+        msg_store = await async_storage.load_contact_messages(contact_id)
+        await update_context(msg_store, flush_all=True)
+        # a marca d'água fica: o que veio antes dela já está no resumo
+        msg_store = {
+            "messages": [],
+            "context": msg_store.get("context", ""),
+            SYNC_KEY: msg_store.get(SYNC_KEY) or {},
+        }
+        await async_storage.save_contact_messages(contact_id, msg_store)
+
+def _event_message(event: MessageEvent, direction: str) -> dict:
+    message = {
+        "direction": direction,
+        "body": event.body,
+        "conversationId": event.conversationId,
+    }
+    # id/data do GHL: evitam duplicar a mensagem na próxima sincronização
+    if event.messageId:
+        message["id"] = event.messageId
+    if event.dateAdded:
+        message["dateAdded"] = event.dateAdded
+    return message
+
+async def describe_media(event: MessageEvent) -> str | None:
+    """Transcreve áudios e descreve imagens do evento, todos em paralelo.
+
+    No máximo `MEDIA_CONCURRENCY` downloads/chamadas ao mesmo tempo. Retorna o
+    novo corpo da mensagem (transcrições substituem o texto; descrições de
+    imagem vêm depois delas ou substituem o texto) ou None se não houve mídia
+    aproveitável.
+    """
+    payload = event.media_payload()
+    audio_urls = extract_audio_urls(payload) if TRANSCRIBE_AUDIO else []
+    image_urls = extract_image_urls(payload) if DESCRIBE_IMAGES else []
+    if LOG_WEBHOOKS:
+        logging.info("Audio URLs detectados: %s", audio_urls)
+        logging.info("Image URLs detectados: %s", image_urls)
+    if not audio_urls and not image_urls:
+        return None
+    jobs = [lambda u=url: transcribe_from_url(u) for url in audio_urls]
+    jobs += [lambda u=url: describe_image_from_url(u) for url in image_urls]
+    results = await bounded_gather(jobs, MEDIA_CONCURRENCY)
+    transcripts = [t for t in results[: len(audio_urls)] if t]
+    descriptions = [d for d in results[len(audio_urls):] if d]
+    parts = transcripts + descriptions
+    return "\n\n".join(parts) if parts else None
+
+def _find_recorded(msgs: ConversationBuffer, message_id: str | None) -> dict | None:
+    """Mensagem com este id (GHL) entre as recentes do histórico, se houver."""
+    if not message_id:
+        return None
+    return next((m for m in msgs.last(CONTEXT_MAX_TURNS) if m.get("id") == message_id), None)
+
+async def process_inbound(event: MessageEvent, source: str | None = None) -> None:
+    """Registra a mensagem recebida e gera/envia a resposta (com o lock do contato).
+
+    Roda como um grafo de estágios: a mídia é processada enquanto o histórico
+    é carregado/sincronizado; depois de registrar a mensagem, salvar e indexar
+    no RAG correm em paralelo com a busca de contexto e a geração da resposta.
+    O resumo do contexto fica para depois (`SUMMARIES`), fora do caminho da
+    resposta. Com `INBOUND_DEBOUNCE` a resposta não sai aqui: a mensagem entra
+    na rajada do contato (`DEBOUNCER`), respondida de uma vez em
+    `respond_to_burst`.
+
+    Pode rodar de novo para o mesmo evento (retentativa da fila de ingestão,
+    `source` = id do item): a mensagem já registrada não é duplicada e, se a
+    resposta desse evento já está no outbox, não é gerada outra.
+    """
+    contact_id = event.contactId
+    conversation_id = event.conversationId
+    state: dict = {}
+    graph = StageGraph("inbound", INBOUND_STATS)
+
+    async def load():
+        store = await async_storage.load_contact_messages(contact_id)
+        store.setdefault("flow", {"current_step": "", "checklist": []})
+        state["store"] = store
+
+    async def sync():
+        store = state["store"]
+        if conversation_id is not None:
+            store["conversationId"] = conversation_id
+            if not store.get("historyFetched"):
+                await sync_into_store(contact_id, store, conversation_id)
+
+    async def record():
+        store = state["store"]
+        msgs = ConversationBuffer.attach(store)
+        state["msgs"] = msgs
+        recorded = _find_recorded(msgs, event.messageId)
+        if recorded is not None:
+            state["inbound"] = recorded
+            return
+        inbound_msg = _event_message(event, "inbound")
+        media_body = graph.results.get("media")
+        if media_body:
+            inbound_msg["body"] = media_body
+        state["inbound"] = msgs.append(inbound_msg)
+
+    async def save():
+        await async_storage.save_contact_messages(contact_id, state["store"])
+        if needs_context_update(state["store"]):
+            SUMMARIES.schedule(contact_id)
+
+    async def index():
+        await upsert_messages(contact_id, [state["inbound"]])
+
+    async def retrieve():
+        return await _retrieve_extra(contact_id, state["msgs"], state["inbound"].get("body") or "")
+
+    async def debounce():
+        # grava a rajada antes de o evento de ingestão ser dado como concluído
+        await DEBOUNCER.add(contact_id, conversation_id, state["inbound"].get("body") or "", event.messageId)
+
+    async def reply():
+        if source and OUTBOX.has_source(source):
+            logging.info("Resposta do evento %s já está no outbox; não gerando outra", source)
+            return
+        extra = graph.results.get("retrieve") or None
+        text = await generate_reply(state["store"], extra_context=extra)
+        if text:
+            # marca antes de enfileirar: o eco pode chegar antes do fim do envio
+            await AI_GENERATED_MESSAGES.expect(conversation_id, text)
+            await OUTBOX.enqueue(contact_id, conversation_id, text, source=source)
+
+    graph.add("load", load)
+    graph.add("sync", sync, after=["load"])
+    graph.add("media", lambda: describe_media(event), optional=True)
+    graph.add("record", record, after=["sync", "media"])
+    graph.add("save", save, after=["record"])
+    if RAG_ENABLED:
+        graph.add("index", index, after=["record"], optional=True)
+    if contact_id in ACTIVE_CONTACTS:
+        if DEBOUNCER.enabled:
+            # a resposta sai depois da janela de silêncio, uma por rajada
+            graph.add("debounce", debounce, after=["record"])
+        elif RAG_ENABLED:
+            graph.add("retrieve", retrieve, after=["record"], optional=True)
+            graph.add("reply", reply, after=["retrieve"])
+        else:
+            graph.add("reply", reply, after=["record"])
+    await graph.run()
+
+async def _retrieve_extra(contact_id: str, msgs: ConversationBuffer, query: str) -> str:
+    # evita duplicar conteúdo que já está nas últimas mensagens
+    exclude = [m.get("body") or "" for m in msgs.last(CONTEXT_MAX_TURNS)]
+    return await retrieve_context(
+        contact_id,
+        query,
+        k=RAG_K,
+        min_sim=RAG_MIN_SIM,
+        exclude_bodies=exclude,
+    )
+
+async def respond_to_burst(burst: Burst) -> None:
+    """Gera e enfileira uma resposta para a rajada de mensagens do contato."""
+    contact_id = burst.contact_id
+    async with CONTACT_LOCKS.hold(contact_id):
+        if contact_id not in ACTIVE_CONTACTS:
+            return
+        store = await async_storage.load_contact_messages(contact_id)
+        store.setdefault("flow", {"current_step": "", "checklist": []})
+        extra = ""
+        if RAG_ENABLED:
+            try:
+                extra = await _retrieve_extra(contact_id, ConversationBuffer.attach(store), burst.text)
+            except Exception:
+                logging.exception("Falha buscando contexto RAG para %s", contact_id)
+        text = await generate_reply(store, extra_context=(extra or None))
+        if text:
+            # daqui em diante uma mensagem nova não cancela mais esta resposta
+            burst.committed = True
+            await AI_GENERATED_MESSAGES.expect(burst.conversation_id, text)
+            await OUTBOX.enqueue(contact_id, burst.conversation_id, text)
+
+async def record_delivered_reply(item: dict) -> None:
+    """Registra no histórico uma resposta entregue pelo outbox."""
+    contact_id = item["contactId"]
+    message_id = item.get("messageId")
+    # antes do lock: o eco pode estar esperando o lock para ser conferido
+    await AI_GENERATED_MESSAGES.confirm(item.get("conversationId"), item["body"], message_id)
+    async with CONTACT_LOCKS.hold(contact_id):
+        store = await async_storage.load_contact_messages(contact_id)
+        reply = {
+            "direction": "outbound",
+            "body": item["body"],
+            "conversationId": item.get("conversationId"),
+        }
+        if message_id:
+            # com o id, um eco não reconhecido não duplica a mensagem no índice
+            reply["id"] = message_id
+        reply_msg = ConversationBuffer.attach(store).append(reply)
+        await update_context(store)
+        await async_storage.save_contact_messages(contact_id, store)
+        if RAG_ENABLED:
+            await upsert_messages(contact_id, [reply_msg])
+
+async def process_outbound(event: MessageEvent) -> bool:
+    """Registra uma mensagem enviada fora do agente (com o lock do contato).
+
+    Retorna True quando o evento é o eco de uma resposta gerada pela IA. A
+    checagem acontece dentro do lock, depois que o inbound que enviou a resposta
+    terminou de registrá-la.
+    """
+    contact_id = event.contactId
+    body = event.body
+    conversation_id = event.conversationId
+
+    if await AI_GENERATED_MESSAGES.match(event.messageId, conversation_id, body):
         return True
-    try:
-        from cryptography.hazmat.primitives.serialization import load_pem_public_key
-        from cryptography.hazmat.primitives.asymmetric import padding
-        from cryptography.hazmat.primitives import hashes
-    except Exception:
-        logging.warning("biblioteca 'cryptography' não instalada; pulando verificação de assinatura")
-        return True  # aceite, mas logue
 
-    try:
-        pub = load_pem_public_key(PUBLIC_KEY_PEM)
-        sig = base64.b64decode(signature_b64)
-        pub.verify(sig, payload_bytes, padding.PKCS1v15(), hashes.SHA256())
+    store = await async_storage.load_contact_messages(contact_id)
+    store.setdefault("flow", {"current_step": "", "checklist": []})
+    if conversation_id is not None:
+        store["conversationId"] = conversation_id
+        if not store.get("historyFetched"):
+            await sync_into_store(contact_id, store, conversation_id)
+    msgs = ConversationBuffer.attach(store)
+    if _find_recorded(msgs, event.messageId) is not None:
+        # eco de uma resposta que já está no histórico (o registro do eco expirou)
         return True
-    except Exception as e:
-        logging.error("Assinatura inválida: %s", e)
-        return False
+    outbound_msg = msgs.append(_event_message(event, "outbound"))
+    await update_context(store)
+    await async_storage.save_contact_messages(contact_id, store)
+    if RAG_ENABLED:
+        await upsert_messages(contact_id, [outbound_msg])
+    return False
 
 async def handle_health(_req):
     return web.json_response({"ok": True})
 
-async def handle_list(_req):
-    store = load_store()
-    # Retorna só os IDs atualmente com a tag
-    return web.json_response(
-        {
-            "tag": TAG_NAME,
-            "count": len(store["contactIds"]),
-            "ids": store["contactIds"],
-            "lastUpdate": store["lastUpdate"],
-        }
-    )
+async def handle_metrics(_req):
+    return web.json_response(metrics.snapshot())
+
+def _admin_authorized(request: web.Request) -> bool:
+    if not ADMIN_TOKEN:
+        # sem token os endpoints /admin nem são registrados; nunca libera sem auth
+        return False
+    return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ADMIN_TOKEN}")
+
+async def handle_breakers(request: web.Request):
+    if not _admin_authorized(request):
+        return web.json_response({"error": "unauthorized"}, status=401)
+    return web.json_response(resilience.snapshot())
+
+async def handle_breaker_reset(request: web.Request):
+    # POST /admin/breakers/{name}/reset fecha o circuito; name=all fecha todos
+    if not _admin_authorized(request):
+        return web.json_response({"error": "unauthorized"}, status=401)
+    name = request.match_info["name"]
+    closed = resilience.reset(None if name == "all" else name)
+    if not closed and name != "all":
+        return web.json_response({"error": "unknown breaker"}, status=404)
+    return web.json_response({"ok": True, "reset": closed})
+
+async def handle_list(request: web.Request):
+    # Retorna só os IDs atualmente com a tag (paginado com ?offset=&limit=)
+    try:
+        offset = max(int(request.query.get("offset", "0")), 0)
+        limit = request.query.get("limit")
+        limit = max(int(limit), 0) if limit is not None else None
+    except ValueError:
+        return web.json_response({"error": "invalid pagination"}, status=400)
+    ids = ACTIVE_CONTACTS.page(offset, limit)
+    total = len(ACTIVE_CONTACTS)
+    payload = {
+        "tag": TAG_NAME,
+        "count": total,
+        "ids": ids,
+        "lastUpdate": ACTIVE_CONTACTS.last_update,
+    }
+    if limit is not None:
+        payload["offset"] = offset
+        payload["limit"] = limit
+        payload["nextOffset"] = offset + len(ids) if offset + len(ids) < total else None
+    return web.json_response(payload)
+
+async def _enqueue(dedup: DedupStore, wh_id: str | None, kind: str, contact_id: str, payload: dict) -> None:
+    """Grava o evento no journal; se falhar, libera o webhookId para a reentrega."""
+    try:
+        await INGEST.enqueue(kind, contact_id, payload)
+    except BaseException:
+        if wh_id:
+            await dedup.pop(wh_id)
+        raise
 
 async def handle_contact_tag(request: web.Request):
     raw = await request.read()
 
     # Verifica assinatura se presente
     sig = request.headers.get("x-wh-signature") or request.headers.get("X-Wh-Signature")
-    if sig and not verify_signature(raw, sig):
+    if sig and not await VERIFIER.verify_async(raw, sig):
         return web.json_response({"error": "invalid signature"}, status=401)
 
     # Converte JSON
     try:
-        event = json.loads(raw.decode("utf-8"))
-    except Exception:
+        event = codec.decode(raw, ContactTagEvent)
+    except codec.CodecError:
         return web.json_response({"error": "invalid json"}, status=400)
 
     # Idempotência (se o webhookId vier no payload)
-    wh_id = event.get("webhookId")
-    if wh_id:
-        if wh_id in PROCESSED_TAGS:
-            return web.json_response({"ok": True, "dedup": True})
-        PROCESSED_TAGS.add(wh_id)
+    wh_id = event.webhookId
+    if wh_id and await PROCESSED_TAGS.check_and_add(wh_id):
+        return web.json_response({"ok": True, "dedup": True})
 
     # Checa tipo do evento
-    if event.get("type") != "ContactTagUpdate":
+    if event.type != "ContactTagUpdate":
         return web.json_response({"ok": True, "ignored": True})
 
-    tags = event.get("tags") or []
-    contact_id = event.get("id")
+    tags = event.tags or []
+    contact_id = event.id
     if not contact_id:
         return web.json_response({"error": "missing contact id"}, status=422)
 
-    store = load_store()
-    ids = set(store.get("contactIds") or [])
-    had_tag = contact_id in ids
     has_tag_now = TAG_NAME in tags
-
-    if has_tag_now and not had_tag:
-        ids.add(contact_id)
-        store["contactIds"] = sorted(ids)
-        save_store(store)
-        msg_store = load_contact_messages(contact_id)
-        # garante estrutura mínima do fluxo
-        msg_store.setdefault("flow", {"current_step": "", "checklist": []})
-        conversation_id = msg_store.get("conversationId")
-        if conversation_id:
-            history = await fetch_conversation_messages(conversation_id)
-            msg_store["messages"] = history
-            msg_store["historyFetched"] = True
-            if RAG_ENABLED:
-                # indexa histórico inicial
-                await upsert_messages(contact_id, history)
-        await update_context(msg_store, flush_all=True)
-        save_contact_messages(contact_id, msg_store)
-    elif not has_tag_now and had_tag:
-        ids.discard(contact_id)
-        store["contactIds"] = sorted(ids)
-        save_store(store)
-        msg_store = load_contact_messages(contact_id)
-        await update_context(msg_store, flush_all=True)
-        msg_store = {"messages": [], "context": msg_store.get("context", "")}
-        save_contact_messages(contact_id, msg_store)
-    else:
-        if has_tag_now:
-            ids.add(contact_id)
-        else:
-            ids.discard(contact_id)
-        store["contactIds"] = sorted(ids)
-        save_store(store)
+    if INGEST_MODE == "queue":
+        await _enqueue(PROCESSED_TAGS, wh_id, "contact-tag", contact_id, {"present": has_tag_now})
+        return web.json_response({"ok": True, "queued": True, "present": has_tag_now}, status=202)
+    async with CONTACT_LOCKS.hold(contact_id):
+        await process_contact_tag(contact_id, has_tag_now)
 
     return web.json_response({"ok": True, "present": has_tag_now})
 
+def _may_be_active(contact_id: str) -> bool:
+    # com a fila, uma mudança de tag ainda pendente decide no worker
+    return contact_id in ACTIVE_CONTACTS or (INGEST_MODE == "queue" and INGEST.has_pending(contact_id))
+
+async def process_ingested(item: dict) -> None:
+    """Processa um evento aceito pela fila de ingestão (com o lock do contato)."""
+    kind = item["kind"]
+    contact_id = item["contactId"]
+    payload = item["payload"]
+    if kind == "inbound":
+        # antes do lock: a resposta em geração para a rajada segura o lock
+        DEBOUNCER.touch(contact_id)
+    async with CONTACT_LOCKS.hold(contact_id):
+        if kind == "contact-tag":
+            await process_contact_tag(contact_id, bool(payload.get("present")))
+            return
+        if contact_id not in ACTIVE_CONTACTS:
+            if LOG_WEBHOOKS:
+                logging.info("Ignorando %s da fila: contato %s sem tag ativa", kind, contact_id)
+            return
+        event = MessageEvent(**payload)
+        if kind == "inbound":
+            await process_inbound(event, source=item["id"])
+        elif kind == "outbound":
+            await process_outbound(event)
+        else:
+            logging.warning("Evento de tipo desconhecido na fila de ingestão: %s", kind)
+
 async def handle_inbound_message(request: web.Request):
     raw = await request.read()
     if LOG_WEBHOOKS:
@@ -153,126 +490,36 @@ async def handle_inbound_message(request: web.Request):
             logging.info("Inbound RAW: <binary %d bytes>", len(raw))
 
     sig = request.headers.get("x-wh-signature") or request.headers.get("X-Wh-Signature")
-    if sig and not verify_signature(raw, sig):
+    if sig and not await VERIFIER.verify_async(raw, sig):
         return web.json_response({"error": "invalid signature"}, status=401)
 
     try:
-        event = json.loads(raw.decode("utf-8"))
-    except Exception:
+        event = codec.decode(raw, MessageEvent)
+    except codec.CodecError:
         return web.json_response({"error": "invalid json"}, status=400)
     if LOG_WEBHOOKS:
-        logging.info("Inbound JSON: %s", json.dumps(event, ensure_ascii=False))
+        logging.info("Inbound JSON: %s", codec.dumps(event))
 
-    wh_id = event.get("webhookId")
-    if wh_id:
-        if wh_id in PROCESSED_MESSAGES:
-            return web.json_response({"ok": True, "dedup": True})
-        PROCESSED_MESSAGES.add(wh_id)
+    wh_id = event.webhookId
+    if wh_id and await PROCESSED_MESSAGES.check_and_add(wh_id):
+        return web.json_response({"ok": True, "dedup": True})
 
-    contact_id = event.get("contactId")
+    contact_id = event.contactId
     if not contact_id:
         return web.json_response({"error": "missing contact id"}, status=422)
-    body = event.get("body")
-    orig_body = body
-    conversation_id = event.get("conversationId")
 
     # Gate: só processa se o contato tiver a tag ativa
-    store_tags = load_store()
-    active_ids = set(store_tags.get("contactIds") or [])
-    if contact_id not in active_ids:
+    if not _may_be_active(contact_id):
         if LOG_WEBHOOKS:
             logging.info("Ignorando inbound: contato %s sem tag ativa", contact_id)
         return web.json_response({"ok": True, "ignored": True, "reason": "no_tag"})
 
-    store = load_contact_messages(contact_id)
-    store.setdefault("flow", {"current_step": "", "checklist": []})
-    if conversation_id is not None:
-        store["conversationId"] = conversation_id
-        if not store.get("historyFetched"):
-            history = await fetch_conversation_messages(conversation_id)
-            store["messages"] = history
-            store["historyFetched"] = True
-    msgs = store.get("messages") or []
-    msgs.insert(0, {
-        "direction": "inbound",
-        "body": body,
-        "conversationId": conversation_id,
-    })
-    # Transcrição de áudios (se habilitado) — substitui o corpo do inbound
-    if TRANSCRIBE_AUDIO:
-        audio_urls = extract_audio_urls(event)
-        if LOG_WEBHOOKS:
-            logging.info("Audio URLs detectados: %s", audio_urls)
-        transcripts: list[str] = []
-        for url in audio_urls:
-            text = await transcribe_from_url(url)
-            if text:
-                transcripts.append(text)
-        if transcripts:
-            new_body = "\n\n".join(transcripts)
-            msgs[0]["body"] = new_body
-            body = new_body
-
-    # Descrição de imagens (se habilitado) — substitui ou concatena
-    from zoi_ia.config import DESCRIBE_IMAGES  # import local para evitar ciclos
-    if DESCRIBE_IMAGES:
-        image_urls = extract_image_urls(event)
-        if LOG_WEBHOOKS:
-            logging.info("Image URLs detectados: %s", image_urls)
-        descriptions: list[str] = []
-        for url in image_urls:
-            desc = await describe_image_from_url(url)
-            if desc:
-                descriptions.append(desc)
-        if descriptions:
-            # Se já substituímos por áudio, concatena; senão, substitui
-            if body != orig_body and body:
-                combined = [body] + descriptions
-                new_body = "\n\n".join(combined)
-            else:
-                new_body = "\n\n".join(descriptions)
-            msgs[0]["body"] = new_body
-            body = new_body
-    store["messages"] = msgs
-    if len(store["messages"]) >= 30:
-        await update_context(store)
-    save_contact_messages(contact_id, store)
-    if RAG_ENABLED:
-        await upsert_messages(contact_id, [msgs[0]])
-
-    store_tags = load_store()
-    if contact_id in set(store_tags.get("contactIds") or []):
-        extra = ""
-        if RAG_ENABLED:
-            # evita duplicar conteúdo que já está nas últimas mensagens
-            last_msgs = (store.get("messages") or [])[:15]
-            exclude = [m.get("body") or "" for m in last_msgs]
-            extra = await retrieve_context(
-                contact_id,
-                body or "",
-                k=RAG_K,
-                min_sim=RAG_MIN_SIM,
-                exclude_bodies=exclude,
-            )
-        else:
-            extra = ""
-        reply = await generate_reply(store, extra_context=(extra or None))
-        if reply:
-            ok = await send_outbound_message(contact_id, conversation_id, reply)
-            if ok:
-                AI_GENERATED_MESSAGES.add((conversation_id, reply))
-                msgs = store.get("messages") or []
-                msgs.insert(0, {
-                    "direction": "outbound",
-                    "body": reply,
-                    "conversationId": conversation_id,
-                })
-                store["messages"] = msgs
-                if len(store["messages"]) >= 30:
-                    await update_context(store)
-                save_contact_messages(contact_id, store)
-                if RAG_ENABLED:
-                    await upsert_messages(contact_id, [msgs[0]])
+    if INGEST_MODE == "queue":
+        await _enqueue(PROCESSED_MESSAGES, wh_id, "inbound", contact_id, asdict(event))
+        return web.json_response({"ok": True, "queued": True}, status=202)
+    DEBOUNCER.touch(contact_id)
+    async with CONTACT_LOCKS.hold(contact_id):
+        await process_inbound(event)
 
     return web.json_response({"ok": True})
 
@@ -285,73 +532,93 @@ async def handle_outbound_message(request: web.Request):
             logging.info("Outbound RAW: <binary %d bytes>", len(raw))
 
     sig = request.headers.get("x-wh-signature") or request.headers.get("X-Wh-Signature")
-    if sig and not verify_signature(raw, sig):
+    if sig and not await VERIFIER.verify_async(raw, sig):
         return web.json_response({"error": "invalid signature"}, status=401)
 
     try:
-        event = json.loads(raw.decode("utf-8"))
-    except Exception:
+        event = codec.decode(raw, MessageEvent)
+    except codec.CodecError:
         return web.json_response({"error": "invalid json"}, status=400)
     if LOG_WEBHOOKS:
-        logging.info("Outbound JSON: %s", json.dumps(event, ensure_ascii=False))
+        logging.info("Outbound JSON: %s", codec.dumps(event))
 
-    wh_id = event.get("webhookId")
-    if wh_id:
-        if wh_id in PROCESSED_OUTBOUND_MESSAGES:
-            return web.json_response({"ok": True, "dedup": True})
-        PROCESSED_OUTBOUND_MESSAGES.add(wh_id)
+    wh_id = event.webhookId
+    if wh_id and await PROCESSED_OUTBOUND_MESSAGES.check_and_add(wh_id):
+        return web.json_response({"ok": True, "dedup": True})
 
-    contact_id = event.get("contactId")
+    contact_id = event.contactId
     if not contact_id:
         return web.json_response({"error": "missing contact id"}, status=422)
-    body = event.get("body")
-    conversation_id = event.get("conversationId")
+
     # Gate: só processa se o contato tiver a tag ativa
-    store_tags = load_store()
-    active_ids = set(store_tags.get("contactIds") or [])
-    if contact_id not in active_ids:
+    if not _may_be_active(contact_id):
         if LOG_WEBHOOKS:
             logging.info("Ignorando outbound: contato %s sem tag ativa", contact_id)
         return web.json_response({"ok": True, "ignored": True, "reason": "no_tag"})
 
-    if (conversation_id, body) in AI_GENERATED_MESSAGES:
-        AI_GENERATED_MESSAGES.discard((conversation_id, body))
+    if INGEST_MODE == "queue":
+        await _enqueue(PROCESSED_OUTBOUND_MESSAGES, wh_id, "outbound", contact_id, asdict(event))
+        return web.json_response({"ok": True, "queued": True}, status=202)
+    async with CONTACT_LOCKS.hold(contact_id):
+        echo = await process_outbound(event)
+    if echo:
         return web.json_response({"ok": True, "ignored": True})
 
-    store = load_contact_messages(contact_id)
-    store.setdefault("flow", {"current_step": "", "checklist": []})
-    if conversation_id is not None:
-        store["conversationId"] = conversation_id
-        if not store.get("historyFetched"):
-            history = await fetch_conversation_messages(conversation_id)
-            store["messages"] = history
-            store["historyFetched"] = True
-    msgs = store.get("messages") or []
-    msgs.insert(0, {
-        "direction": "outbound",
-        "body": body,
-        "conversationId": conversation_id,
-    })
-    store["messages"] = msgs
-    if len(store["messages"]) >= 30:
-        await update_context(store)
-    save_contact_messages(contact_id, store)
-    if RAG_ENABLED:
-        await upsert_messages(contact_id, [msgs[0]])
-
     return web.json_response({"ok": True})
 
+async def _on_startup(_app):
+    LOOP_LAG.start()
+    # o tiktoken baixa o vocabulário no primeiro uso; não no event loop
+    await async_storage.run_io(warm_up_tokenizer, os.getenv("OPENAI_MODEL", "gpt-5-nano"))
+    for store in DEDUP_STORES:
+        await store.start()
+    metrics.register("http", http.start().snapshot)
+    await OUTBOX.start()
+    await DEBOUNCER.start()
+    await INGEST.start()
+    for refresher in TOKEN_REFRESHERS:
+        refresher.start()
+
+async def _on_cleanup(_app):
+    await INGEST.stop()
+    await DEBOUNCER.stop()
+    # só depois dos workers: eventos de tag ainda na fila alteram o conjunto
+    ACTIVE_CONTACTS.flush()
+    await SUMMARIES.drain()
+    await OUTBOX.stop()
+    await LOOP_LAG.stop()
+    for store in DEDUP_STORES:
+        await store.stop()
+    for refresher in TOKEN_REFRESHERS:
+        await refresher.stop()
+    await GATEWAY.aclose()
+    await http.close()
+    metrics.unregister("http")
+    async_storage.shutdown()
+
 def build_app():
     app = web.Application()
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
     app.add_routes(
         [
             web.get("/healthz", handle_health),
             web.get("/contacts/ativa", handle_list),
+            web.get("/metrics", handle_metrics),
             web.post("/webhooks/contact-tag", handle_contact_tag),
             web.post("/webhooks/inbound-message", handle_inbound_message),
             web.post("/webhooks/outbound-message", handle_outbound_message),
         ]
     )
+    if ADMIN_TOKEN:
+        app.add_routes(
+            [
+                web.get("/admin/breakers", handle_breakers),
+                web.post("/admin/breakers/{name}/reset", handle_breaker_reset),
+            ]
+        )
+    else:
+        logging.info("ADMIN_TOKEN não definido; endpoints /admin desativados")
     return app
 
 def main():
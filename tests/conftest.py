@@ -0,0 +1,9 @@
+import pytest
+
+from zoi_ia import layout
+
+
+@pytest.fixture(autouse=True)
+def _isolated_contact_locks(tmp_path, monkeypatch):
+    # os saves dos testes seguram contact_write_lock, que cria arquivos em ARCHIVE_DIR
+    monkeypatch.setattr(layout, "ARCHIVE_DIR", tmp_path / "archive")
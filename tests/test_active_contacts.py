@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+
+from zoi_ia.services.active_contacts import ActiveContactRegistry
+
+
+def _read(path):
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def test_registry_loads_existing_store(tmp_path):
+    path = tmp_path / "store.json"
+    path.write_text(json.dumps({"lastUpdate": "x", "contactIds": ["b", "a"]}), encoding="utf-8")
+    reg = ActiveContactRegistry(path)
+    assert "a" in reg and "z" not in reg
+    assert reg.page() == ["a", "b"]
+    assert reg.page(1, 5) == ["b"]
+
+
+@pytest.mark.asyncio
+async def test_registry_coalesces_flushes(tmp_path):
+    path = tmp_path / "store.json"
+    reg = ActiveContactRegistry(path, flush_delay=0.05)
+    assert reg.add("c1") and reg.add("c2") and reg.discard("c1")
+    assert not reg.add("c2")
+    assert not path.exists()  # ainda dentro da janela de debounce
+    await asyncio.sleep(0.1)
+    assert _read(path)["contactIds"] == ["c2"]
+
+
+@pytest.mark.asyncio
+async def test_registry_reloads_external_changes(tmp_path):
+    path = tmp_path / "store.json"
+    reg = ActiveContactRegistry(path, flush_delay=0.05, reload_interval=0.0)
+    reg.add("c1")
+    reg.flush()
+
+    path.write_text(json.dumps({"lastUpdate": "y", "contactIds": ["c1", "ext"]}), encoding="utf-8")
+    reg.add("c3")
+    assert "ext" in reg and "c3" in reg
+    reg.flush()
+    assert _read(path)["contactIds"] == ["c1", "c3", "ext"]
+
+
+@pytest.mark.asyncio
+async def test_cleanup_flushes_tag_changes_after_ingest_stops(tmp_path, monkeypatch):
+    import tag_tracker
+    from zoi_ia.services.ingest import IngestQueue
+
+    path = tmp_path / "store.json"
+    reg = ActiveContactRegistry(path, flush_delay=60)
+    applied = asyncio.Event()
+
+    async def handler(item):
+        reg.add(item["contactId"])  # a tag foi aplicada; o resto do evento ainda roda
+        applied.set()
+        await asyncio.sleep(60)
+
+    queue = IngestQueue(handler, path=tmp_path / "journal.log")
+    monkeypatch.setattr(tag_tracker, "ACTIVE_CONTACTS", reg)
+    monkeypatch.setattr(tag_tracker, "INGEST", queue)
+    monkeypatch.setattr(tag_tracker.DEBOUNCER, "path", tmp_path / "debounce.json")
+    await queue.start()
+    await queue.enqueue("tag", "c1", {})
+    await applied.wait()
+
+    await tag_tracker._on_cleanup(None)
+    assert _read(path)["contactIds"] == ["c1"]
@@ -0,0 +1,129 @@
+import asyncio
+
+import httpx
+import pytest
+
+from zoi_ia.resilience import AdaptiveTimeout, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def _fail():
+    raise httpx.ConnectError("down")
+
+
+async def _ok():
+    return "ok"
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_fast_fails_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker("dep", timeout=1.0, failure_threshold=2, reset_timeout=10, clock=clock)
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(_fail)
+    assert breaker.state == "open"
+
+    called = []
+
+    async def tracked():
+        called.append(1)
+        return "ok"
+
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(tracked)
+    assert not called
+
+    clock.now = 10.0
+    assert breaker.state == "half_open"
+    assert await breaker.call(tracked) == "ok"
+    assert breaker.state == "closed"
+    snap = breaker.snapshot()
+    assert snap["rejected"] == 1 and snap["opened"] == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_failure_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker("dep", timeout=1.0, failure_threshold=1, reset_timeout=5, clock=clock)
+    with pytest.raises(httpx.ConnectError):
+        await breaker.call(_fail)
+    clock.now = 5.0
+    with pytest.raises(httpx.ConnectError):
+        await breaker.call(_fail)
+    assert breaker.state == "open"
+
+
+@pytest.mark.asyncio
+async def test_request_errors_do_not_open_circuit():
+    breaker = CircuitBreaker("dep", timeout=1.0, failure_threshold=1)
+    request = httpx.Request("GET", "https://example.test")
+
+    async def not_found():
+        raise httpx.HTTPStatusError("404", request=request, response=httpx.Response(404, request=request))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await breaker.call(not_found)
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_timeout_counts_as_failure():
+    breaker = CircuitBreaker("dep", timeout=0.01, failure_threshold=1)
+    with pytest.raises(asyncio.TimeoutError):
+        await breaker.call(lambda: asyncio.sleep(1))
+    assert breaker.state == "open"
+    assert breaker.snapshot()["timeouts"] == 1
+
+
+def test_adaptive_timeout_follows_p99():
+    timeout = AdaptiveTimeout(10.0, floor=0.5, multiplier=3, min_samples=5)
+    assert timeout.current() == 10.0  # sem amostras suficientes usa o teto
+    for _ in range(50):
+        timeout.observe(0.4)
+    assert timeout.current() == pytest.approx(1.2)
+    for _ in range(50):
+        timeout.observe(0.01)
+    assert timeout.current() == pytest.approx(1.2)  # p99 ainda dominado pelas lentas
+    for _ in range(200):
+        timeout.observe(0.01)
+    assert timeout.current() == 0.5
+
+
+@pytest.mark.asyncio
+async def test_large_audio_download_uses_media_ceiling(monkeypatch):
+    from types import SimpleNamespace
+
+    from zoi_ia import resilience, transcriber
+    from zoi_ia.resilience import AdaptiveTimeout
+
+    breaker = CircuitBreaker("media", timeout=1.0, failure_threshold=1)
+    breaker.timeout = AdaptiveTimeout(1.0, floor=0.01, multiplier=3, min_samples=5)
+    for _ in range(50):
+        breaker.timeout.observe(0.001)  # histórico de áudios curtos
+    assert breaker.current_timeout() == pytest.approx(0.01)
+    monkeypatch.setitem(resilience._BREAKERS, "media", breaker)
+    monkeypatch.setattr(transcriber, "MEDIA_DOWNLOAD_TIMEOUT", 1.0)
+
+    async def slow_download(url, *, max_bytes):
+        await asyncio.sleep(0.1)  # nota de voz longa
+        return b"\0" * (5 * 1024 * 1024), "audio/ogg"
+
+    async def transcribe(filebuf, **kwargs):
+        return SimpleNamespace(text=f"{len(filebuf.getvalue())} bytes")
+
+    monkeypatch.setattr(transcriber, "_download_audio", slow_download)
+    monkeypatch.setattr(
+        transcriber, "GATEWAY", SimpleNamespace(available=lambda: True, transcribe=transcribe)
+    )
+
+    assert await transcriber.transcribe_from_url("https://example.test/a.ogg") == "5242880 bytes"
+    assert breaker.state == "closed"
+    assert breaker.snapshot()["timeouts"] == 0
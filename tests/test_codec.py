@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from zoi_ia import codec
+from zoi_ia.codec import ContactTagEvent, MessageEvent
+
+
+def test_compact_output_matches_stdlib_fallback(monkeypatch):
+    obj = {"b": [1, 2.5, None, True], "a": "ação 😀", "c": {"z": 1, "y": "x"}}
+    fast = codec.dumpb(obj, sort_keys=True)
+    monkeypatch.setattr(codec, "orjson", None)
+    slow = codec.dumpb(obj, sort_keys=True)
+    assert fast == slow
+    assert codec.loads(slow) == obj
+    assert json.loads(codec.dumps(obj, pretty=True)) == obj
+
+
+def test_decode_message_event():
+    raw = json.dumps({
+        "type": "InboundMessage",
+        "contactId": "c1",
+        "conversationId": "conv",
+        "body": "oi",
+        "attachments": ["https://x/a.ogg"],
+        "locationId": "ignorado",
+    }).encode()
+    event = codec.decode(raw, MessageEvent)
+    assert event.contactId == "c1" and event.body == "oi"
+    assert event.webhookId is None
+    assert event.media_payload()["attachments"] == ["https://x/a.ogg"]
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b"{not json",
+        b"[1, 2]",
+        b'{"contactId": 123}',
+        b'{"contactId": "c1", "attachments": "x"}',
+    ],
+)
+def test_decode_rejects_invalid_payloads(raw):
+    with pytest.raises(codec.CodecError):
+        codec.decode(raw, MessageEvent)
+
+
+def test_decode_contact_tag_event():
+    event = codec.decode(b'{"type": "ContactTagUpdate", "id": "c1", "tags": ["a", "b"]}', ContactTagEvent)
+    assert event.id == "c1" and event.tags == ["a", "b"]
+    with pytest.raises(codec.CodecError):
+        codec.decode(b'{"tags": [1]}', ContactTagEvent)
@@ -0,0 +1,113 @@
+import pytest
+
+from zoi_ia.context_assembler import ContextAssembler, count_tokens, truncate_to_tokens
+
+SYSTEM = {"role": "system", "content": "Você é um vendedor. " * 20}
+FEWSHOTS = [{"role": "user", "content": "oi"}, {"role": "assistant", "content": "Olá! Como posso ajudar?"}]
+
+
+def _turns(n, size=40):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"mensagem {i} " + "x" * size}
+        for i in range(n)
+    ]
+
+
+def test_unlimited_budget_keeps_everything_in_order():
+    asm = ContextAssembler(budget=0, max_turns=15, message_max_tokens=0, snippets_max_tokens=0)
+    memory = {"role": "assistant", "content": "Memória: resumo"}
+    ctx = asm.assemble([SYSTEM, *FEWSHOTS], _turns(5), memory=memory, snippets_header="RAG:\n", snippets=["- a", "- b"])
+    contents = [m["content"] for m in ctx.messages]
+    assert ctx.messages[0] is SYSTEM and ctx.messages[1:3] == FEWSHOTS
+    assert contents[3] == "Memória: resumo"
+    assert contents[4] == "RAG:\n- a\n- b"
+    assert contents[5:] == [t["content"] for t in _turns(5)]
+    assert not ctx.dropped and not ctx.truncated
+    assert set(ctx.report()["sections"]) == {"system", "fewshots", "memory", "snippets", "latest", "turns"}
+
+
+def test_tight_budget_drops_low_priority_sections_first():
+    turns = _turns(15)
+    asm = ContextAssembler(budget=400, max_turns=15, min_turns=2, message_max_tokens=500, snippets_max_tokens=600)
+    ctx = asm.assemble([SYSTEM, *FEWSHOTS], turns, snippets_header="RAG:\n", snippets=["- " + "y" * 400] * 3)
+    assert ctx.total <= 400
+    assert ctx.messages[0] is SYSTEM
+    assert ctx.messages[-1]["content"] == turns[-1]["content"]
+    # as 2 anteriores garantidas vêm antes dos trechos e dos few-shots
+    assert ctx.tokens["turns"] > 0
+    assert ctx.dropped["snippets"] >= 1
+    assert ctx.dropped["turns"] > 0
+    kept = [m["content"] for m in ctx.messages if m in turns]
+    assert kept == [t["content"] for t in turns[-len(kept):]]  # janela contígua mais recente
+
+
+def test_long_message_is_truncated_to_cap():
+    asm = ContextAssembler(budget=0, message_max_tokens=20)
+    long_turn = {"role": "user", "content": "palavra " * 200}
+    ctx = asm.assemble([SYSTEM], [long_turn])
+    assert ctx.truncated == ["latest"]
+    assert count_tokens(ctx.messages[-1]["content"]) <= 20
+    assert ctx.messages[-1]["content"].endswith("[…]")
+
+
+def test_truncate_to_tokens_noop_when_fits():
+    assert truncate_to_tokens("curto", 10) == "curto"
+    assert truncate_to_tokens("qualquer", 0) == ""
+
+
+def test_tokenizer_download_failure_falls_back_to_heuristic(monkeypatch):
+    from zoi_ia import tokens
+
+    class OfflineTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            raise KeyError(model)
+
+        @staticmethod
+        def get_encoding(name):
+            raise OSError("sem rede para baixar o vocabulário")
+
+    monkeypatch.setattr(tokens, "tiktoken", OfflineTiktoken)
+    tokens._encoding.cache_clear()
+    tokens.count_tokens.cache_clear()
+    try:
+        assert tokens.tokenizer_name("modelo-novo") == "heuristic"
+        assert tokens.count_tokens("x" * 40, "modelo-novo") == 10
+    finally:
+        tokens._encoding.cache_clear()
+        tokens.count_tokens.cache_clear()
+
+
+@pytest.mark.asyncio
+async def test_tokenizer_warm_up_loads_vocabulary_off_the_loop(monkeypatch):
+    import threading
+    from types import SimpleNamespace
+
+    from zoi_ia import async_storage, tokens
+
+    loads = []
+
+    class FakeTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            loads.append((model, threading.current_thread().name))
+            return SimpleNamespace(name="fake", encode=lambda text, **kw: text.split())
+
+        @staticmethod
+        def get_encoding(name):
+            loads.append((None, threading.current_thread().name))
+            return SimpleNamespace(name=name, encode=lambda text, **kw: text.split())
+
+    monkeypatch.setattr(tokens, "tiktoken", FakeTiktoken)
+    tokens._encoding.cache_clear()
+    tokens.count_tokens.cache_clear()
+    try:
+        await async_storage.run_io(tokens.warm_up, "gpt-x")
+        assert [m for m, _ in loads] == ["gpt-x", None]
+        assert all(name.startswith("zoi-io") for _, name in loads)
+        assert tokens.count_tokens("duas palavras", "gpt-x") == 2
+        assert tokens.get_encoding("gpt-x").name == "fake"
+        assert len(loads) == 2  # já em cache: nada carregado no event loop
+    finally:
+        tokens._encoding.cache_clear()
+        tokens.count_tokens.cache_clear()
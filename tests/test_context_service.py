@@ -38,3 +38,22 @@ async def test_update_context_flush_all(monkeypatch):
     await update_context(store, flush_all=True)
     assert store["context"] == "SUMMARY"
     assert store["messages"] == []
+
+
+@pytest.mark.asyncio
+async def test_summaries_use_their_own_breaker(monkeypatch):
+    from types import SimpleNamespace
+
+    from zoi_ia import summarizer
+
+    calls = []
+
+    async def fake_chat(messages, **kwargs):
+        calls.append(kwargs)
+        reply = SimpleNamespace(message=SimpleNamespace(content="resumo"))
+        return SimpleNamespace(choices=[reply])
+
+    monkeypatch.setattr(summarizer.GATEWAY, "available", lambda: True)
+    monkeypatch.setattr(summarizer.GATEWAY, "chat", fake_chat)
+    assert await summarizer.summarize([{"direction": "inbound", "body": "breaker próprio"}]) == "resumo"
+    assert calls[0]["breaker"] == "openai_summary"
@@ -0,0 +1,62 @@
+import pytest
+
+from zoi_ia.conversation import ConversationBuffer
+from zoi_ia.services.context_service import update_context
+from zoi_ia import storage as storage_mod
+
+
+def _msg(i, direction="inbound"):
+    return {"direction": direction, "body": str(i)}
+
+
+def test_buffer_roundtrip_with_disk_shape():
+    on_disk = [_msg(3), _msg(2), _msg(1)]  # mais recente primeiro
+    buf = ConversationBuffer.from_newest_first(on_disk)
+    assert [m["body"] for m in buf] == ["1", "2", "3"]
+    buf.append(_msg(4, "outbound"))
+    assert buf.newest()["body"] == "4"
+    assert buf.to_newest_first() == [_msg(4, "outbound")] + on_disk
+
+
+def test_buffer_last_window_and_overflow():
+    buf = ConversationBuffer(maxlen=3)
+    for i in range(5):
+        buf.append(_msg(i, "inbound" if i % 2 else "outbound"))
+    assert [m["body"] for m in buf] == ["2", "3", "4"]
+    assert [m["body"] for m in buf.overflow] == ["0", "1"]
+    assert [m["body"] for m in buf.last(2)] == ["3", "4"]
+    assert [m["body"] for m in buf.last(5, lambda m: m["direction"] == "inbound")] == ["3"]
+    # overflow ainda não resumido continua indo para o disco
+    assert [m["body"] for m in buf.to_newest_first()] == ["4", "3", "2", "1", "0"]
+
+
+def test_attach_and_save(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_mod, "MESSAGES_DIR", tmp_path)
+    store = storage_mod.load_contact_messages("c1")
+    buf = ConversationBuffer.attach(store)
+    assert store["messages"] is buf
+    buf.append(_msg(1))
+    buf.append(_msg(2, "outbound"))
+    storage_mod.save_contact_messages("c1", store)
+    assert storage_mod.load_contact_messages("c1")["messages"] == [_msg(2, "outbound"), _msg(1)]
+
+
+@pytest.mark.asyncio
+async def test_update_context_folds_overflow(monkeypatch):
+    seen = {}
+
+    async def fake_summarize(msgs, *_, **kwargs):
+        seen["bodies"] = [m["body"] for m in msgs]
+        seen["chronological"] = kwargs.get("chronological")
+        return "SUMMARY"
+
+    monkeypatch.setattr("zoi_ia.services.context_service.summarize", fake_summarize)
+
+    store = {"messages": [], "context": "prev"}
+    buf = ConversationBuffer.attach(store, maxlen=2)
+    for i in range(4):
+        buf.append(_msg(i))
+    await update_context(store)
+    assert seen == {"bodies": ["prev", "0", "1"], "chronological": True}
+    assert store["context"] == "SUMMARY"
+    assert [m["body"] for m in buf] == ["2", "3"] and buf.overflow == []
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from zoi_ia.services.debounce import ReplyDebouncer
+
+
+@pytest.mark.asyncio
+async def test_burst_gets_a_single_reply(tmp_path):
+    replies = []
+
+    async def reply(burst):
+        replies.append(burst.text)
+
+    debouncer = ReplyDebouncer(reply, quiet=0.03, max_wait=0, path=tmp_path / "debounce.json")
+    for body in ("oi", "tudo bem?", "quero um carro"):
+        debouncer.touch("c1")
+        await debouncer.add("c1", "conv", body)
+        await asyncio.sleep(0.01)
+    await debouncer.drain()
+
+    assert replies == ["oi\ntudo bem?\nquero um carro"]
+    snap = debouncer.snapshot()
+    assert snap["messages"] == 3 and snap["generations"] == 1
+    assert snap["llmCallsSaved"] == 2 and snap["timerResets"] == 2
+
+
+@pytest.mark.asyncio
+async def test_message_during_generation_cancels_reply(tmp_path):
+    started = asyncio.Event()
+    replies = []
+
+    async def reply(burst):
+        started.set()
+        await asyncio.sleep(0.05)
+        burst.committed = True
+        replies.append(burst.text)
+
+    debouncer = ReplyDebouncer(reply, quiet=0.01, max_wait=0, path=tmp_path / "debounce.json")
+    await debouncer.add("c1", "conv", "primeira")
+    await started.wait()
+    debouncer.touch("c1")
+    await debouncer.add("c1", "conv", "segunda")
+    await debouncer.drain()
+
+    assert replies == ["primeira\nsegunda"]
+    snap = debouncer.snapshot()
+    assert snap["cancelledGenerations"] == 1 and snap["generations"] == 2
+
+
+@pytest.mark.asyncio
+async def test_committed_reply_is_not_cancelled_and_new_burst_starts(tmp_path):
+    release = asyncio.Event()
+    replies = []
+
+    async def reply(burst):
+        burst.committed = True
+        await release.wait()
+        replies.append(burst.text)
+
+    debouncer = ReplyDebouncer(reply, quiet=0.01, max_wait=0, path=tmp_path / "debounce.json")
+    await debouncer.add("c1", "conv", "primeira")
+    await asyncio.sleep(0.03)
+    debouncer.touch("c1")
+    await debouncer.add("c1", "conv", "segunda")
+    release.set()
+    await debouncer.drain()
+
+    assert replies == ["primeira", "segunda"]
+    assert debouncer.snapshot()["cancelledGenerations"] == 0
+
+
+@pytest.mark.asyncio
+async def test_max_wait_caps_the_window(tmp_path):
+    replies = []
+
+    async def reply(burst):
+        replies.append(len(burst.bodies))
+
+    debouncer = ReplyDebouncer(reply, quiet=0.05, max_wait=0.06, path=tmp_path / "debounce.json")
+    for n in range(6):
+        await debouncer.add("c1", None, str(n))
+        await asyncio.sleep(0.02)
+    await debouncer.drain()
+    # sem o teto a rajada inteira esperaria o silêncio final
+    assert len(replies) >= 2 and sum(replies) == 6
+
+
+@pytest.mark.asyncio
+async def test_pending_burst_survives_restart(tmp_path):
+    path = tmp_path / "debounce.json"
+
+    async def slow(burst):
+        await asyncio.sleep(60)
+
+    # shutdown sem tempo para responder: a rajada fica gravada
+    first = ReplyDebouncer(slow, quiet=60, max_wait=0, path=path, drain_timeout=0)
+    await first.add("c1", "conv", "oi")
+    await first.add("c1", "conv", "alguém aí?")
+    await first.stop()
+
+    replies = []
+
+    async def reply(burst):
+        burst.committed = True
+        replies.append((burst.conversation_id, burst.text))
+
+    second = ReplyDebouncer(reply, quiet=0.01, max_wait=0, path=path)
+    await second.start()
+    await second.drain()
+    assert replies == [("conv", "oi\nalguém aí?")]
+    assert second.snapshot()["restored"] == 1
+
+    third = ReplyDebouncer(reply, quiet=0.01, max_wait=0, path=path)
+    await third.start()
+    assert third.snapshot()["restored"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stop_answers_pending_bursts(tmp_path):
+    replies = []
+
+    async def reply(burst):
+        replies.append(burst.text)
+
+    debouncer = ReplyDebouncer(reply, quiet=60, max_wait=0, path=tmp_path / "debounce.json")
+    await debouncer.add("c1", "conv", "oi")
+    await asyncio.wait_for(debouncer.stop(), timeout=1)
+    assert replies == ["oi"]
@@ -0,0 +1,78 @@
+import pytest
+
+from zoi_ia.services.dedup import DedupStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _store(tmp_path, clock, **kw):
+    kw.setdefault("backend", "memory")
+    return DedupStore(
+        "t",
+        snapshot_dir=tmp_path,
+        sqlite_path=tmp_path / "dedup.sqlite3",
+        snapshot_interval=0,
+        clock=clock,
+        **kw,
+    )
+
+
+@pytest.mark.asyncio
+async def test_ttl_and_memory_ceiling(tmp_path):
+    clock = Clock()
+    store = _store(tmp_path, clock, ttl=10, max_entries=2)
+    assert await store.check_and_add("a") is False
+    assert await store.check_and_add("a") is True
+    await store.add("b")
+    await store.add("c")  # passa do teto: "a" sai
+    assert len(store) == 2 and store.snapshot()["evicted"] == 1
+    assert await store.contains("a") is False
+
+    clock.now += 11
+    assert await store.check_and_add("b") is False
+    assert await store.pop("b") is True
+    assert await store.pop("b") is False
+
+
+@pytest.mark.asyncio
+async def test_snapshot_survives_restart(tmp_path):
+    clock = Clock()
+    first = _store(tmp_path, clock, ttl=60)
+    await first.start()
+    await first.check_and_add("wh-1")
+    await first.check_and_add("wh-2")
+    await first.stop()
+
+    clock.now += 30
+    second = _store(tmp_path, clock, ttl=60)
+    await second.start()
+    assert await second.check_and_add("wh-1") is True
+
+    clock.now += 31  # passou do TTL original
+    third = _store(tmp_path, clock, ttl=60)
+    await third.start()
+    assert len(third) == 0
+    await second.stop()
+    await third.stop()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    clock = Clock()
+    a = _store(tmp_path, clock, backend="sqlite", ttl=60)
+    b = _store(tmp_path, clock, backend="sqlite", ttl=60)
+    assert await a.check_and_add("wh-1") is False
+    assert await b.check_and_add("wh-1") is True
+
+    await a.add("echo")
+    assert await b.pop("echo") is True
+    assert await a.contains("echo") is False
+
+    clock.now += 61
+    assert await b.check_and_add("wh-1") is False
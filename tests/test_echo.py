@@ -0,0 +1,36 @@
+import pytest
+
+from zoi_ia.services.echo import EchoTable
+
+
+def _table(tmp_path):
+    return EchoTable("t", backend="memory", snapshot_dir=tmp_path, snapshot_interval=0)
+
+
+@pytest.mark.asyncio
+async def test_match_by_message_id_after_confirm(tmp_path):
+    echoes = _table(tmp_path)
+    await echoes.expect("conv", "Perfeito!")
+    await echoes.confirm("conv", "Perfeito!", "msg-1")
+
+    # a mesma frase enviada depois por um atendente não é eco
+    assert await echoes.match("msg-2", "conv", "Perfeito!") is False
+    assert await echoes.match("msg-1", "conv", "Perfeito!") is True
+    assert await echoes.match("msg-1", "conv", "Perfeito!") is False
+    snap = echoes.snapshot()
+    assert snap["idHits"] == 1 and snap["bodyHits"] == 0 and snap["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_body_fallback_before_confirm_and_without_id(tmp_path):
+    echoes = _table(tmp_path)
+    # eco chegou antes da resposta do envio
+    await echoes.expect("conv", "Olá! ")
+    assert await echoes.match("msg-1", "conv", "Olá!") is True
+
+    # envio sem id: o corpo continua valendo
+    await echoes.expect("conv", "Tudo certo")
+    await echoes.confirm("conv", "Tudo certo", "")
+    assert await echoes.match(None, "conv", "Tudo certo") is True
+    snap = echoes.snapshot()
+    assert snap["bodyHits"] == 2 and snap["unconfirmedSends"] == 1
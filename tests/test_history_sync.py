@@ -0,0 +1,90 @@
+import pytest
+
+from zoi_ia.conversation import ConversationBuffer
+from zoi_ia.services import history_sync
+
+
+class FakeConversation:
+    def __init__(self, n):
+        self.messages = []  # cronológico
+        self.calls = []
+        for _ in range(n):
+            self.add()
+
+    def add(self, body=None):
+        i = len(self.messages)
+        self.messages.append({
+            "id": f"m{i}",
+            "direction": "inbound" if i % 2 else "outbound",
+            "body": body or f"msg {i}",
+            "dateAdded": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}.000Z",
+        })
+
+    async def fetch_page(self, conversation_id, *, limit, last_message_id=None):
+        self.calls.append(last_message_id)
+        newest_first = list(reversed(self.messages))
+        start = 0
+        if last_message_id:
+            start = next(i for i, m in enumerate(newest_first) if m["id"] == last_message_id) + 1
+        page = newest_first[start:start + limit]
+        cursor = page[-1]["id"] if start + limit < len(newest_first) else None
+        return [dict(m) for m in page], cursor
+
+
+@pytest.fixture
+def conv(monkeypatch):
+    fake = FakeConversation(250)
+    monkeypatch.setattr(history_sync, "fetch_messages_page", fake.fetch_page)
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_full_then_incremental_sync(conv):
+    store = {"messages": [], "context": ""}
+    pages = []
+
+    async def on_page(msgs):
+        pages.append([m["id"] for m in msgs])
+
+    recent = await history_sync.sync_conversation(store, "c", on_page=on_page, page_size=100, keep=20)
+    assert [m["id"] for m in recent] == [f"m{i}" for i in range(230, 250)]
+    assert len(pages) == 3 and sum(len(p) for p in pages) == 250
+    assert pages[0][-1] == "m249"  # cada página chega em ordem cronológica
+    assert store["sync"]["c"]["lastMessageId"] == "m249"
+
+    conv.add()
+    conv.add()
+    conv.calls.clear()
+    pages.clear()
+    recent = await history_sync.sync_conversation(store, "c", on_page=on_page, page_size=100, keep=20)
+    assert [m["id"] for m in recent] == ["m250", "m251"]
+    assert conv.calls == [None]  # uma página só
+    assert store["sync"]["c"]["lastMessageId"] == "m251"
+
+
+@pytest.mark.asyncio
+async def test_failed_sync_keeps_mark(conv, monkeypatch):
+    store = {"sync": {"c": {"lastMessageId": "m100", "dateAdded": "x"}}}
+
+    async def boom(*args, **kwargs):
+        raise RuntimeError("ghl fora")
+
+    monkeypatch.setattr(history_sync, "fetch_messages_page", boom)
+    assert await history_sync.sync_conversation(store, "c") == []
+    assert store["sync"]["c"]["lastMessageId"] == "m100"
+
+
+@pytest.mark.asyncio
+async def test_sync_into_store_skips_messages_already_recorded(conv):
+    store = {"messages": [], "context": ""}
+    await history_sync.sync_into_store("contact", store, "c", index=False)
+    buffer = ConversationBuffer.attach(store)
+    assert store["historyFetched"] is True
+    assert buffer.newest()["id"] == "m249"
+
+    # mensagem recebida via webhook antes da próxima sincronização
+    conv.add(body="nova")
+    buffer.append(dict(conv.messages[-1]))
+    conv.add(body="outra")
+    await history_sync.sync_into_store("contact", store, "c", index=False)
+    assert [m["body"] for m in buffer.last(3)] == ["msg 249", "nova", "outra"]
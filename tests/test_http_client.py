@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+import pytest
+
+from zoi_ia.clients import http
+
+
+@pytest.mark.asyncio
+async def test_registry_limits_concurrency_per_host():
+    active = {"a.test": 0, "b.test": 0}
+    peak = {"a.test": 0, "b.test": 0}
+
+    async def handler(request):
+        host = request.url.host
+        active[host] += 1
+        peak[host] = max(peak[host], active[host])
+        await asyncio.sleep(0.01)
+        active[host] -= 1
+        return httpx.Response(200, text="ok")
+
+    registry = http.HttpClientRegistry(max_per_host=2, transport=httpx.MockTransport(handler))
+    try:
+        await asyncio.gather(
+            *(registry.request("GET", f"https://a.test/{i}") for i in range(6)),
+            *(registry.request("GET", f"https://b.test/{i}") for i in range(3)),
+        )
+        async with registry.stream("GET", "https://b.test/file") as resp:
+            assert await resp.aread() == b"ok"
+    finally:
+        await registry.aclose()
+
+    assert peak == {"a.test": 2, "b.test": 2}
+    stats = registry.snapshot()["hosts"]
+    assert stats["a.test"]["requests"] == 6 and stats["a.test"]["inUse"] == 0
+    assert stats["b.test"]["requests"] == 4
+    assert stats["a.test"]["acquireWaitMaxMs"] > 0
+
+
+@pytest.mark.asyncio
+async def test_module_helpers_use_shared_client_when_started(monkeypatch):
+    transport = httpx.MockTransport(lambda request: httpx.Response(204))
+    registry = http.start(transport=transport)
+    try:
+        resp = await http.request("GET", "https://ghl.test/x")
+        assert resp.status_code == 204
+        async with http.client() as client:
+            assert client is registry.client
+    finally:
+        await http.close()
+    assert http.get_registry() is None
@@ -0,0 +1,94 @@
+import asyncio
+import copy
+
+import pytest
+
+import tag_tracker
+from zoi_ia.services.ingest import IngestQueue
+from zoi_ia.services.outbox import Outbox
+
+
+@pytest.mark.asyncio
+async def test_retried_inbound_is_recorded_and_answered_once(tmp_path, monkeypatch):
+    disk = {"messages": [], "context": "", "historyFetched": True}
+    saves = []
+
+    async def load(contact_id):
+        return copy.deepcopy(disk)
+
+    async def save(contact_id, store):
+        if not saves:
+            # falha no save depois que a resposta já foi enfileirada
+            while not outbox.has_source(item["id"]):
+                await asyncio.sleep(0.001)
+            saves.append("falhou")
+            raise OSError("disco cheio")
+        saves.append("ok")
+        disk.update(copy.deepcopy({**store, "messages": store["messages"].to_newest_first()}))
+
+    generated = []
+
+    async def generate_reply(store, extra_context=None):
+        generated.append(1)
+        return "Olá! Como posso ajudar?"
+
+    async def send(contact_id, conversation_id, body):
+        return "msg-ai"
+
+    outbox = Outbox(send, path=tmp_path / "outbox")
+    monkeypatch.setattr(tag_tracker.async_storage, "load_contact_messages", load)
+    monkeypatch.setattr(tag_tracker.async_storage, "save_contact_messages", save)
+    monkeypatch.setattr(tag_tracker, "generate_reply", generate_reply)
+    monkeypatch.setattr(tag_tracker, "OUTBOX", outbox)
+    monkeypatch.setattr(tag_tracker, "RAG_ENABLED", False)
+    monkeypatch.setattr(tag_tracker, "ACTIVE_CONTACTS", {"c1"})
+    monkeypatch.setattr(tag_tracker.DEBOUNCER, "quiet", 0)
+
+    queue = IngestQueue(tag_tracker.process_ingested, path=tmp_path / "journal.log", retry_delay=0)
+    await queue.start()
+    event = tag_tracker.MessageEvent(contactId="c1", conversationId="conv", body="oi", messageId="m1")
+    item = await queue.enqueue("inbound", "c1", tag_tracker.asdict(event))
+    await queue.drain()
+    await outbox.drain()
+    await queue.stop()
+
+    assert saves == ["falhou", "ok"] and queue.retries == 1
+    assert [m["id"] for m in disk["messages"]] == ["m1"]
+    assert len(generated) == 1 and outbox.delivered == 1
+
+
+@pytest.mark.asyncio
+async def test_redelivery_is_accepted_after_failed_journal_write(tmp_path, monkeypatch):
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+
+    from zoi_ia.services.dedup import DedupStore
+
+    queued = []
+
+    class FlakyIngest:
+        def has_pending(self, contact_id):
+            return False
+
+        async def enqueue(self, kind, contact_id, payload):
+            if not queued:
+                queued.append(None)
+                raise OSError("disco cheio")
+            queued.append(payload["webhookId"])
+
+    dedup = DedupStore("inbound", backend="memory", snapshot_dir=tmp_path, snapshot_interval=0)
+    monkeypatch.setattr(tag_tracker, "INGEST_MODE", "queue")
+    monkeypatch.setattr(tag_tracker, "INGEST", FlakyIngest())
+    monkeypatch.setattr(tag_tracker, "PROCESSED_MESSAGES", dedup)
+    monkeypatch.setattr(tag_tracker, "ACTIVE_CONTACTS", {"c1"})
+
+    app = web.Application()
+    app.router.add_post("/inbound", tag_tracker.handle_inbound_message)
+    body = {"type": "InboundMessage", "contactId": "c1", "body": "oi", "webhookId": "wh1"}
+    async with TestClient(TestServer(app)) as client:
+        first = await client.post("/inbound", json=body)
+        assert first.status == 500
+        second = await client.post("/inbound", json=body)
+        assert second.status == 202
+        assert (await second.json()).get("dedup") is None
+    assert queued == [None, "wh1"]
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from zoi_ia.services.ingest import IngestQueue
+
+
+@pytest.mark.asyncio
+async def test_events_of_a_contact_run_in_order_and_contacts_in_parallel(tmp_path):
+    seen = []
+    active = peak = 0
+
+    async def process(item):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        seen.append((item["contactId"], item["payload"]["n"]))
+        active -= 1
+
+    queue = IngestQueue(process, path=tmp_path / "journal.log", workers=4)
+    await queue.start()
+    for n in range(3):
+        for contact in ("a", "b", "c"):
+            await queue.enqueue("inbound", contact, {"n": n})
+    assert queue.has_pending("a")
+    await queue.drain()
+
+    for contact in ("a", "b", "c"):
+        assert [n for c, n in seen if c == contact] == [0, 1, 2]
+    assert peak > 1
+    snap = queue.snapshot()
+    assert snap["depth"] == 0 and snap["processed"] == 9 and not queue.has_pending("a")
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_pending_events_survive_restart(tmp_path):
+    path = tmp_path / "journal.log"
+    gate = asyncio.Event()
+
+    async def blocked(_item):
+        await gate.wait()
+
+    first = IngestQueue(blocked, path=path, workers=1)
+    await first.start()
+    await first.enqueue("inbound", "a", {"n": 1})
+    await first.enqueue("inbound", "a", {"n": 2})
+    assert first.snapshot()["depth"] == 2
+    await first.stop()
+
+    seen = []
+
+    async def process(item):
+        seen.append(item["payload"]["n"])
+
+    second = IngestQueue(process, path=path, workers=2)
+    await second.start()
+    await second.drain()
+    assert seen == [1, 2]
+    await second.stop()
+
+    # tudo concluído: nada é retomado de novo
+    third = IngestQueue(process, path=path, workers=1)
+    await third.start()
+    await third.drain()
+    assert seen == [1, 2]
+    await third.stop()
+
+
+@pytest.mark.asyncio
+async def test_failing_event_is_retried_then_dead_lettered(tmp_path):
+    path = tmp_path / "journal.log"
+    calls = []
+
+    async def process(item):
+        calls.append(item["payload"]["n"])
+        if item["payload"]["n"] == 1:
+            raise RuntimeError("boom")
+
+    queue = IngestQueue(process, path=path, workers=1, max_attempts=2, retry_delay=0)
+    await queue.start()
+    await queue.enqueue("inbound", "a", {"n": 1})
+    await queue.enqueue("inbound", "a", {"n": 2})
+    await queue.drain()
+    await queue.stop()
+
+    assert calls == [1, 1, 2]
+    snap = queue.snapshot()
+    assert snap["failed"] == 1 and snap["retries"] == 1 and snap["processed"] == 1
+    assert (tmp_path / "journal.log.failed").read_bytes().count(b"\n") == 1
+
+
+@pytest.mark.asyncio
+async def test_journal_is_compacted(tmp_path):
+    path = tmp_path / "journal.log"
+
+    async def process(_item):
+        return None
+
+    queue = IngestQueue(process, path=path, workers=1, compact_bytes=512)
+    await queue.start()
+    for n in range(20):
+        await queue.enqueue("inbound", "a", {"n": n, "body": "x" * 50})
+    await queue.drain()
+    await queue.stop()
+    assert path.stat().st_size < 512
+
+
+@pytest.mark.asyncio
+async def test_concurrent_enqueues_keep_contact_order(tmp_path):
+    seen = []
+
+    async def process(item):
+        seen.append(item["payload"]["n"])
+
+    queue = IngestQueue(process, path=tmp_path / "journal.log", workers=2)
+    await queue.start()
+    # os appends no journal terminam fora de ordem no pool de I/O
+    await asyncio.gather(*(queue.enqueue("inbound", "a", {"n": n}) for n in range(1000)))
+    await queue.drain()
+    assert seen == list(range(1000))
+    await queue.stop()
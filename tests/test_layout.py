@@ -0,0 +1,86 @@
+import json
+import os
+import time
+
+import pytest
+
+from zoi_ia import layout
+from zoi_ia import storage as storage_mod
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    messages, embeddings, archive = tmp_path / "messages", tmp_path / "embeddings", tmp_path / "archive"
+    monkeypatch.setattr(layout, "MESSAGES_DIR", messages)
+    monkeypatch.setattr(layout, "EMBEDDINGS_DIR", embeddings)
+    monkeypatch.setattr(layout, "ARCHIVE_DIR", archive)
+    monkeypatch.setattr(layout, "STORAGE_SHARD_DEPTH", 2)
+    monkeypatch.setattr(storage_mod, "MESSAGES_DIR", messages)
+    return messages, embeddings, archive
+
+
+def test_sharded_save_and_legacy_fallback(dirs):
+    messages, _, _ = dirs
+    store = storage_mod.load_contact_messages("c1")
+    store["messages"] = [{"direction": "inbound", "body": "oi"}]
+    storage_mod.save_contact_messages("c1", store)
+    sharded = layout.contact_path(messages, "c1", ".json")
+    assert sharded.exists() and sharded.parent.parent.parent == messages
+
+    # arquivo antigo no layout plano continua sendo encontrado
+    (messages / "legacy.json").write_text(json.dumps({"messages": [], "context": "velho"}), encoding="utf-8")
+    assert storage_mod.load_contact_messages("legacy")["context"] == "velho"
+
+    assert layout.rebalance() == 1
+    assert not (messages / "legacy.json").exists()
+    assert layout.contact_path(messages, "legacy", ".json").exists()
+
+
+def test_archive_and_restore_on_access(dirs):
+    messages, embeddings, _ = dirs
+    store = {"messages": [{"direction": "inbound", "body": "oi"}], "context": "ctx"}
+    storage_mod.save_contact_messages("c1", store)
+    meta = layout.contact_path(embeddings, "c1", ".meta.json")
+    meta.parent.mkdir(parents=True)
+    meta.write_text("[]", encoding="utf-8")
+
+    old = time.time() - 10 * 86400
+    for path in (layout.contact_path(messages, "c1", ".json"), meta):
+        os.utime(path, (old, old))
+    assert layout.sweep_inactive(5) == 1
+    assert layout.is_archived("c1")
+    assert not meta.exists()
+
+    # primeiro acesso restaura todos os arquivos do contato
+    assert storage_mod.load_contact_messages("c1")["context"] == "ctx"
+    assert meta.exists()
+    assert not layout.is_archived("c1")
+
+
+def test_sweep_skips_active_and_recent(dirs):
+    storage_mod.save_contact_messages("recent", {"messages": [], "context": ""})
+    assert layout.sweep_inactive(1, exclude=["recent"]) == 0
+    assert layout.sweep_inactive(0) == 0
+
+
+def test_archive_waits_for_writers_and_skips_reactivated(dirs):
+    import threading
+
+    messages, _, _ = dirs
+    storage_mod.save_contact_messages("c1", {"messages": [], "context": "antigo"})
+    path = layout.contact_path(messages, "c1", ".json")
+    old = time.time() - 10 * 86400
+    os.utime(path, (old, old))
+
+    # o servidor grava o contato enquanto a varredura roda: o arquivamento espera e desiste
+    result = []
+    with layout.contact_write_lock("c1"):
+        worker = threading.Thread(target=lambda: result.append(layout.archive_contact("c1", older_than=old + 1)))
+        worker.start()
+        worker.join(0.2)
+        assert worker.is_alive()
+        storage_mod.save_contact_messages("c1", {"messages": [], "context": "novo"})
+    worker.join()
+    assert result == [False]
+    assert not layout.is_archived("c1")
+    assert storage_mod.load_contact_messages("c1")["context"] == "novo"
@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from zoi_ia.services.locks import KeyedLockManager
+
+
+@pytest.mark.asyncio
+async def test_same_key_runs_in_order_and_other_keys_in_parallel():
+    locks = KeyedLockManager()
+    order = []
+    gate = asyncio.Event()
+
+    async def worker(key, tag, wait_gate=False):
+        async with locks.hold(key):
+            order.append(("start", tag))
+            if wait_gate:
+                await gate.wait()
+            order.append(("end", tag))
+
+    t1 = asyncio.create_task(worker("a", 1, wait_gate=True))
+    await asyncio.sleep(0)
+    t2 = asyncio.create_task(worker("a", 2))
+    t3 = asyncio.create_task(worker("b", 3))
+    await asyncio.sleep(0.01)
+    # "b" não espera "a"; o segundo evento de "a" aguarda o primeiro
+    assert ("end", 3) in order and ("start", 2) not in order
+    assert locks.depth("a") == 2
+    gate.set()
+    await asyncio.gather(t1, t2, t3)
+    a_events = [e for e in order if e[1] in (1, 2)]
+    assert a_events == [("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+
+
+@pytest.mark.asyncio
+async def test_idle_locks_are_collected_and_stats_kept():
+    locks = KeyedLockManager()
+    async with locks.hold("a"):
+        pass
+    assert locks.depth("a") == 0
+    snap = locks.snapshot()
+    assert snap["activeKeys"] == 0
+    assert snap["hot"][0]["key"] == "a" and snap["hot"][0]["events"] == 1
@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from zoi_ia.clients.openai_gateway import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_REPLY,
+    OpenAIGateway,
+    parse_model_map,
+)
+
+
+class FakeCompletions:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.order = []
+
+    async def create(self, *, model, messages, **_kw):
+        self.order.append(messages[-1]["content"])
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=500, total_tokens=1500)
+        message = SimpleNamespace(content="ok")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def _gateway(completions, **kw):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return OpenAIGateway(client_factory=lambda: client, prices={"m": (1.0, 2.0)}, **kw)
+
+
+def test_parse_model_map():
+    assert parse_model_map("a=1, b = 2,broken,c=x") == {"a": 1, "b": 2}
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_and_reply_priority():
+    completions = FakeCompletions()
+    gw = _gateway(completions, concurrency=1, model_concurrency={}, tpm=0, model_tpm={})
+
+    async def call(tag, priority):
+        await gw.chat([{"role": "user", "content": tag}], model="m", priority=priority)
+
+    first = asyncio.create_task(call("first", PRIORITY_BACKGROUND))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(call(f"bg{i}", PRIORITY_BACKGROUND)) for i in range(2)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call("reply", PRIORITY_REPLY)))
+    await asyncio.gather(first, *tasks)
+
+    assert completions.max_active == 1
+    assert completions.order == ["first", "reply", "bg0", "bg1"]
+    snap = gw.snapshot()["models"]["m"]
+    assert snap["calls"] == 4
+    assert snap["promptTokens"] == 4000 and snap["completionTokens"] == 2000
+    assert snap["costUsd"] == pytest.approx(4 * (1000 * 1.0 + 500 * 2.0) / 1_000_000)
+
+
+@pytest.mark.asyncio
+async def test_tpm_budget_delays_calls():
+    completions = FakeCompletions(delay=0)
+    # 60k tokens/min = 1000/s; cada chamada usa 1500 tokens
+    gw = _gateway(completions, concurrency=10, model_concurrency={}, tpm=60_000, model_tpm={})
+    gw._budget("m")._tokens = 0.0
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await gw.chat([{"role": "user", "content": "x"}], model="m")
+    assert loop.time() - started >= 0.2
+    assert gw.snapshot()["models"]["m"]["tpmAvailable"] < 0
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_yields_deltas_and_counts_usage():
+    def chunk(text=None, usage=None):
+        choices = [] if text is None else [SimpleNamespace(delta=SimpleNamespace(content=text))]
+        return SimpleNamespace(choices=choices, usage=usage)
+
+    class StreamCompletions:
+        async def create(self, **kwargs):
+            assert kwargs["stream"] is True
+
+            async def gen():
+                yield chunk("Oi")
+                yield chunk("!")
+                yield chunk(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2))
+
+            return gen()
+
+    gw = _gateway(StreamCompletions(), concurrency=1, model_concurrency={}, tpm=0, model_tpm={})
+    parts = [d async for d in gw.chat_stream([{"role": "user", "content": "x"}], model="m")]
+    assert parts == ["Oi", "!"]
+    snap = gw.snapshot()["models"]["m"]
+    assert snap["promptTokens"] == 10 and snap["completionTokens"] == 2 and snap["inFlight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_cancellation_is_not_an_error():
+    class SlowStream:
+        async def create(self, **_kw):
+            async def gen():
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Oi"))], usage=None)
+                await asyncio.sleep(10)
+
+            return gen()
+
+    gw = _gateway(SlowStream(), concurrency=1, model_concurrency={}, tpm=0, model_tpm={})
+    chunks = gw.chat_stream([{"role": "user", "content": "x"}], model="m")
+    assert await chunks.__anext__() == "Oi"
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(chunks.__anext__(), 0.01)  # prazo da resposta
+    await chunks.aclose()
+    snap = gw.snapshot()["models"]["m"]
+    assert snap["errors"] == 0 and snap["cancelled"] == 1 and snap["inFlight"] == 0
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from zoi_ia.services.outbox import Outbox, PermanentSendError
+
+
+@pytest.mark.asyncio
+async def test_ordered_delivery_with_retries(tmp_path):
+    sent = []
+    failures = {"b": 2}
+
+    async def send(contact_id, conversation_id, body):
+        await asyncio.sleep(0)
+        if failures.get(body):
+            failures[body] -= 1
+            return False
+        sent.append((conversation_id, body))
+        return True
+
+    delivered = []
+
+    async def on_delivered(item):
+        delivered.append(item["body"])
+
+    outbox = Outbox(send, on_delivered=on_delivered, path=tmp_path, backoff_base=0.001)
+    await outbox.start()
+    for body in ("a", "b", "c"):
+        await outbox.enqueue("contact", "conv1", body)
+    await outbox.enqueue("other", "conv2", "x")
+    await outbox.drain()
+
+    assert [b for c, b in sent if c == "conv1"] == ["a", "b", "c"]
+    assert delivered.count("x") == 1 and len(delivered) == 4
+    snap = outbox.snapshot()
+    assert snap["backlog"] == 0 and snap["delivered"] == 4 and snap["retries"] == 2
+    assert list(tmp_path.glob("*.json")) == []
+
+
+@pytest.mark.asyncio
+async def test_pending_items_resume_after_restart(tmp_path):
+    async def down(*_args):
+        return False
+
+    first = Outbox(down, path=tmp_path, backoff_base=10)
+    await first.start()
+    await first.enqueue("contact", "conv", "um")
+    await first.enqueue("contact", "conv", "dois")
+    await asyncio.sleep(0.01)
+    await first.stop()
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+    sent = []
+
+    async def up(contact_id, conversation_id, body):
+        sent.append(body)
+        return True
+
+    second = Outbox(up, path=tmp_path)
+    await second.start()
+    await second.drain()
+    assert sent == ["um", "dois"]
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_attempts(tmp_path):
+    async def send(contact_id, conversation_id, body):
+        if body == "ruim":
+            raise RuntimeError("GHL fora")
+        return True
+
+    outbox = Outbox(send, path=tmp_path, max_attempts=3, backoff_base=0.001)
+    await outbox.start()
+    await outbox.enqueue("contact", "conv", "ruim")
+    await outbox.enqueue("contact", "conv", "boa")
+    await outbox.drain()
+    assert outbox.failed == 1 and outbox.delivered == 1
+    assert len(list((tmp_path / "failed").glob("*.json"))) == 1
+
+
+@pytest.mark.asyncio
+async def test_permanent_failure_is_dead_lettered_at_once(tmp_path):
+    sent = []
+
+    async def send(contact_id, conversation_id, body):
+        if body == "recusada":
+            raise PermanentSendError("HTTP 422")
+        sent.append(body)
+        return "msg-1"
+
+    # backoff longo: se a recusa fosse retentada, a próxima resposta ficaria presa
+    outbox = Outbox(send, path=tmp_path, backoff_base=60)
+    await outbox.start()
+    await outbox.enqueue("contact", "conv", "recusada")
+    await outbox.enqueue("contact", "conv", "seguinte")
+    await asyncio.wait_for(outbox.drain(), timeout=1)
+    assert sent == ["seguinte"]
+    snap = outbox.snapshot()
+    assert snap["rejected"] == 1 and snap["retries"] == 0
+    assert len(list((tmp_path / "failed").glob("*.json"))) == 1
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from zoi_ia.services.pipeline import PipelineStats, StageGraph, bounded_gather
+
+
+@pytest.mark.asyncio
+async def test_independent_stages_overlap_and_dependents_wait():
+    events = []
+
+    def stage(name, delay):
+        async def run():
+            events.append(f"{name}:start")
+            await asyncio.sleep(delay)
+            events.append(f"{name}:end")
+            return name
+
+        return run
+
+    stats = PipelineStats()
+    graph = StageGraph("t", stats)
+    graph.add("load", stage("load", 0.02))
+    graph.add("media", stage("media", 0.02))
+    graph.add("append", stage("append", 0), after=["load", "media"])
+    run = await graph.run()
+
+    assert events[:2] == ["load:start", "media:start"]
+    assert events.index("append:start") > max(events.index("load:end"), events.index("media:end"))
+    assert graph.results == {"load": "load", "media": "media", "append": "append"}
+    # as duas etapas em paralelo: o total fica perto de uma, não da soma
+    assert run.total < 0.035
+    snap = stats.snapshot()
+    assert snap["runs"] == 1 and set(snap["stages"]) == {"load", "media", "append"}
+
+
+@pytest.mark.asyncio
+async def test_optional_failure_continues_with_none():
+    async def boom():
+        raise RuntimeError("x")
+
+    async def after():
+        return graph.results["media"]
+
+    graph = StageGraph("t")
+    graph.add("media", boom, optional=True)
+    graph.add("append", after, after=["media"])
+    run = await graph.run()
+    assert graph.results["append"] is None
+    assert run.stages["media"].ok is False
+
+
+@pytest.mark.asyncio
+async def test_required_failure_cancels_running_stages():
+    cancelled = asyncio.Event()
+
+    async def boom():
+        raise RuntimeError("x")
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def never():
+        raise AssertionError("dependente não deveria rodar")
+
+    stats = PipelineStats()
+    graph = StageGraph("t", stats)
+    graph.add("load", boom)
+    graph.add("media", slow)
+    graph.add("append", never, after=["load"])
+    with pytest.raises(RuntimeError):
+        await graph.run()
+    assert cancelled.is_set()
+    assert stats.snapshot()["failures"] == 1
+
+
+def test_unknown_dependency_rejected():
+    graph = StageGraph("t")
+    with pytest.raises(ValueError):
+        graph.add("append", lambda: None, after=["load"])
+
+
+@pytest.mark.asyncio
+async def test_bounded_gather_limits_concurrency_and_keeps_order():
+    active = peak = 0
+
+    async def job(i):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01 * (5 - i))
+        active -= 1
+        return i
+
+    results = await bounded_gather([lambda i=i: job(i) for i in range(5)], 2)
+    assert results == [0, 1, 2, 3, 4]
+    assert peak == 2
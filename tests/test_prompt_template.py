@@ -0,0 +1,44 @@
+import os
+
+from zoi_ia import ai_agent
+from zoi_ia.ai_agent import PromptTemplate
+
+
+def test_prefix_compiled_once_and_reloaded_on_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_agent, "USE_FEWSHOTS", True)
+    prompt = tmp_path / "prompt.md"
+    fewshots = tmp_path / "fewshots.json"
+    prompt.write_text("Seja breve.", encoding="utf-8")
+    fewshots.write_text('[{"role": "user", "content": "oi"}, {"role": "x"}]', encoding="utf-8")
+
+    template = PromptTemplate(prompt, fewshots)
+    first = template.prefix()
+    assert template.prefix() is first
+    assert template.compiles == 1
+    assert first[0]["role"] == "system" and first[0]["content"].endswith("Seja breve.")
+    assert first[1:] == ({"role": "user", "content": "oi"},)
+
+    prompt.write_text("Seja muito breve.", encoding="utf-8")
+    os.utime(prompt, ns=(0, prompt.stat().st_mtime_ns + 1_000_000))
+    second = template.prefix()
+    assert template.compiles == 2
+    assert second[0]["content"].endswith("Seja muito breve.")
+    assert template.fingerprint
+
+
+def test_dynamic_memory_comes_after_static_prefix(monkeypatch, tmp_path):
+    prompt = tmp_path / "prompt.md"
+    prompt.write_text("Base.", encoding="utf-8")
+    monkeypatch.setattr(ai_agent, "PROMPT", PromptTemplate(prompt, tmp_path / "none.json"))
+    store = {
+        "messages": [{"direction": "inbound", "body": "oi"}],
+        "context": "resumo",
+        "flow": {"current_step": "s1"},
+    }
+    msgs = ai_agent._build_chat_messages(store, "trecho rag")
+    contents = [m["content"] for m in msgs]
+    assert msgs[0]["role"] == "system"
+    assert contents[1].startswith("Memória (")
+    assert contents[2].startswith("Memória de processo")
+    assert contents[3].startswith("Contexto recuperado")
+    assert contents[-1] == "oi"
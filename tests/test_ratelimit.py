@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from zoi_ia.clients.ratelimit import (
+    PRIORITY_FETCH,
+    PRIORITY_SEND,
+    RateLimiter,
+    parse_retry_after,
+)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412470.0) == 10.0
+
+
+@pytest.mark.asyncio
+async def test_sends_jump_ahead_of_fetches():
+    limiter = RateLimiter(rate=50, burst=1)
+    await limiter.acquire()  # esvazia o bucket
+    order = []
+
+    async def call(tag, priority):
+        await limiter.acquire(priority)
+        order.append(tag)
+
+    tasks = [asyncio.create_task(call(f"fetch{i}", PRIORITY_FETCH)) for i in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call("send", PRIORITY_SEND)))
+    await asyncio.gather(*tasks)
+    assert order == ["send", "fetch0", "fetch1", "fetch2"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_everyone():
+    limiter = RateLimiter(rate=1000, burst=5)
+    limiter.observe(httpx.Response(429, headers={"Retry-After": "0.1"}))
+    started = time.monotonic()
+    await asyncio.gather(*(limiter.acquire() for _ in range(3)))
+    assert time.monotonic() - started >= 0.09
+    snap = limiter.snapshot()
+    assert snap["throttled"] == 1 and snap["granted"] == 3
+
+
+@pytest.mark.asyncio
+async def test_quota_headers_shrink_bucket():
+    limiter = RateLimiter(rate=1000, burst=50)
+    limiter.observe(
+        httpx.Response(200, headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Interval-Milliseconds": "100"})
+    )
+    assert limiter.snapshot()["remainingQuota"] == 0
+    started = time.monotonic()
+    await limiter.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_block_queue():
+    limiter = RateLimiter(rate=20, burst=1)
+    await limiter.acquire()
+    first = asyncio.create_task(limiter.acquire(PRIORITY_SEND))
+    second = asyncio.create_task(limiter.acquire(PRIORITY_FETCH))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.wait_for(second, 1)
+    assert limiter.snapshot()["queued"] == 0
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from zoi_ia import ai_agent
+from zoi_ia.ai_agent import ReplyStats, ReplyStream, split_sentences
+
+
+class FakeGateway:
+    def __init__(self, deltas, delay=0.0):
+        self.deltas = deltas
+        self.delay = delay
+        self.closed = False
+
+    def available(self):
+        return True
+
+    async def chat_stream(self, messages, **_kw):
+        try:
+            for delta in self.deltas:
+                await asyncio.sleep(self.delay)
+                yield delta
+        finally:
+            self.closed = True
+
+
+MESSAGES = [{"role": "user", "content": "oi"}]
+
+
+def test_split_sentences():
+    assert split_sentences("Olá! Tudo bem? Tem") == (["Olá! ", "Tudo bem? "], "Tem")
+    assert split_sentences("v1.5 custa") == ([], "v1.5 custa")
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_sentences_and_records_ttft(monkeypatch):
+    monkeypatch.setattr(ai_agent, "GATEWAY", FakeGateway(["Olá", "! Tudo", " bem?", " Posso ajudar"]))
+    stats = ReplyStats()
+    stream = ReplyStream(MESSAGES, stats=stats)
+    sentences = [s async for s in stream]
+    assert sentences == ["Olá! ", "Tudo bem? ", "Posso ajudar"]
+    assert await stream.text() == "Olá! Tudo bem? Posso ajudar"
+    assert stream.ttft is not None and not stream.truncated
+    assert stats.snapshot()["replies"] == 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_cuts_at_sentence_boundary(monkeypatch):
+    gateway = FakeGateway(["Primeira frase. ", "Segunda", " frase longa", " demais."], delay=0.05)
+    monkeypatch.setattr(ai_agent, "GATEWAY", gateway)
+    stats = ReplyStats()
+    stream = ReplyStream(MESSAGES, deadline=0.12, stats=stats)
+    assert await stream.text() == "Primeira frase."
+    assert stream.truncated and gateway.closed
+    assert stats.snapshot()["truncated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_failure_returns_empty(monkeypatch):
+    class Broken(FakeGateway):
+        async def chat_stream(self, messages, **_kw):
+            yield "Parcial. "
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(ai_agent, "GATEWAY", Broken([]))
+    stream = ReplyStream(MESSAGES, stats=ReplyStats())
+    assert await stream.text() == ""
+    assert stream.failed
+
+
+@pytest.mark.asyncio
+async def test_deadline_without_full_sentence_keeps_whole_words(monkeypatch):
+    gateway = FakeGateway(["Claro, posso", " verificar o agendam", "ento para você."], delay=0.05)
+    monkeypatch.setattr(ai_agent, "GATEWAY", gateway)
+    stream = ReplyStream(MESSAGES, deadline=0.12, stats=ReplyStats())
+    assert await stream.text() == "Claro, posso verificar o"
+    assert stream.truncated and not stream.failed
+
+
+@pytest.mark.asyncio
+async def test_deadline_without_text_is_a_failure(monkeypatch):
+    monkeypatch.setattr(ai_agent, "GATEWAY", FakeGateway(["Tarde demais."], delay=0.2))
+    stats = ReplyStats()
+    stream = ReplyStream(MESSAGES, deadline=0.05, stats=stats)
+    assert await stream.text() == ""
+    assert stream.failed and stats.snapshot()["errors"] == 1
@@ -0,0 +1,68 @@
+import base64
+
+import pytest
+
+from zoi_ia.config import PUBLIC_KEY_PEM
+from zoi_ia.signature import WebhookVerifier, split_pem_keys
+
+
+def test_split_pem_keys():
+    assert split_pem_keys(PUBLIC_KEY_PEM) == [PUBLIC_KEY_PEM.strip()]
+    assert len(split_pem_keys(PUBLIC_KEY_PEM + b"\n" + PUBLIC_KEY_PEM)) == 2
+    assert split_pem_keys(b"") == []
+
+
+def test_disabled_accepts_everything():
+    verifier = WebhookVerifier(PUBLIC_KEY_PEM, enabled=False)
+    assert verifier.verify(b"{}", "not-base64") is True
+
+
+@pytest.mark.asyncio
+async def test_rotation_and_offload():
+    pytest.importorskip("cryptography")
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+    def keypair():
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        return key, pem
+
+    old_key, old_pem = keypair()
+    new_key, new_pem = keypair()
+
+    def sign(key, payload):
+        return base64.b64encode(key.sign(payload, padding.PKCS1v15(), hashes.SHA256())).decode()
+
+    verifier = WebhookVerifier(old_pem + b"\n" + new_pem, enabled=True, offload_bytes=1024)
+    assert verifier.keys == 2
+    assert verifier.verify(b"{}", sign(old_key, b"{}"))
+    assert verifier.verify(b"{}", sign(new_key, b"{}"))
+    assert not verifier.verify(b"{}", sign(new_key, b"outro"))
+    assert not verifier.verify(b"{}", "%%%")
+
+    big = b"x" * 2048
+    assert await verifier.verify_async(big, sign(new_key, big))
+    snap = verifier.snapshot()
+    assert snap["verified"] == 3 and snap["rejected"] == 2 and snap["offloaded"] == 1
+    assert snap["keyHits"] == [1, 2] and snap["verifyP50Us"] is not None
+
+
+def test_non_rsa_keys_are_rejected_at_load():
+    pytest.importorskip("cryptography")
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    def pem(key):
+        return key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+
+    ec_pem = pem(ec.generate_private_key(ec.SECP256R1()))
+    ed_pem = pem(ed25519.Ed25519PrivateKey.generate())
+    verifier = WebhookVerifier(ec_pem + b"\n" + ed_pem, enabled=True)
+    assert verifier.keys == 0
+    # sem chave válida a assinatura é recusada (401), nunca um erro (500)
+    assert verifier.verify(b"{}", base64.b64encode(b"x" * 64).decode()) is False
@@ -61,3 +61,195 @@ def test_location_token_loading(tmp_path: Path, monkeypatch: pytest.MonkeyPatch)
     assert storage_mod.load_location_token() == "tok123"
     token, location = storage_mod.load_location_credentials()
     assert token == "tok123" and location == "loc1"
+
+
+def test_plan_message_update():
+    assert storage_mod.plan_message_update([], ["a"]) == (0, 0)
+    # append no fim
+    assert storage_mod.plan_message_update(["a", "b"], ["a", "b", "c"]) == (0, 2)
+    # resumo descartou as mais antigas e chegou mensagem nova
+    assert storage_mod.plan_message_update(["a", "b", "c"], ["c", "d"]) == (2, 1)
+    # tudo descartado
+    assert storage_mod.plan_message_update(["a", "b"], []) == (2, 0)
+    # histórico substituído
+    assert storage_mod.plan_message_update(["a", "b"], ["x", "y"]) == (2, 0)
+    assert storage_mod.plan_message_update(["a", "b"], ["b", "a"]) == (1, 1)
+    assert storage_mod.plan_message_update(["a", "b", "c"], ["a", "c"]) == (3, 0)
+
+
+def test_sqlite_contact_messages_roundtrip(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from zoi_ia.sqlite_store import SQLiteMessageStore
+
+    engine = SQLiteMessageStore(tmp_path / "zoi.sqlite3")
+    monkeypatch.setattr(storage_mod, "get_message_store", lambda backend=None: engine)
+
+    msg_store = storage_mod.load_contact_messages("c1")
+    assert msg_store["messages"] == [] and msg_store["context"] == ""
+
+    msg_store["conversationId"] = "conv1"
+    msg_store["flow"] = {"current_step": "", "checklist": []}
+    msg_store["historyFetched"] = True
+    msg_store["messages"] = [
+        {"direction": "outbound", "body": "Oi!"},
+        {"direction": "inbound", "body": "Olá", "conversationId": "conv1"},
+    ]
+    storage_mod.save_contact_messages("c1", msg_store)
+
+    loaded = storage_mod.load_contact_messages("c1")
+    assert loaded["messages"] == msg_store["messages"]
+    assert loaded["conversationId"] == "conv1"
+    assert loaded["flow"] == {"current_step": "", "checklist": []}
+    assert loaded["historyFetched"] is True
+
+    # nova mensagem + descarte da mais antiga: só a diferença vai para o banco
+    loaded["messages"] = [{"direction": "inbound", "body": "Tudo bem?"}] + loaded["messages"][:1]
+    storage_mod.save_contact_messages("c1", loaded)
+    seqs = engine._conn().execute(
+        "SELECT seq FROM messages WHERE contact_id = ? ORDER BY seq", ("c1",)
+    ).fetchall()
+    assert [s for (s,) in seqs] == [1, 2]
+    assert storage_mod.load_contact_messages("c1")["messages"] == loaded["messages"]
+
+
+def test_sqlite_migration_from_json_tree(tmp_path: Path):
+    from zoi_ia.sqlite_store import SQLiteMessageStore, migrate_json_tree
+
+    messages_dir = tmp_path / "messages"
+    messages_dir.mkdir()
+    (messages_dir / "c1.json").write_text(
+        json.dumps({"lastUpdate": "x", "messages": [{"direction": "inbound", "body": "a"}], "context": "ctx"}),
+        encoding="utf-8",
+    )
+    (messages_dir / "broken.json").write_text("{", encoding="utf-8")
+
+    db = tmp_path / "zoi.sqlite3"
+    assert migrate_json_tree(messages_dir, db) == 1
+    loaded = SQLiteMessageStore(db).load("c1")
+    assert loaded["context"] == "ctx"
+    assert loaded["messages"] == [{"direction": "inbound", "body": "a"}]
+
+
+def test_journal_appends_and_compacts(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from zoi_ia.journal_store import JournalMessageStore
+
+    engine = JournalMessageStore(tmp_path, compact_bytes=10_000)
+    monkeypatch.setattr(storage_mod, "get_message_store", lambda backend=None: engine)
+
+    msg_store = storage_mod.load_contact_messages("c1")
+    msg_store["flow"] = {"current_step": "", "checklist": []}
+    for i in range(5):
+        msg_store["messages"].insert(0, {"direction": "inbound", "body": f"m{i}"})
+        storage_mod.save_contact_messages("c1", msg_store)
+
+    log_path = tmp_path / "c1.log"
+    records = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+    appends = [r for r in records if r["op"] == "append"]
+    # cada save grava só a mensagem nova, não o histórico inteiro
+    assert [r["message"]["body"] for r in appends] == ["m0", "m1", "m2", "m3", "m4"]
+    assert not (tmp_path / "c1.json").exists()
+
+    # resumo descarta as mais antigas
+    msg_store["messages"] = msg_store["messages"][:2]
+    msg_store["context"] = "resumo"
+    storage_mod.save_contact_messages("c1", msg_store)
+
+    reloaded = JournalMessageStore(tmp_path).load("c1")
+    assert [m["body"] for m in reloaded["messages"]] == ["m4", "m3"]
+    assert reloaded["context"] == "resumo"
+    assert reloaded["flow"] == {"current_step": "", "checklist": []}
+
+    engine.compact("c1")
+    assert not log_path.exists()
+    snapshot = json.loads((tmp_path / "c1.json").read_text(encoding="utf-8"))
+    assert [m["body"] for m in snapshot["messages"]] == ["m4", "m3"]
+
+    # snapshot + log novo continuam consistentes
+    msg_store = storage_mod.load_contact_messages("c1")
+    msg_store["messages"].insert(0, {"direction": "outbound", "body": "ok"})
+    storage_mod.save_contact_messages("c1", msg_store)
+    assert [m["body"] for m in JournalMessageStore(tmp_path).load("c1")["messages"]] == ["ok", "m4", "m3"]
+
+
+def test_journal_background_compaction(tmp_path: Path):
+    from zoi_ia.journal_store import JournalMessageStore
+
+    engine = JournalMessageStore(tmp_path, compact_bytes=200)
+    store = engine.load("c1")
+    for i in range(10):
+        store["messages"].insert(0, {"direction": "inbound", "body": f"mensagem {i}"})
+        engine.save("c1", store)
+    engine.wait_compactions()
+    assert (tmp_path / "c1.json").exists()
+    assert len(engine.load("c1")["messages"]) == 10
+
+
+def test_journal_save_digests_only_the_new_tail(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from zoi_ia import journal_store
+
+    engine = journal_store.JournalMessageStore(tmp_path)
+    store = engine.load("c1")
+    store["messages"] = [{"direction": "inbound", "body": f"m{i}"} for i in reversed(range(200))]
+    engine.save("c1", store)
+
+    calls = []
+    real_digest = journal_store.message_digest
+    monkeypatch.setattr(journal_store, "message_digest", lambda m: calls.append(1) or real_digest(m))
+    store["messages"].insert(0, {"direction": "outbound", "body": "nova"})
+    engine.save("c1", store)
+    # primeira e última já gravadas + a nova, não o histórico inteiro
+    assert len(calls) == 3
+
+    # resumo descartou as mais antigas: cai na comparação completa
+    store["messages"] = store["messages"][:50]
+    engine.save("c1", store)
+    reloaded = journal_store.JournalMessageStore(tmp_path).load("c1")
+    assert [m["body"] for m in reloaded["messages"]] == [m["body"] for m in store["messages"]]
+
+
+def test_sqlite_save_digests_only_the_new_tail(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    from zoi_ia import sqlite_store
+
+    engine = sqlite_store.SQLiteMessageStore(tmp_path / "zoi.sqlite3")
+    store = engine.load("c1")
+    store["messages"] = [{"direction": "inbound", "body": f"m{i}"} for i in reversed(range(200))]
+    engine.save("c1", store)
+
+    calls = []
+    real_digest = sqlite_store.message_digest
+    monkeypatch.setattr(sqlite_store, "message_digest", lambda m: calls.append(1) or real_digest(m))
+    store["messages"].insert(0, {"direction": "outbound", "body": "nova"})
+    engine.save("c1", store)
+    # primeira e última já gravadas + a nova, não o histórico inteiro
+    assert len(calls) == 3
+    assert engine.load("c1")["messages"] == store["messages"]
+
+    # resumo descartou as mais antigas: cai na comparação completa
+    store["messages"] = store["messages"][:50]
+    engine.save("c1", store)
+    assert engine.load("c1")["messages"] == store["messages"]
+    store["messages"].insert(0, {"direction": "inbound", "body": "depois do resumo"})
+    engine.save("c1", store)
+    assert engine.load("c1")["messages"] == store["messages"]
+
+
+def test_token_provider_reloads_only_on_change(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    path = tmp_path / "location_token.json"
+    path.write_text(json.dumps({"access_token": "a", "location_id": "loc"}), encoding="utf-8")
+    provider = storage_mod.TokenProvider(path, check_interval=0)
+    assert provider.credentials() == ("a", "loc")
+
+    reads = []
+    real_loads = storage_mod.codec.loads
+    monkeypatch.setattr(storage_mod.codec, "loads", lambda raw: reads.append(1) or real_loads(raw))
+    for _ in range(5):
+        assert provider.access_token == "a"
+    assert reads == []  # arquivo não mudou
+
+    path.write_text(json.dumps({"access_token": "bb", "location_id": "loc"}), encoding="utf-8")
+    assert provider.access_token == "bb"
+    assert len(reads) == 1
+
+    provider.update({"access_token": "c", "location_id": "loc"})
+    assert provider.access_token == "c"
+    assert json.loads(path.read_text(encoding="utf-8"))["access_token"] == "c"
+    assert len(reads) == 1
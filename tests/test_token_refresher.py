@@ -0,0 +1,96 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from zoi_ia.clients import ghl_client
+from zoi_ia.services import token_refresher as refresher_mod
+from zoi_ia.services.token_refresher import TokenRefresher
+from zoi_ia.storage import TokenProvider
+
+
+def _bundle(token, refresh, expires_in):
+    expires = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    return {
+        "access_token": token,
+        "refresh_token": refresh,
+        "expires_at": expires.replace(tzinfo=None).isoformat() + "Z",
+        "location_id": "loc",
+    }
+
+
+@pytest.fixture
+def provider(tmp_path):
+    path = tmp_path / "location_token.json"
+    path.write_text(json.dumps(_bundle("old", "r1", 3600)), encoding="utf-8")
+    return TokenProvider(path, check_interval=0)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refreshes_share_one_call(provider):
+    calls = []
+
+    async def refresh(bundle):
+        calls.append(bundle["refresh_token"])
+        await asyncio.sleep(0.05)
+        return {"access_token": "new", "refresh_token": "r2", "expires_at": None}
+
+    refresher = TokenRefresher(provider, refresh, name="location")
+    tokens = await asyncio.gather(*(refresher.refresh("old") for _ in range(5)))
+    assert tokens == ["new"] * 5
+    assert calls == ["r1"]
+    on_disk = json.loads(provider.path.read_text(encoding="utf-8"))
+    # campos ausentes no retorno do refresh são preservados
+    assert on_disk["refresh_token"] == "r2" and on_disk["location_id"] == "loc"
+    assert on_disk["expires_at"]
+
+    # token "velho" já foi trocado: não renova de novo
+    assert await refresher.refresh("old") == "new"
+    assert calls == ["r1"]
+
+
+@pytest.mark.asyncio
+async def test_background_refresh_before_expiry(provider):
+    provider.update(_bundle("old", "r1", 30))
+    done = asyncio.Event()
+
+    async def refresh(bundle):
+        done.set()
+        return _bundle("fresh", "r2", 3600)
+
+    refresher = TokenRefresher(provider, refresh, name="location", margin=60, check_interval=0.01)
+    refresher.start()
+    await asyncio.wait_for(done.wait(), 1)
+    await asyncio.sleep(0.05)
+    await refresher.stop()
+    assert provider.access_token == "fresh"
+    assert refresher.snapshot()["refreshes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ghl_request_retries_once_after_401(provider, monkeypatch):
+    async def refresh(bundle):
+        return _bundle("new", "r2", 3600)
+
+    refresher_mod.set_location_refresher(TokenRefresher(provider, refresh, name="location"))
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers["Authorization"])
+        status = 200 if request.headers["Authorization"] == "Bearer new" else 401
+        return httpx.Response(status, json={})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        ghl_client.httpx, "AsyncClient", lambda **kw: real_client(transport=httpx.MockTransport(handler))
+    )
+    try:
+        resp = await ghl_client._request_with_retries(
+            "GET", "https://ghl.test/x", headers={"Authorization": "Bearer old"}
+        )
+    finally:
+        refresher_mod.set_location_refresher(None)
+    assert resp.status_code == 200
+    assert seen == ["Bearer old", "Bearer new"]
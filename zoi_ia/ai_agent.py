@@ -8,24 +8,27 @@ Este módulo combina:
 - As últimas mensagens da conversa, limitadas a uma janela curta.
 
 Nada aqui persiste estado; a função pública `generate_reply` recebe um `store`
-imutável (dict) e retorna apenas a resposta textual do modelo.
+imutável (dict) e retorna apenas a resposta textual do modelo. `stream_reply`
+expõe a mesma resposta em streaming, frase a frase.
 """
 
+import asyncio
+import hashlib
 import logging
 import os
+import re
+from collections import deque
 from pathlib import Path
-import json
-
-try:  # pragma: no cover - openai é opcional
-    from openai import AsyncOpenAI
-except Exception:  # pragma: no cover
-    AsyncOpenAI = None
-
 
 # prompt.md fica na raiz do projeto; este arquivo está em zoi_ia/
 _PROMPT_PATH = Path(__file__).resolve().parent.parent / "prompt.md"
 
 
+from . import codec
+from .clients.openai_gateway import GATEWAY, PRIORITY_REPLY
+from .context_assembler import AssembledContext, ContextAssembler, ContextStats
+from .conversation import ConversationBuffer
+from .resilience import CircuitOpenError
 from .config import (
     BRAND_NAME,
     VOICE_TONE,
@@ -35,10 +38,12 @@ from .config import (
     OUTPUT_STYLE,
     USE_FEWSHOTS,
     PROMPT_FEWSHOTS_PATH,
+    REPLY_DEADLINE,
+    REPLY_STREAMING,
 )
 
 
-def _system_prompt() -> str:
+def _system_prompt(path: Path = _PROMPT_PATH) -> str:
     """Monta o conteúdo do papel "system".
 
     Lê o arquivo `prompt.md` (na raiz do projeto) e o prefixa com um cabeçalho
@@ -46,7 +51,7 @@ def _system_prompt() -> str:
     fallback simples para evitar falhas em ambientes mínimos.
     """
     try:
-        base = _PROMPT_PATH.read_text(encoding="utf-8").strip()
+        base = path.read_text(encoding="utf-8").strip()
         header = (
             "Parâmetros do atendimento (não compartilhar com o cliente):\n"
             f"- Marca: {BRAND_NAME}\n"
@@ -63,7 +68,7 @@ def _system_prompt() -> str:
         return "Você é um assistente que responde de forma educada."
 
 
-def _fewshots() -> list[dict]:
+def _fewshots(path: Path = PROMPT_FEWSHOTS_PATH) -> list[dict]:
     """Carrega exemplos de comportamento (few‑shots) do arquivo configurado.
 
     Espera um JSON em lista com objetos {"role", "content"}. Em caso de erro,
@@ -72,8 +77,7 @@ def _fewshots() -> list[dict]:
     if not USE_FEWSHOTS:
         return []
     try:
-        raw = PROMPT_FEWSHOTS_PATH.read_text(encoding="utf-8")
-        data = json.loads(raw)
+        data = codec.loads(path.read_bytes())
         if isinstance(data, list):
             msgs: list[dict] = []
             for item in data:
@@ -86,86 +90,332 @@ def _fewshots() -> list[dict]:
     return []
 
 
-async def generate_reply(store: dict, extra_context: str | None = None) -> str:
-    """Gera uma resposta usando janela curta de conversa + memórias.
+def _file_signature(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
 
-    Regras principais:
-    - Usa no máximo as 15 mensagens recentes do histórico do `store`.
-    - Faz o mapeamento: inbound -> role="user"; outbound -> role="assistant".
-    - Injeta, antes da conversa, o papel "system" (template + cabeçalho),
-      seguida de few‑shots (se habilitados), memória resumida (se houver) e
-      `extra_context` (se fornecido via RAG).
 
-    Args:
-        store: Estrutura volátil da conversa (mensagens, context, flow, ...).
-        extra_context: Contexto externo (ex.: trechos recuperados via RAG) a
-            ser injetado como nota de sistema para orientar a resposta.
+class PromptTemplate:
+    """Prefixo estático do prompt (system + cabeçalho + few‑shots), pré-compilado.
 
-    Returns:
-        Texto com a resposta do modelo, ou string vazia em caso de falha.
+    Os arquivos são lidos uma vez; a cada resposta só o `stat` é conferido e o
+    prefixo é recompilado quando o mtime/tamanho de `prompt.md` ou do JSON de
+    few‑shots muda. O prefixo é uma tupla idêntica entre respostas, o que
+    mantém o início do prompt estável para o cache de prompt do provedor.
+    """
+
+    def __init__(self, prompt_path: Path = _PROMPT_PATH, fewshots_path: Path = PROMPT_FEWSHOTS_PATH) -> None:
+        self.prompt_path = Path(prompt_path)
+        self.fewshots_path = Path(fewshots_path)
+        self._signature: tuple | None = None
+        self._prefix: tuple[dict, ...] = ()
+        self.fingerprint = ""
+        self.compiles = 0
+
+    def _current_signature(self) -> tuple:
+        fewshots = _file_signature(self.fewshots_path) if USE_FEWSHOTS else None
+        return _file_signature(self.prompt_path), fewshots
+
+    def prefix(self) -> tuple[dict, ...]:
+        """Mensagens estáticas do início do prompt (não mutar)."""
+        signature = self._current_signature()
+        if signature != self._signature:
+            messages = [{"role": "system", "content": _system_prompt(self.prompt_path)}]
+            messages.extend(_fewshots(self.fewshots_path))
+            self._prefix = tuple(messages)
+            self.fingerprint = hashlib.sha256(codec.dumpb(messages)).hexdigest()[:16]
+            self._signature = signature
+            self.compiles += 1
+            logging.info("Prompt compilado (%d mensagens fixas, %s)", len(messages), self.fingerprint)
+        return self._prefix
+
+    def snapshot(self) -> dict:
+        return {"compiles": self.compiles, "prefixMessages": len(self._prefix), "fingerprint": self.fingerprint}
+
+
+PROMPT = PromptTemplate()
+ASSEMBLER = ContextAssembler()
+CONTEXT_STATS = ContextStats()
+
+
+def assemble_context(store: dict, extra_context: str | None = None, *, model: str | None = None) -> AssembledContext | None:
+    """Monta as mensagens do chat dentro do orçamento de tokens; None quando
+    não há o que responder.
+
+    Regras principais:
+    - Considera até `CONTEXT_MAX_TURNS` mensagens recentes do histórico.
+    - Faz o mapeamento: inbound -> role="user"; outbound -> role="assistant".
+    - Começa pelo prefixo fixo (`PROMPT`: "system" + few‑shots) e só depois
+      o que muda: memória resumida, memória de processo, `extra_context` (RAG,
+      muda a cada mensagem) e a conversa, para o cache de prompt do provedor
+      aproveitar o maior início comum possível.
+    - O que entra (e o quanto de cada seção) é decidido pelo `ASSEMBLER`
+      conforme `CONTEXT_TOKEN_BUDGET`; o detalhamento fica no retorno.
     """
     context = store.get("context") or ""
-    raw_messages = store.get("messages") or []
+    history = ConversationBuffer.coerce(store.get("messages"))
 
-    convo: list[dict] = []
-    for m in raw_messages:
-        # Mantém apenas mensagens do usuário/assistente e descarta metadados.
-        if m.get("direction") in {"inbound", "outbound"}:
-            convo.append(m)
-        # Limita a janela a 15 itens começando pelos mais recentes do array.
-        if len(convo) >= 15:
-            break
+    # Mensagens do usuário/assistente, já na ordem cronológica que o modelo espera.
+    convo = history.last(ASSEMBLER.max_turns, lambda m: m.get("direction") in {"inbound", "outbound"})
 
     if not convo:
-        return ""
+        return None
 
     has_inbound = any(m.get("direction") == "inbound" for m in convo)
     if not has_inbound:
-        return ""
+        return None
 
-    if AsyncOpenAI is None:
-        return ""
-
-    chat_messages = [
-        {"role": "system", "content": _system_prompt()},
-    ]
-    # Insere exemplos (few‑shots) antes da conversa real, se existirem.
-    chat_messages.extend(_fewshots())
+    memory = None
     if context:
-        chat_messages.append({
+        memory = {
             "role": "assistant",
             "content": f"Memória (não compartilhar com o cliente):\n{context}",
-        })
-    if extra_context:
-        chat_messages.append({
-            "role": "assistant",
-            "content": f"Contexto recuperado (não compartilhar com o cliente):\n{extra_context}",
-        })
+        }
 
+    flow_msg = None
     flow = store.get("flow") or {}
     if isinstance(flow, dict) and (flow.get("current_step") or flow.get("checklist")):
-        import json as _json
-        chat_messages.append({
+        flow_msg = {
             "role": "assistant",
             "content": (
                 "Memória de processo (não compartilhar com o cliente):\n"
-                + _json.dumps(flow, ensure_ascii=False)
+                + codec.dumps(flow, sort_keys=True)
             ),
-        })
+        }
 
-    # O modelo espera ordem cronológica: do mais antigo para o mais recente.
-    for m in reversed(convo):
+    turns = []
+    for m in convo:
         role = "user" if m.get("direction") == "inbound" else "assistant"
         body = m.get("body") or ""
-        chat_messages.append({"role": role, "content": str(body)})
+        turns.append({"role": role, "content": str(body)})
+
+    ctx = ASSEMBLER.assemble(
+        PROMPT.prefix(),
+        turns,
+        memory=memory,
+        flow=flow_msg,
+        snippets_header="Contexto recuperado (não compartilhar com o cliente):\n",
+        snippets=[line for line in (extra_context or "").splitlines() if line.strip()],
+        model=model or os.getenv("OPENAI_MODEL", "gpt-5-nano"),
+    )
+    CONTEXT_STATS.record(ctx)
+    logging.debug("Tokens do prompt: %s", ctx.report())
+    return ctx
+
+
+def _build_chat_messages(store: dict, extra_context: str | None = None) -> list[dict] | None:
+    ctx = assemble_context(store, extra_context)
+    return ctx.messages if ctx is not None else None
+
+
+# Fim de frase: pontuação final seguida de espaço, ou quebra de linha
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+|\n+")
+
 
+# palavra possivelmente incompleta no fim do texto (sem espaço depois)
+_TRAILING_WORD = re.compile(r"\S+$")
+
+
+def split_sentences(text: str) -> tuple[list[str], str]:
+    """Separa as frases completas de `text` do resto ainda incompleto."""
+    sentences: list[str] = []
+    pos = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentences.append(text[pos:match.end()])
+        pos = match.end()
+    return sentences, text[pos:]
+
+
+class ReplyStats:
+    """Tempo até o primeiro token (TTFT) e tempo total das respostas."""
+
+    def __init__(self, window: int = 500) -> None:
+        self.ttft: deque[float] = deque(maxlen=window)
+        self.total: deque[float] = deque(maxlen=window)
+        self.replies = 0
+        self.truncated = 0
+        self.errors = 0
+
+    def snapshot(self) -> dict:
+        def pct(values: deque, p: float) -> float | None:
+            if not values:
+                return None
+            ordered = sorted(values)
+            return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+        return {
+            "replies": self.replies,
+            "truncated": self.truncated,
+            "errors": self.errors,
+            "ttftP50Ms": pct(self.ttft, 0.50),
+            "ttftP99Ms": pct(self.ttft, 0.99),
+            "totalP50Ms": pct(self.total, 0.50),
+            "totalP99Ms": pct(self.total, 0.99),
+        }
+
+
+REPLY_STATS = ReplyStats()
+
+
+class ReplyStream:
+    """Resposta da IA em streaming, entregue frase a frase.
+
+    Iterar (`async for frase in stream`) devolve cada frase assim que ela se
+    completa, para o chamador começar o pós-processamento cedo; `text()`
+    consome o que falta e retorna a resposta inteira. Com `deadline` (s), a
+    geração para no prazo e a resposta termina na última frase completa (ou,
+    se nenhuma frase completou, na última palavra completa). Em caso de falha
+    — inclusive prazo estourado sem nenhum texto — `text()` retorna string
+    vazia e `failed` fica True.
+    """
+
+    def __init__(
+        self,
+        messages: list[dict] | None,
+        *,
+        deadline: float | None = None,
+        model: str | None = None,
+        stats: ReplyStats = REPLY_STATS,
+    ) -> None:
+        self._messages = messages
+        self._deadline = deadline if deadline and deadline > 0 else None
+        self._model = model or os.getenv("OPENAI_MODEL", "gpt-5-nano")
+        self._stats = stats
+        self._parts: list[str] = []
+        self._iter = None
+        self.ttft: float | None = None
+        self.elapsed: float | None = None
+        self.truncated = False
+        self.failed = False
+        # detalhamento de tokens do prompt (ver `assemble_context`)
+        self.context: AssembledContext | None = None
+
+    def __aiter__(self):
+        if self._iter is None:
+            self._iter = self._sentences()
+        return self._iter
+
+    async def _sentences(self):
+        if not self._messages:
+            return
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        limit = started + self._deadline if self._deadline else None
+        pending = ""
+        chunks = GATEWAY.chat_stream(self._messages, model=self._model, priority=PRIORITY_REPLY)
+        try:
+            while True:
+                timeout = None if limit is None else limit - loop.time()
+                if timeout is not None and timeout <= 0:
+                    raise asyncio.TimeoutError
+                try:
+                    delta = await asyncio.wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                if self.ttft is None:
+                    self.ttft = loop.time() - started
+                sentences, pending = split_sentences(pending + delta)
+                for sentence in sentences:
+                    self._parts.append(sentence)
+                    yield sentence
+            if pending:
+                self._parts.append(pending)
+                yield pending
+        except asyncio.TimeoutError:
+            # prazo estourado: descarta a frase incompleta
+            self.truncated = True
+            self._stats.truncated += 1
+            logging.warning("Prazo de %.1fs da resposta atingido; cortando na última frase.", self._deadline)
+            if not self._parts:
+                # nenhuma frase completa: corta na última palavra inteira
+                partial = _TRAILING_WORD.sub("", pending).strip()
+                if partial:
+                    self._parts.append(partial)
+                    yield partial
+                else:
+                    self.failed = True
+                    self._stats.errors += 1
+                    logging.error("Prazo de %.1fs esgotado sem texto aproveitável; sem resposta.", self._deadline)
+        except CircuitOpenError as exc:
+            self.failed = True
+            logging.warning("Resposta da IA suspensa: %s", exc)
+        except Exception as exc:
+            self.failed = True
+            self._stats.errors += 1
+            logging.exception("Falha gerando resposta: %s", exc)
+        finally:
+            await chunks.aclose()
+            self.elapsed = loop.time() - started
+            if not self.failed:
+                self._stats.replies += 1
+                if self.ttft is not None:
+                    self._stats.ttft.append(self.ttft)
+                self._stats.total.append(self.elapsed)
+
+    async def text(self) -> str:
+        # consome o que ainda falta (inclusive depois de uma iteração parcial)
+        async for _ in self:
+            pass
+        if self.failed:
+            return ""
+        return "".join(self._parts).strip()
+
+
+def stream_reply(
+    store: dict,
+    extra_context: str | None = None,
+    *,
+    deadline: float | None = REPLY_DEADLINE,
+) -> ReplyStream:
+    """Resposta em streaming (ver `ReplyStream`); vazia se não há o que responder."""
+    if not GATEWAY.available():
+        return ReplyStream(None, deadline=deadline)
+    ctx = assemble_context(store, extra_context)
+    stream = ReplyStream(ctx.messages if ctx else None, deadline=deadline)
+    stream.context = ctx
+    return stream
+
+
+async def generate_reply(
+    store: dict,
+    extra_context: str | None = None,
+    *,
+    deadline: float | None = REPLY_DEADLINE,
+) -> str:
+    """Gera uma resposta usando janela curta de conversa + memórias.
+
+    Com `REPLY_STREAMING` (padrão) consome a resposta em streaming e retorna
+    assim que ela termina (ou no `deadline`, cortada na última frase
+    completa); as regras de montagem estão em `_build_chat_messages`.
+
+    Args:
+        store: Estrutura volátil da conversa (mensagens, context, flow, ...).
+        extra_context: Contexto externo (ex.: trechos recuperados via RAG) a
+            ser injetado como nota de sistema para orientar a resposta.
+        deadline: Prazo (s) para gerar a resposta; None/0 = sem prazo.
+
+    Returns:
+        Texto com a resposta do modelo, ou string vazia em caso de falha.
+    """
+    if REPLY_STREAMING:
+        return await stream_reply(store, extra_context, deadline=deadline).text()
+
+    chat_messages = _build_chat_messages(store, extra_context)
+    if not chat_messages or not GATEWAY.available():
+        return ""
     try:
-        client = AsyncOpenAI()
-        resp = await client.chat.completions.create(
+        resp = await GATEWAY.chat(
+            chat_messages,
             model=os.getenv("OPENAI_MODEL", "gpt-5-nano"),
-            messages=chat_messages,
+            priority=PRIORITY_REPLY,
         )
         return resp.choices[0].message.content.strip()
+    except CircuitOpenError as exc:
+        logging.warning("Resposta da IA suspensa: %s", exc)
+        return ""
     except Exception as exc:  # pragma: no cover
         logging.exception("Falha gerando resposta: %s", exc)
         return ""
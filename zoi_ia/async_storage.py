@@ -0,0 +1,50 @@
+"""Fachada assíncrona do `storage` para uso dentro do event loop.
+
+As funções de `zoi_ia.storage` (e o I/O do índice RAG) fazem leitura/escrita
+de arquivos e serialização JSON de forma síncrona. Aqui elas rodam em um pool
+de threads limitado (`STORAGE_IO_WORKERS`), para que o save de um contato com
+histórico grande não trave os demais webhooks.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from . import storage
+from .config import STORAGE_IO_WORKERS
+
+T = TypeVar("T")
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=STORAGE_IO_WORKERS, thread_name_prefix="zoi-io")
+    return _EXECUTOR
+
+
+async def run_io(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Executa `fn` bloqueante no pool de I/O."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown() -> None:
+    global _EXECUTOR
+    if _EXECUTOR is not None:
+        _EXECUTOR.shutdown(wait=True)
+        _EXECUTOR = None
+
+
+async def load_contact_messages(contact_id: str) -> Dict[str, Any]:
+    return await run_io(storage.load_contact_messages, contact_id)
+
+
+async def save_contact_messages(contact_id: str, store: Dict[str, Any]) -> None:
+    # O chamador segura o lock do contato, então `store` não muda durante o save.
+    await run_io(storage.save_contact_messages, contact_id, store)
@@ -1,7 +1,7 @@
 import asyncio
 import logging
 import random
-from typing import List, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 
@@ -9,33 +9,90 @@ from ..config import (
     GHL_API_URL,
     GHL_MESSAGES_LIST_VERSION,
     GHL_MESSAGES_WRITE_VERSION,
-    HTTP_TIMEOUT,
     HTTP_MAX_RETRIES,
     HTTP_BACKOFF_BASE,
 )
+from . import http
+from .ratelimit import GHL_LIMITER, PRIORITY_FETCH, PRIORITY_SEND
+from ..resilience import CircuitOpenError, get_breaker
+from ..services.token_refresher import refresh_location_token
 from ..storage import load_location_token, load_location_credentials
 
 
+class PermanentSendError(RuntimeError):
+    """Envio que não adianta repetir (requisição recusada, sem credenciais)."""
+
+
 def _should_retry(exc: Exception) -> bool:
     if isinstance(exc, httpx.HTTPStatusError):
         code = exc.response.status_code
         return code in {429, 500, 502, 503, 504}
-    return isinstance(exc, httpx.RequestError)
+    return isinstance(exc, (httpx.RequestError, asyncio.TimeoutError))
+
+
+def _is_rejected(exc: Exception) -> bool:
+    """4xx que não muda se a mesma requisição for repetida."""
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return False
+    code = exc.response.status_code
+    # 401 pode passar com o token renovado pelo refresher; 408/429 são temporários
+    return 400 <= code < 500 and code not in {401, 408, 429}
 
 
-async def _request_with_retries(method: str, url: str, **kwargs):
+def _is_rate_limited(exc: Exception) -> bool:
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429
+
+
+async def _renew_auth(exc: Exception, headers: Dict[str, str]) -> bool:
+    """Em um 401, renova o token (uma vez, compartilhado) e atualiza ``headers``."""
+    if not isinstance(exc, httpx.HTTPStatusError) or exc.response.status_code != 401:
+        return False
+    auth = headers.get("Authorization") or ""
+    if not auth.startswith("Bearer "):
+        return False
+    stale = auth[len("Bearer "):]
+    token = await refresh_location_token(stale)
+    if not token or token == stale:
+        return False
+    headers["Authorization"] = f"Bearer {token}"
+    logging.info("Token da Location renovado após 401; repetindo a requisição.")
+    return True
+
+
+async def _request_with_retries(method: str, url: str, *, priority: int = PRIORITY_FETCH, **kwargs):
     last_exc: Exception | None = None
-    for attempt in range(HTTP_MAX_RETRIES):
+    headers = kwargs.get("headers")
+    renewed = False
+    attempt = 0
+    breaker = get_breaker("ghl")
+
+    async def send():
+        resp = await http.request(method, url, timeout=breaker.current_timeout(), **kwargs)
+        GHL_LIMITER.observe(resp)
+        resp.raise_for_status()
+        return resp
+
+    while attempt < HTTP_MAX_RETRIES:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.request(method, url, timeout=HTTP_TIMEOUT, **kwargs)
-                resp.raise_for_status()
-                return resp
+            await GHL_LIMITER.acquire(priority)
+            # timeout adaptativo só na requisição (fora a espera do limiter)
+            return await breaker.call(send)
+        except CircuitOpenError:
+            # dependência fora: falha já, sem retentativas
+            raise
         except Exception as exc:  # noqa: BLE001
             last_exc = exc
+            if not renewed and headers is not None and await _renew_auth(exc, headers):
+                # repete já com o token novo, sem backoff e sem gastar tentativa
+                renewed = True
+                continue
             if not _should_retry(exc) or attempt == HTTP_MAX_RETRIES - 1:
                 break
-            backoff = HTTP_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, 0.1)
+            if _is_rate_limited(exc) and GHL_LIMITER.enabled:
+                # o limiter já pausa todos até o Retry-After
+                backoff = 0.0
+            else:
+                backoff = HTTP_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, 0.1)
             logging.warning(
                 "HTTP %s %s falhou (%s). Retentativa %d em %.2fs.",
                 method,
@@ -45,49 +102,90 @@ async def _request_with_retries(method: str, url: str, **kwargs):
                 backoff,
             )
             await asyncio.sleep(backoff)
+            attempt += 1
     raise last_exc  # type: ignore[misc]
 
 
-async def fetch_conversation_messages(conversation_id: str, limit: int = 30) -> List[Dict]:
+def _normalize_message(item: Dict) -> Dict:
+    body = item.get("body") or item.get("text") or ""
+    direction = item.get("direction") or item.get("messageDirection")
+    direction = "outbound" if direction == "outbound" else "inbound"
+    message = {"direction": direction, "body": body}
+    for key in ("id", "dateAdded"):
+        if item.get(key):
+            message[key] = item[key]
+    return message
+
+
+async def fetch_messages_page(
+    conversation_id: str,
+    *,
+    limit: int = 100,
+    last_message_id: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Uma página do histórico, da mais recente para a mais antiga.
+
+    Retorna as mensagens e o cursor (``lastMessageId``) da página seguinte, ou
+    None quando não há mais páginas. Erros HTTP são propagados.
+    """
     token = load_location_token()
     if not token:
-        return []
-    url = f"{GHL_API_URL}/conversations/{conversation_id}/messages?limit={limit}"
+        return [], None
+    url = f"{GHL_API_URL}/conversations/{conversation_id}/messages"
     headers = {
         "Authorization": f"Bearer {token}",
         "Accept": "application/json",
         "Version": GHL_MESSAGES_LIST_VERSION,
     }
-    try:
-        resp = await _request_with_retries("GET", url, headers=headers)
-        payload = resp.json()
-    except Exception:
-        logging.exception("Falha buscando mensagens da conversa %s", conversation_id)
-        return []
+    params: Dict[str, Any] = {"limit": limit}
+    if last_message_id:
+        params["lastMessageId"] = last_message_id
+    resp = await _request_with_retries("GET", url, headers=headers, params=params)
+    payload = resp.json()
 
-    raw_messages = payload.get("messages", [])
-    if isinstance(raw_messages, dict):
-        raw_messages = raw_messages.get("messages", [])
+    container = payload.get("messages", [])
+    raw_messages = container
+    cursor: Optional[str] = None
+    if isinstance(container, dict):
+        raw_messages = container.get("messages", [])
+        if container.get("nextPage"):
+            cursor = container.get("lastMessageId")
     if not isinstance(raw_messages, list):
         logging.warning("Formato inesperado de mensagens: %r", raw_messages)
-        return []
+        return [], None
 
     messages: List[Dict] = []
-    for item in reversed(raw_messages):
+    for item in raw_messages:
         if not isinstance(item, dict):
             logging.warning("Mensagem inesperada no payload: %r", item)
             continue
-        body = item.get("body") or item.get("text") or ""
-        direction = item.get("direction") or item.get("messageDirection")
-        direction = "outbound" if direction == "outbound" else "inbound"
-        messages.append({"direction": direction, "body": body})
-    return messages
+        messages.append(_normalize_message(item))
+    if cursor is None and not isinstance(container, dict) and len(raw_messages) >= limit and messages:
+        # formato sem nextPage: segue pelo id da mais antiga da página
+        cursor = messages[-1].get("id")
+    return messages, cursor
 
 
-async def send_outbound_message(contact_id: str, conversation_id: str, body: str) -> bool:
+async def fetch_conversation_messages(conversation_id: str, limit: int = 30) -> List[Dict]:
+    """Últimas ``limit`` mensagens da conversa, da mais antiga para a mais recente."""
+    try:
+        messages, _ = await fetch_messages_page(conversation_id, limit=limit)
+    except Exception:
+        logging.exception("Falha buscando mensagens da conversa %s", conversation_id)
+        return []
+    return list(reversed(messages))
+
+
+async def send_outbound_message(contact_id: str, conversation_id: str, body: str) -> Optional[str]:
+    """Envia `body` ao contato; retorna o id da mensagem criada no GHL.
+
+    None em caso de falha temporária; "" quando o envio deu certo mas a
+    resposta não trouxe o id. Levanta :class:`PermanentSendError` quando
+    repetir não adianta (sem credenciais, 4xx do GHL).
+    """
     token, location_id = load_location_credentials()
     if not token or not contact_id or not location_id:
-        return False
+        raise PermanentSendError("credenciais da Location ou contactId ausentes")
     url = f"{GHL_API_URL}/conversations/messages"
     headers = {
         "Authorization": f"Bearer {token}",
@@ -104,11 +202,19 @@ async def send_outbound_message(contact_id: str, conversation_id: str, body: str
     if conversation_id:
         payload["conversationId"] = conversation_id
     try:
-        await _request_with_retries("POST", url, headers=headers, json=payload)
-        return True
-    except httpx.HTTPStatusError as exc:  # pragma: no cover
+        resp = await _request_with_retries("POST", url, priority=PRIORITY_SEND, headers=headers, json=payload)
+    except httpx.HTTPStatusError as exc:
         logging.error("Erro HTTP %s: %s", exc.response.status_code, exc.response.text)
+        if _is_rejected(exc):
+            raise PermanentSendError(f"HTTP {exc.response.status_code}") from exc
+        return None
     except Exception:  # pragma: no cover
         logging.exception("Falha enviando mensagem para %s", contact_id)
-    return False
+        return None
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {}
+    message_id = data.get("messageId") if isinstance(data, dict) else None
+    return str(message_id or "")
 
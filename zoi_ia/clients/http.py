@@ -0,0 +1,191 @@
+"""Cliente HTTP compartilhado pelo processo (GHL, downloads de áudio/imagem).
+
+O servidor cria o registro no startup (`start`) e o fecha no shutdown
+(`close`). Enquanto ele existe, todas as chamadas reutilizam o mesmo
+``httpx.AsyncClient`` (keep-alive, HTTP/2 quando o pacote ``h2`` estiver
+instalado) e cada host tem no máximo ``HTTP_MAX_PER_HOST`` requisições
+simultâneas. Fora do servidor (scripts, testes) cada chamada usa um cliente
+efêmero, como antes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..config import (
+    HTTP2,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_PER_HOST,
+    HTTP_TIMEOUT,
+)
+
+try:  # HTTP/2 exige o extra httpx[http2]
+    import h2  # type: ignore  # noqa: F401
+
+    _H2_AVAILABLE = True
+except Exception:  # pragma: no cover
+    _H2_AVAILABLE = False
+
+
+class _HostSlot:
+    """Limite de concorrência e estatísticas de um host."""
+
+    def __init__(self, limit: int) -> None:
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_use = 0
+        self.requests = 0
+        self.errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        avg = self.wait_total / self.requests if self.requests else 0.0
+        return {
+            "inUse": self.in_use,
+            "requests": self.requests,
+            "errors": self.errors,
+            "acquireWaitAvgMs": round(avg * 1000, 2),
+            "acquireWaitMaxMs": round(self.wait_max * 1000, 2),
+        }
+
+
+class HttpClientRegistry:
+    def __init__(
+        self,
+        *,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_per_host: int = HTTP_MAX_PER_HOST,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.max_per_host = max_per_host
+        self.http2 = http2 and _H2_AVAILABLE
+        if http2 and not _H2_AVAILABLE:
+            logging.info("Pacote 'h2' não instalado; usando HTTP/1.1 com keep-alive")
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            transport=transport,
+        )
+        self._hosts: Dict[str, _HostSlot] = {}
+
+    def _slot(self, url: str) -> _HostSlot:
+        host = urlsplit(url).netloc.lower()
+        slot = self._hosts.get(host)
+        if slot is None:
+            slot = self._hosts[host] = _HostSlot(self.max_per_host)
+        return slot
+
+    @asynccontextmanager
+    async def _acquire(self, url: str) -> AsyncIterator[_HostSlot]:
+        slot = self._slot(url)
+        started = time.perf_counter()
+        async with slot.semaphore:
+            waited = time.perf_counter() - started
+            slot.requests += 1
+            slot.wait_total += waited
+            slot.wait_max = max(slot.wait_max, waited)
+            slot.in_use += 1
+            try:
+                yield slot
+            except Exception:
+                slot.errors += 1
+                raise
+            finally:
+                slot.in_use -= 1
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        async with self._acquire(url):
+            return await self.client.request(method, url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        async with self._acquire(url):
+            async with self.client.stream(method, url, **kwargs) as resp:
+                yield resp
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def _pool_snapshot(self) -> Dict[str, Any]:
+        # httpcore não expõe o pool publicamente; best-effort.
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        conns = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for c in conns if getattr(c, "is_idle", lambda: False)())
+        return {"connections": len(conns), "idle": idle, "active": len(conns) - idle}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "http2": self.http2,
+            "pool": self._pool_snapshot(),
+            "hosts": {host: slot.snapshot() for host, slot in self._hosts.items()},
+        }
+
+
+_REGISTRY: Optional[HttpClientRegistry] = None
+
+
+def get_registry() -> Optional[HttpClientRegistry]:
+    return _REGISTRY
+
+
+def start(**kwargs: Any) -> HttpClientRegistry:
+    """Cria o registro do processo (chamar no startup do servidor)."""
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = HttpClientRegistry(**kwargs)
+    return _REGISTRY
+
+
+async def close() -> None:
+    global _REGISTRY
+    if _REGISTRY is not None:
+        registry, _REGISTRY = _REGISTRY, None
+        await registry.aclose()
+
+
+async def request(method: str, url: str, **kwargs: Any) -> httpx.Response:
+    """Requisição pelo cliente compartilhado (ou por um efêmero, sem registro)."""
+    registry = _REGISTRY
+    if registry is not None:
+        return await registry.request(method, url, **kwargs)
+    async with httpx.AsyncClient() as client:
+        return await client.request(method, url, **kwargs)
+
+
+@asynccontextmanager
+async def stream(method: str, url: str, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+    """Como `request`, mas sem ler o corpo (para downloads com limite de tamanho)."""
+    registry = _REGISTRY
+    if registry is not None:
+        async with registry.stream(method, url, **kwargs) as resp:
+            yield resp
+        return
+    async with httpx.AsyncClient() as client:
+        async with client.stream(method, url, **kwargs) as resp:
+            yield resp
+
+
+@asynccontextmanager
+async def client() -> AsyncIterator[httpx.AsyncClient]:
+    """O ``httpx.AsyncClient`` compartilhado, para APIs que recebem um cliente."""
+    registry = _REGISTRY
+    if registry is not None:
+        yield registry.client
+        return
+    async with httpx.AsyncClient() as ephemeral:
+        yield ephemeral
@@ -0,0 +1,426 @@
+"""Gateway único para a API da OpenAI.
+
+Um ``AsyncOpenAI`` de vida longa (pool de conexões reaproveitado) atende chat,
+embeddings, visão e transcrição. Por modelo, o gateway limita as chamadas
+simultâneas (``OPENAI_MAX_CONCURRENCY`` / ``OPENAI_MODEL_CONCURRENCY``) e os
+tokens por minuto (``OPENAI_TPM_LIMIT`` / ``OPENAI_MODEL_TPM``). A fila é por
+prioridade: respostas ao cliente passam na frente de mídia, que passa na frente
+de resumos e embeddings em background. Cada chamada registra latência, tokens
+e custo estimado (``GET /metrics`` → ``openai``).
+
+O circuit breaker da dependência (``zoi_ia.resilience``) envolve só a chamada
+à API; a espera na fila não conta para o timeout adaptativo.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+try:
+    from openai import AsyncOpenAI
+except Exception:  # pragma: no cover
+    AsyncOpenAI = None  # type: ignore
+
+from ..config import (
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_MAX_RETRIES,
+    OPENAI_MODEL_CONCURRENCY,
+    OPENAI_MODEL_TPM,
+    OPENAI_PRICING,
+    OPENAI_TIMEOUT,
+    OPENAI_TPM_LIMIT,
+)
+from ..resilience import OPEN, get_breaker
+from ..tokens import count_tokens
+
+PRIORITY_REPLY = 0
+PRIORITY_MEDIA = 1
+PRIORITY_BACKGROUND = 2
+
+# Reserva de tokens de saída por chamada de chat, até saber o uso real
+COMPLETION_RESERVE = 256
+
+# USD por 1M tokens (entrada, saída); OPENAI_PRICING sobrescreve/complementa
+_DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+
+def parse_model_map(raw: str, convert: Callable[[str], Any] = int) -> Dict[str, Any]:
+    """Lê ``"modelo=valor,modelo=valor"``; entradas inválidas são ignoradas."""
+    out: Dict[str, Any] = {}
+    for part in (raw or "").split(","):
+        model, sep, value = part.partition("=")
+        if not sep or not model.strip():
+            continue
+        try:
+            out[model.strip()] = convert(value.strip())
+        except ValueError:
+            logging.warning("Valor inválido para o modelo %s: %r", model.strip(), value)
+    return out
+
+
+def _parse_price(value: str) -> Tuple[float, float]:
+    inp, _, out = value.partition("/")
+    return float(inp), float(out or 0)
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokens de `text` (tokenizador local quando disponível)."""
+    return count_tokens(text or "") + 1
+
+
+def estimate_chat_tokens(messages: List[Dict[str, Any]]) -> int:
+    total = 0
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, list):  # partes multimodais
+            content = " ".join(str(p.get("text") or "") for p in content if isinstance(p, dict))
+        total += estimate_tokens(str(content or "")) + 4
+    return total
+
+
+class _ModelBudget:
+    """Concorrência + token bucket (TPM) de um modelo, com fila por prioridade."""
+
+    def __init__(self, concurrency: int, tpm: int, clock: Callable[[], float]) -> None:
+        self.concurrency = max(concurrency, 1)
+        self.tpm = tpm
+        self._clock = clock
+        self._tokens = float(tpm)
+        self._updated = clock()
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        self.in_flight = 0
+        # métricas
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.latencies: Deque[float] = deque(maxlen=500)
+
+    def _refill(self, now: float) -> None:
+        if self.tpm > 0:
+            self._tokens = min(float(self.tpm), self._tokens + (now - self._updated) * self.tpm / 60)
+        self._updated = now
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _delay(self, need: float) -> Optional[float]:
+        """0 quando pode entrar; None = esperar uma vaga; >0 = esperar tokens."""
+        if self.in_flight >= self.concurrency:
+            return None
+        if self.tpm > 0 and self._tokens < need:
+            return (need - self._tokens) * 60 / self.tpm
+        return 0.0
+
+    async def acquire(self, priority: int, tokens: int) -> float:
+        # pedidos maiores que o bucket esperam só até ele encher
+        need = float(min(tokens, self.tpm)) if self.tpm > 0 else 0.0
+        key = (priority, next(self._seq))
+        heapq.heappush(self._waiters, key)
+        started = self._clock()
+        try:
+            while True:
+                now = self._clock()
+                self._refill(now)
+                timeout: Optional[float] = None
+                if self._waiters[0] == key:
+                    timeout = self._delay(need)
+                    if timeout == 0:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= need
+                        self.in_flight += 1
+                        break
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if key in self._waiters:
+                self._waiters.remove(key)
+                heapq.heapify(self._waiters)
+            raise
+        finally:
+            self._notify()
+        waited = self._clock() - started
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return need
+
+    def release(self, reserved: float, used: Optional[int]) -> None:
+        self.in_flight -= 1
+        if self.tpm > 0 and used is not None:
+            # acerta o bucket pelo uso real informado pela API
+            self._tokens = min(float(self.tpm), self._tokens + reserved - used)
+        self._notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refill(self._clock())
+        samples = sorted(self.latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(int(p * len(samples)), len(samples) - 1)] * 1000, 2)
+
+        return {
+            "inFlight": self.in_flight,
+            "queued": len(self._waiters),
+            "concurrency": self.concurrency,
+            "tpm": self.tpm or None,
+            "tpmAvailable": round(self._tokens) if self.tpm > 0 else None,
+            "calls": self.calls,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "latencyP50Ms": pct(0.50),
+            "latencyP99Ms": pct(0.99),
+            "queueWaitAvgMs": round(self.wait_total / self.calls * 1000, 2) if self.calls else 0.0,
+            "queueWaitMaxMs": round(self.wait_max * 1000, 2),
+            "promptTokens": self.prompt_tokens,
+            "completionTokens": self.completion_tokens,
+            "costUsd": round(self.cost, 6),
+        }
+
+
+def _usage(usage: Any) -> Tuple[Optional[int], Optional[int]]:
+    if usage is None:
+        return None, None
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if prompt is None:
+        prompt = getattr(usage, "total_tokens", None)
+    return prompt, completion or 0
+
+
+class OpenAIGateway:
+    def __init__(
+        self,
+        *,
+        client_factory: Optional[Callable[[], Any]] = None,
+        concurrency: int = OPENAI_MAX_CONCURRENCY,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        tpm: int = OPENAI_TPM_LIMIT,
+        model_tpm: Optional[Dict[str, int]] = None,
+        prices: Optional[Dict[str, Tuple[float, float]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._client_factory = client_factory
+        self._client: Any = None
+        self.concurrency = concurrency
+        self.model_concurrency = (
+            parse_model_map(OPENAI_MODEL_CONCURRENCY) if model_concurrency is None else model_concurrency
+        )
+        self.tpm = tpm
+        self.model_tpm = parse_model_map(OPENAI_MODEL_TPM) if model_tpm is None else model_tpm
+        if prices is None:
+            prices = {**_DEFAULT_PRICES, **parse_model_map(OPENAI_PRICING, _parse_price)}
+        self.prices = prices
+        self._clock = clock
+        self._budgets: Dict[str, _ModelBudget] = {}
+
+    def available(self) -> bool:
+        """True quando há cliente configurado (SDK instalado e chave presente)."""
+        if self._client_factory is not None or self._client is not None:
+            return True
+        return AsyncOpenAI is not None and bool(os.getenv("OPENAI_API_KEY"))
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            if self._client_factory is not None:
+                self._client = self._client_factory()
+            else:
+                if AsyncOpenAI is None:
+                    raise RuntimeError("pacote openai não instalado")
+                self._client = AsyncOpenAI(timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+        return self._client
+
+    def _budget(self, model: str) -> _ModelBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            budget = self._budgets[model] = _ModelBudget(
+                self.model_concurrency.get(model, self.concurrency),
+                self.model_tpm.get(model, self.tpm),
+                self._clock,
+            )
+        return budget
+
+    def _cost(self, model: str, prompt: int, completion: int) -> float:
+        inp, out = self.prices.get(model, (0.0, 0.0))
+        return (prompt * inp + completion * out) / 1_000_000
+
+    async def _admit(self, model: str, priority: int, tokens: int, breaker_name: str):
+        breaker = get_breaker(breaker_name)
+        if breaker.enabled and breaker.state == OPEN:
+            breaker.allow()  # falha já, sem entrar na fila
+        budget = self._budget(model)
+        reserved = await budget.acquire(priority, tokens)
+        budget.calls += 1
+        return breaker, budget, reserved
+
+    def _account(self, model: str, budget: _ModelBudget, usage: Any) -> Optional[int]:
+        """Soma tokens/custo de ``usage``; retorna o total usado (ou None)."""
+        prompt, completion = _usage(usage)
+        if prompt is None:
+            return None
+        budget.prompt_tokens += prompt
+        budget.completion_tokens += completion or 0
+        budget.cost += self._cost(model, prompt, completion or 0)
+        return prompt + (completion or 0)
+
+    async def _run(
+        self,
+        model: str,
+        priority: int,
+        tokens: int,
+        breaker_name: str,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        breaker, budget, reserved = await self._admit(model, priority, tokens, breaker_name)
+        used: Optional[int] = None
+        started = self._clock()
+        try:
+            resp = await breaker.call(fn, timeout=timeout)
+        except BaseException:
+            budget.errors += 1
+            raise
+        else:
+            budget.latencies.append(self._clock() - started)
+            used = self._account(model, budget, getattr(resp, "usage", None))
+            return resp
+        finally:
+            budget.release(reserved, used)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        *,
+        model: str,
+        priority: int = PRIORITY_REPLY,
+        breaker: str = "openai_chat",
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Any:
+        tokens = estimate_chat_tokens(messages) + COMPLETION_RESERVE
+        return await self._run(
+            model,
+            priority,
+            tokens,
+            breaker,
+            lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs),
+            timeout,
+        )
+
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        *,
+        model: str,
+        priority: int = PRIORITY_REPLY,
+        breaker: str = "openai_chat",
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """Chat em streaming: gera os trechos de texto à medida que chegam.
+
+        O timeout do breaker vale até o início da resposta; a vaga do modelo
+        fica ocupada até o stream terminar (ou o consumidor fechar o gerador).
+        """
+        tokens = estimate_chat_tokens(messages) + COMPLETION_RESERVE
+        breaker_, budget, reserved = await self._admit(model, priority, tokens, breaker)
+        used: Optional[int] = None
+        started = self._clock()
+        stream: Any = None
+        try:
+            stream = await breaker_.call(
+                lambda: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **kwargs,
+                )
+            )
+            async for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    used = self._account(model, budget, chunk.usage)
+                for choice in getattr(chunk, "choices", None) or []:
+                    delta = getattr(getattr(choice, "delta", None), "content", None)
+                    if delta:
+                        yield delta
+            budget.latencies.append(self._clock() - started)
+        except (asyncio.CancelledError, GeneratorExit):
+            # o consumidor desistiu (prazo da resposta, shutdown): não é erro da API
+            budget.cancelled += 1
+            raise
+        except BaseException:
+            budget.errors += 1
+            raise
+        finally:
+            budget.release(reserved, used)
+            close = getattr(stream, "close", None)
+            if close is not None:
+                # libera a conexão se o consumidor parou antes do fim
+                try:
+                    await close()
+                except Exception:
+                    logging.debug("Falha fechando o stream da OpenAI", exc_info=True)
+
+    async def embed(self, texts: List[str], *, model: str, priority: int = PRIORITY_BACKGROUND) -> Any:
+        tokens = sum(estimate_tokens(t) for t in texts)
+        return await self._run(
+            model,
+            priority,
+            tokens,
+            "embeddings",
+            lambda: self.client.embeddings.create(model=model, input=texts),
+        )
+
+    async def transcribe(self, file: Any, *, model: str, priority: int = PRIORITY_MEDIA) -> Any:
+        return await self._run(
+            model,
+            priority,
+            0,
+            "whisper",
+            lambda: self.client.audio.transcriptions.create(model=model, file=file),
+        )
+
+    async def aclose(self) -> None:
+        client, self._client = self._client, None
+        close = getattr(client, "close", None)
+        if close is not None:
+            try:
+                await close()
+            except Exception:
+                logging.exception("Falha fechando o cliente da OpenAI")
+
+    def snapshot(self) -> Dict[str, Any]:
+        models = {name: b.snapshot() for name, b in sorted(self._budgets.items())}
+        return {
+            "clientOpen": self._client is not None,
+            "costUsd": round(sum(b.cost for b in self._budgets.values()), 6),
+            "models": models,
+        }
+
+
+GATEWAY = OpenAIGateway()
@@ -0,0 +1,171 @@
+"""Agendador de requisições ao GHL respeitando o rate limit da Location.
+
+Um token bucket (``GHL_RATE_LIMIT`` req/s, rajada de ``GHL_RATE_BURST``)
+espaça as requisições; a fila é por prioridade, então o envio de respostas
+passa na frente da busca de histórico. Cada resposta ajusta o bucket pelos
+headers do GHL (``X-RateLimit-Remaining`` / ``X-RateLimit-Interval-Milliseconds``)
+e um 429 pausa todas as requisições até o ``Retry-After``, em vez de cada uma
+fazer o próprio backoff exponencial ao mesmo tempo.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from ..config import GHL_RATE_BURST, GHL_RATE_LIMIT
+
+PRIORITY_SEND = 0
+PRIORITY_FETCH = 1
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Segundos de espera de um header ``Retry-After`` (número ou data HTTP)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(when.timestamp() - now, 0.0)
+
+
+def _int_header(headers: httpx.Headers, name: str) -> Optional[int]:
+    raw = headers.get(name)
+    try:
+        return int(raw) if raw is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rate: float = GHL_RATE_LIMIT,
+        burst: int = GHL_RATE_BURST,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._clock = clock
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._waiters: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        # métricas
+        self.granted = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.remaining: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _delay(self, now: float) -> float:
+        delay = self._blocked_until - now
+        if self._tokens < 1:
+            delay = max(delay, (1 - self._tokens) / self.rate)
+        return delay
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self, priority: int = PRIORITY_FETCH) -> None:
+        """Espera a vez (por prioridade, menor primeiro) e consome um token."""
+        if not self.enabled:
+            return
+        key = (priority, next(self._seq))
+        heapq.heappush(self._waiters, key)
+        started = self._clock()
+        try:
+            while True:
+                now = self._clock()
+                self._refill(now)
+                timeout: Optional[float] = None
+                if self._waiters[0] == key:
+                    timeout = self._delay(now)
+                    if timeout <= 0:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        break
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if key in self._waiters:
+                self._waiters.remove(key)
+                heapq.heapify(self._waiters)
+            raise
+        finally:
+            self._notify()
+        waited = self._clock() - started
+        self.granted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def observe(self, resp: httpx.Response) -> None:
+        """Ajusta o bucket pela resposta (headers de quota e 429)."""
+        if not self.enabled:
+            return
+        now = self._clock()
+        self._refill(now)
+        headers = resp.headers
+        remaining = _int_header(headers, "X-RateLimit-Remaining")
+        interval_ms = _int_header(headers, "X-RateLimit-Interval-Milliseconds")
+        if remaining is not None:
+            self.remaining = remaining
+            self._tokens = min(self._tokens, float(remaining))
+            if remaining <= 0 and interval_ms:
+                self._blocked_until = max(self._blocked_until, now + interval_ms / 1000)
+        if resp.status_code == 429:
+            self.throttled += 1
+            wait = parse_retry_after(headers.get("Retry-After"))
+            if wait is None:
+                wait = interval_ms / 1000 if interval_ms else 1 / self.rate
+            self._blocked_until = max(self._blocked_until, now + wait)
+            self._tokens = min(self._tokens, 0.0)
+            logging.warning("GHL respondeu 429; pausando requisições por %.2fs", wait)
+        self._notify()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = self._clock()
+        self._refill(now)
+        avg = self.wait_total / self.granted if self.granted else 0.0
+        return {
+            "enabled": self.enabled,
+            "tokens": round(self._tokens, 2),
+            "queued": len(self._waiters),
+            "blockedForS": round(max(self._blocked_until - now, 0.0), 3),
+            "remainingQuota": self.remaining,
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "waitAvgMs": round(avg * 1000, 2),
+            "waitMaxMs": round(self.wait_max * 1000, 2),
+        }
+
+
+GHL_LIMITER = RateLimiter()
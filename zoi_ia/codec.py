@@ -0,0 +1,189 @@
+"""Codec JSON único do projeto (stdlib, orjson ou msgspec).
+
+Usa `orjson` para ``loads``/``dumps`` quando instalado e cai para o `json` da
+stdlib caso contrário. A saída compacta é igual nos dois caminhos (sem espaços,
+UTF-8 cru), então chaves de cache e digests não mudam conforme o ambiente.
+
+Os payloads dos webhooks têm schemas tipados (dataclasses). ``decode`` valida e
+constrói o objeto em uma única passada com `msgspec` quando disponível; sem
+ele, decodifica com o codec rápido e valida os campos em seguida.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import typing
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Type, TypeVar, Union
+
+try:  # encoder/decoder rápido opcional
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:  # decodificação tipada em uma passada, opcional
+    import msgspec  # type: ignore
+except Exception:  # pragma: no cover
+    msgspec = None  # type: ignore
+
+T = TypeVar("T")
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+class CodecError(ValueError):
+    """JSON inválido ou que não corresponde ao schema esperado."""
+
+
+def _default(obj: Any) -> Any:
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Objeto não serializável: {type(obj).__name__}")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    try:
+        if orjson is not None:
+            return orjson.loads(data)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return json.loads(data)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise CodecError(str(exc)) from exc
+
+
+def dumpb(obj: Any, *, pretty: bool = False, sort_keys: bool = False) -> bytes:
+    """Serializa para bytes UTF-8 (``pretty`` = indentação de 2 espaços)."""
+    if orjson is not None:
+        option = 0
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option, default=_default)
+        except TypeError:
+            pass  # ex.: chaves não-str ou inteiros > 64 bits; a stdlib lida com eles
+    if pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys, default=_default)
+    else:
+        text = json.dumps(
+            obj, ensure_ascii=False, sort_keys=sort_keys, separators=(",", ":"), default=_default
+        )
+    return text.encode("utf-8")
+
+
+def dumps(obj: Any, *, pretty: bool = False, sort_keys: bool = False) -> str:
+    return dumpb(obj, pretty=pretty, sort_keys=sort_keys).decode("utf-8")
+
+
+# ---- schemas ----------------------------------------------------------------
+# Os nomes dos campos seguem o payload do GHL (camelCase) para decodificar
+# direto, sem renomear.
+
+
+@dataclass
+class MessageEvent:
+    """Webhooks InboundMessage / OutboundMessage."""
+
+    contactId: Optional[str] = None
+    type: Optional[str] = None
+    conversationId: Optional[str] = None
+    body: Optional[str] = None
+    webhookId: Optional[str] = None
+    messageId: Optional[str] = None
+    messageType: Optional[str] = None
+    direction: Optional[str] = None
+    dateAdded: Optional[str] = None
+    attachments: Optional[List[Any]] = None
+    messageAttachments: Optional[List[Any]] = None
+    media: Optional[List[Any]] = None
+    medias: Optional[List[Any]] = None
+
+    def media_payload(self) -> Dict[str, Any]:
+        """Campos de anexos no formato aceito por `extract_*_urls`."""
+        return {
+            "attachments": self.attachments,
+            "messageAttachments": self.messageAttachments,
+            "media": self.media,
+            "medias": self.medias,
+        }
+
+
+@dataclass
+class ContactTagEvent:
+    """Webhook ContactTagUpdate."""
+
+    id: Optional[str] = None
+    type: Optional[str] = None
+    tags: Optional[List[str]] = None
+    webhookId: Optional[str] = None
+
+
+_HINTS: Dict[type, Dict[str, Any]] = {}
+
+
+def _hints(cls: type) -> Dict[str, Any]:
+    hints = _HINTS.get(cls)
+    if hints is None:
+        hints = _HINTS[cls] = typing.get_type_hints(cls)
+    return hints
+
+
+def _convert(tp: Any, value: Any, where: str) -> Any:
+    if tp is Any:
+        return value
+    origin = typing.get_origin(tp)
+    if origin is Union:
+        args = typing.get_args(tp)
+        if value is None and type(None) in args:
+            return None
+        errors = []
+        for arg in args:
+            if arg is type(None):
+                continue
+            try:
+                return _convert(arg, value, where)
+            except CodecError as exc:
+                errors.append(str(exc))
+        raise CodecError("; ".join(errors))
+    if origin in (list, List):
+        if not isinstance(value, list):
+            raise CodecError(f"{where}: esperado lista")
+        (item_tp,) = typing.get_args(tp) or (Any,)
+        return [_convert(item_tp, v, f"{where}[{i}]") for i, v in enumerate(value)]
+    if origin in (dict, Dict):
+        if not isinstance(value, dict):
+            raise CodecError(f"{where}: esperado objeto")
+        _, val_tp = typing.get_args(tp) or (str, Any)
+        return {k: _convert(val_tp, v, f"{where}.{k}") for k, v in value.items()}
+    if dataclasses.is_dataclass(tp):
+        if not isinstance(value, dict):
+            raise CodecError(f"{where}: esperado objeto")
+        hints = _hints(tp)
+        kwargs = {
+            f.name: _convert(hints[f.name], value[f.name], f"{where}.{f.name}")
+            for f in dataclasses.fields(tp)
+            if f.name in value
+        }
+        return tp(**kwargs)
+    if tp is float:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        raise CodecError(f"{where}: esperado número")
+    if tp is int and isinstance(value, bool):
+        raise CodecError(f"{where}: esperado inteiro")
+    if isinstance(tp, type) and isinstance(value, tp):
+        return value
+    raise CodecError(f"{where}: esperado {getattr(tp, '__name__', tp)}")
+
+
+def decode(data: Union[bytes, str], schema: Type[T]) -> T:
+    """Decodifica ``data`` validando contra ``schema`` (dataclass)."""
+    if msgspec is not None:
+        try:
+            return msgspec.json.decode(data, type=schema)
+        except (msgspec.ValidationError, msgspec.DecodeError) as exc:
+            raise CodecError(str(exc)) from exc
+    return _convert(schema, loads(data), schema.__name__)
@@ -16,13 +16,61 @@ PORT: int = int(os.getenv("PORT", "8081"))
 
 # Caminhos
 STORE_PATH: Path = Path(os.getenv("STORE_PATH", "data/tag_ia_atendimento_ativa.json"))
+# Atraso (s) para agrupar alterações do store de contatos em uma única escrita
+STORE_FLUSH_DELAY: float = float(os.getenv("STORE_FLUSH_DELAY", "0.5"))
 MESSAGES_DIR: Path = Path(os.getenv("MESSAGES_DIR", "data/messages"))
 LOCATION_TOKEN_PATH: Path = Path(os.getenv("LOCATION_TOKEN_PATH", "data/location_token.json"))
+AGENCY_TOKEN_PATH: Path = Path(os.getenv("AGENCY_TOKEN_PATH", "data/agency_token.json"))
 EMBEDDINGS_DIR: Path = Path(os.getenv("EMBEDDINGS_DIR", "data/embeddings"))
 
+# Backend do histórico por contato: "json" (um arquivo por contato), "journal"
+# (snapshot + log append-only) ou "sqlite"
+STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+SQLITE_PATH: Path = Path(os.getenv("SQLITE_PATH", "data/zoi.sqlite3"))
+JOURNAL_COMPACT_BYTES: int = int(os.getenv("JOURNAL_COMPACT_BYTES", str(256 * 1024)))
+# Layout em disco: níveis de subdiretório por hash do contato (0 = plano)
+STORAGE_SHARD_DEPTH: int = int(os.getenv("STORAGE_SHARD_DEPTH", "0"))
+# Camada fria: contatos sem atividade há N dias vão comprimidos para ARCHIVE_DIR
+ARCHIVE_DIR: Path = Path(os.getenv("ARCHIVE_DIR", "data/archive"))
+COLD_TIER_DAYS: float = float(os.getenv("COLD_TIER_DAYS", "0"))
+# Outbox das respostas da IA (entrega com retentativas)
+OUTBOX_DIR: Path = Path(os.getenv("OUTBOX_DIR", "data/outbox"))
+OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE: float = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX: float = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+# Dedup de webhooks (webhookId) e ecos das respostas: TTL (s), teto de entradas
+# por tipo e backend ("memory" com snapshot em DEDUP_DIR ou "sqlite" compartilhado)
+DEDUP_TTL: float = float(os.getenv("DEDUP_TTL", str(24 * 3600)))
+DEDUP_MAX_ENTRIES: int = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+DEDUP_BACKEND: str = os.getenv("DEDUP_BACKEND", "memory").strip().lower()
+DEDUP_DIR: Path = Path(os.getenv("DEDUP_DIR", "data/dedup"))
+DEDUP_SQLITE_PATH: Path = Path(os.getenv("DEDUP_SQLITE_PATH", "data/dedup.sqlite3"))
+DEDUP_SNAPSHOT_INTERVAL: float = float(os.getenv("DEDUP_SNAPSHOT_INTERVAL", "60"))
+# Agrupamento de mensagens em rajada (opt-in): responde após N s sem mensagens
+# novas do contato (0 = responde cada mensagem na hora), no máximo N s após a primeira
+INBOUND_DEBOUNCE: float = float(os.getenv("INBOUND_DEBOUNCE", "0"))
+INBOUND_DEBOUNCE_MAX: float = float(os.getenv("INBOUND_DEBOUNCE_MAX", "10"))
+# Rajadas pendentes (retomadas após um restart) e espera máxima no shutdown
+INBOUND_DEBOUNCE_STATE: Path = Path(os.getenv("INBOUND_DEBOUNCE_STATE", "data/debounce.json"))
+INBOUND_DEBOUNCE_DRAIN_TIMEOUT: float = float(os.getenv("INBOUND_DEBOUNCE_DRAIN_TIMEOUT", "30"))
+# Ingestão dos webhooks: "queue" grava o evento no journal e responde 202
+# (workers processam depois, em ordem por contato); "inline" processa antes de
+# responder 200 (comportamento anterior)
+INGEST_MODE: str = os.getenv("INGEST_MODE", "queue").strip().lower()
+INGEST_JOURNAL: Path = Path(os.getenv("INGEST_JOURNAL", "data/ingest/journal.log"))
+INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "8"))
+INGEST_MAX_ATTEMPTS: int = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_COMPACT_BYTES: int = int(os.getenv("INGEST_COMPACT_BYTES", str(1024 * 1024)))
+INGEST_FSYNC: bool = _str_to_bool(os.getenv("INGEST_FSYNC", "false"))
+# Threads do pool que tira o I/O de arquivos do event loop
+STORAGE_IO_WORKERS: int = int(os.getenv("STORAGE_IO_WORKERS", "4"))
+
 # Assinatura de webhooks
 VERIFY_SIGNATURE: bool = _str_to_bool(os.getenv("VERIFY_SIGNATURE", "true"))
+# Payloads a partir deste tamanho (bytes) são verificados fora do event loop
+SIGNATURE_OFFLOAD_BYTES: int = int(os.getenv("SIGNATURE_OFFLOAD_BYTES", str(64 * 1024)))
 
+# Aceita vários blocos PEM concatenados (rotação de chave)
 _PUBLIC_KEY_ENV = os.getenv("WEBHOOK_PUBLIC_KEY_PEM")
 if _PUBLIC_KEY_ENV:
     PUBLIC_KEY_PEM: bytes = _PUBLIC_KEY_ENV.encode("utf-8")
@@ -47,10 +95,49 @@ GHL_API_URL: str = os.getenv("GHL_API_URL", "https://services.leadconnectorhq.co
 GHL_MESSAGES_LIST_VERSION: str = os.getenv("GHL_MESSAGES_LIST_VERSION", "2021-04-15")
 GHL_MESSAGES_WRITE_VERSION: str = os.getenv("GHL_MESSAGES_WRITE_VERSION", "2021-07-28")
 
+# OAuth (renovação automática dos tokens pelo servidor)
+GHL_CLIENT_ID: str = os.getenv("GHL_CLIENT_ID", "")
+GHL_CLIENT_SECRET: str = os.getenv("GHL_CLIENT_SECRET", "")
+# Renova o token quando faltar menos que isso (s) para expirar
+TOKEN_REFRESH_MARGIN: float = float(os.getenv("TOKEN_REFRESH_MARGIN", "600"))
+
 # HTTP client behavior
 HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "10"))
 HTTP_MAX_RETRIES: int = int(os.getenv("HTTP_MAX_RETRIES", "3"))
 HTTP_BACKOFF_BASE: float = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+# Cliente HTTP compartilhado do servidor (keep-alive / HTTP/2)
+HTTP2: bool = _str_to_bool(os.getenv("HTTP2", "true"))
+HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_PER_HOST: int = int(os.getenv("HTTP_MAX_PER_HOST", "20"))
+HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Rate limit do GHL por Location (req/s e rajada); 0 desativa o agendador
+GHL_RATE_LIMIT: float = float(os.getenv("GHL_RATE_LIMIT", "10"))
+GHL_RATE_BURST: int = int(os.getenv("GHL_RATE_BURST", "20"))
+# Timeouts máximos (s) das demais dependências; o efetivo segue o p99 observado
+OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "60"))
+TRANSCRIPTION_TIMEOUT: float = float(os.getenv("TRANSCRIPTION_TIMEOUT", "120"))
+MEDIA_DOWNLOAD_TIMEOUT: float = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "30"))
+ADAPTIVE_TIMEOUT_MIN: float = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "2"))
+# Timeout = p99 * multiplicador (0 desativa e usa sempre o máximo)
+ADAPTIVE_TIMEOUT_MULTIPLIER: float = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3"))
+# Circuit breakers: falhas seguidas para abrir (0 desativa) e tempo aberto (s)
+BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT: float = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# Gateway da OpenAI: chamadas simultâneas e tokens/min por modelo (0 = sem
+# limite de TPM); exceções por modelo em "modelo=valor,modelo=valor"
+OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_MODEL_CONCURRENCY: str = os.getenv("OPENAI_MODEL_CONCURRENCY", "")
+OPENAI_TPM_LIMIT: int = int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+OPENAI_MODEL_TPM: str = os.getenv("OPENAI_MODEL_TPM", "")
+OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+# Resposta da IA em streaming e prazo máximo (s) para gerá-la (0 = sem prazo);
+# no prazo a resposta é cortada na última frase completa
+REPLY_STREAMING: bool = _str_to_bool(os.getenv("REPLY_STREAMING", "true"))
+REPLY_DEADLINE: float = float(os.getenv("REPLY_DEADLINE", "0"))
+# Preço (USD por 1M tokens, "modelo=entrada/saída,...") para estimar o custo
+OPENAI_PRICING: str = os.getenv("OPENAI_PRICING", "")
+# Token exigido nos endpoints /admin (Authorization: Bearer); vazio = /admin desativado
+ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
 
 # RAG / Embeddings
 RAG_ENABLED: bool = _str_to_bool(os.getenv("RAG_ENABLED", "true"))
@@ -73,6 +160,9 @@ AUDIO_MIME_WHITELIST = set((os.getenv("AUDIO_MIME_WHITELIST", _AUDIO_WHITELIST_D
 _AUDIO_EXTS_DEFAULT = "mp3,mp4,m4a,aac,wav,ogg,oga,webm,3gp,3gpp,3g2,flac,opus,amr,caf"
 AUDIO_EXT_WHITELIST = set((os.getenv("AUDIO_EXT_WHITELIST", _AUDIO_EXTS_DEFAULT) or "").split(","))
 
+# Downloads/chamadas de mídia simultâneos por mensagem (áudios + imagens)
+MEDIA_CONCURRENCY: int = int(os.getenv("MEDIA_CONCURRENCY", "4"))
+
 # Imagem / Visão
 DESCRIBE_IMAGES: bool = _str_to_bool(os.getenv("DESCRIBE_IMAGES", "true"))
 VISION_MODEL: str = os.getenv("VISION_MODEL", "gpt-4o-mini")
@@ -87,6 +177,23 @@ IMAGE_EXT_WHITELIST = set((os.getenv("IMAGE_EXT_WHITELIST", _IMAGE_EXTS_DEFAULT)
 # Contexto / Resumo
 CONTEXT_SUMMARY_THRESHOLD: int = int(os.getenv("CONTEXT_SUMMARY_THRESHOLD", "30"))
 CONTEXT_CHUNK_SIZE: int = int(os.getenv("CONTEXT_CHUNK_SIZE", "15"))
+# Máximo de mensagens mantidas em memória; o excedente vai para o resumo
+CONVERSATION_MAX_MESSAGES: int = int(os.getenv("CONVERSATION_MAX_MESSAGES", "60"))
+# Sincronização do histórico do GHL: tamanho da página e máximo por sincronização
+HISTORY_PAGE_SIZE: int = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+HISTORY_SYNC_MAX: int = int(os.getenv("HISTORY_SYNC_MAX", "1000"))
+
+# Orçamento de tokens do prompt da resposta (0 = sem limite) e regras de corte
+CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+CONTEXT_MAX_TURNS: int = int(os.getenv("CONTEXT_MAX_TURNS", "15"))
+CONTEXT_MIN_TURNS: int = int(os.getenv("CONTEXT_MIN_TURNS", "4"))
+CONTEXT_MESSAGE_MAX_TOKENS: int = int(os.getenv("CONTEXT_MESSAGE_MAX_TOKENS", "500"))
+CONTEXT_MEMORY_MAX_TOKENS: int = int(os.getenv("CONTEXT_MEMORY_MAX_TOKENS", "800"))
+CONTEXT_SNIPPETS_MAX_TOKENS: int = int(os.getenv("CONTEXT_SNIPPETS_MAX_TOKENS", "600"))
+# Ordem em que as seções disputam o orçamento (as omitidas vão para o fim)
+CONTEXT_SECTION_PRIORITY: str = os.getenv(
+    "CONTEXT_SECTION_PRIORITY", "system,latest,memory,flow,turns,snippets,fewshots,history"
+)
 
 # Prompt templating (parametrização)
 BRAND_NAME: str = os.getenv("BRAND_NAME", "Nick Multimarcas")
@@ -103,3 +210,6 @@ PROMPT_FEWSHOTS_PATH: Path = Path(os.getenv("PROMPT_FEWSHOTS_PATH", "prompt_fews
 
 # Logging
 LOG_WEBHOOKS: bool = _str_to_bool(os.getenv("LOG_WEBHOOKS", "false"))
+
+# Métricas
+LOOP_LAG_INTERVAL: float = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
@@ -0,0 +1,292 @@
+"""Montagem do contexto do chat dentro de um orçamento de tokens.
+
+As seções disputam ``CONTEXT_TOKEN_BUDGET`` na ordem de prioridade
+(``CONTEXT_SECTION_PRIORITY``); cada uma tem sua regra de corte:
+
+- ``system``: sempre entra, inteiro;
+- ``latest``: a mensagem mais recente; sempre entra, cortada em
+  ``CONTEXT_MESSAGE_MAX_TOKENS``;
+- ``memory`` / ``flow``: resumo e memória de processo, cortados no teto
+  (``CONTEXT_MEMORY_MAX_TOKENS``) ou no que sobrar do orçamento;
+- ``turns``: as ``CONTEXT_MIN_TURNS`` mensagens anteriores mais recentes;
+- ``snippets``: trechos do RAG, um a um na ordem de relevância, até
+  ``CONTEXT_SNIPPETS_MAX_TOKENS``;
+- ``fewshots``: exemplos inteiros, na ordem do arquivo, até o primeiro que
+  não couber;
+- ``history``: as demais mensagens, da mais nova para a mais antiga, até
+  ``CONTEXT_MAX_TURNS`` no total.
+
+Mensagens longas (transcrições, descrições de imagem) são cortadas em
+``CONTEXT_MESSAGE_MAX_TOKENS``. A ordem final das mensagens não muda: prefixo
+fixo, memória, processo, RAG e conversa. Os tokens são contados por
+:mod:`zoi_ia.tokens`.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from .config import (
+    CONTEXT_MAX_TURNS,
+    CONTEXT_MEMORY_MAX_TOKENS,
+    CONTEXT_MESSAGE_MAX_TOKENS,
+    CONTEXT_MIN_TURNS,
+    CONTEXT_SECTION_PRIORITY,
+    CONTEXT_SNIPPETS_MAX_TOKENS,
+    CONTEXT_TOKEN_BUDGET,
+)
+from .tokens import count_tokens, get_encoding, tokenizer_name
+
+# Custo fixo de cada mensagem no formato de chat (papel + separadores)
+MESSAGE_OVERHEAD = 4
+DEFAULT_PRIORITY = ("system", "latest", "memory", "flow", "turns", "snippets", "fewshots", "history")
+_ELLIPSIS = " […]"
+
+
+def message_tokens(message: Dict[str, Any], model: Optional[str] = None) -> int:
+    return count_tokens(str(message.get("content") or ""), model) + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Corta `text` para caber em `max_tokens` (marca o corte com "[…]")."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    room = max(max_tokens - count_tokens(_ELLIPSIS, model), 1)
+    enc = get_encoding(model)
+    if enc is not None:
+        cut = enc.decode(enc.encode(text, disallowed_special=())[:room])
+    else:
+        cut = text[: room * 4]
+        # evita cortar no meio da palavra
+        space = cut.rfind(" ")
+        if space > len(cut) // 2:
+            cut = cut[:space]
+    return cut.rstrip() + _ELLIPSIS
+
+
+def _priority_order(raw: str) -> tuple:
+    names = [n.strip() for n in (raw or "").split(",") if n.strip()]
+    known = [n for n in names if n in DEFAULT_PRIORITY]
+    if not known:
+        return DEFAULT_PRIORITY
+    # seções omitidas vão para o fim, na ordem padrão
+    return tuple(known) + tuple(n for n in DEFAULT_PRIORITY if n not in known)
+
+
+@dataclass
+class AssembledContext:
+    messages: List[Dict[str, Any]]
+    budget: int
+    tokens: Dict[str, int] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+    truncated: List[str] = field(default_factory=list)
+    tokenizer: str = "heuristic"
+
+    @property
+    def total(self) -> int:
+        return sum(self.tokens.values())
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "total": self.total,
+            "tokenizer": self.tokenizer,
+            "sections": dict(self.tokens),
+            "dropped": dict(self.dropped),
+            "truncated": list(self.truncated),
+        }
+
+
+class ContextAssembler:
+    def __init__(
+        self,
+        *,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        max_turns: int = CONTEXT_MAX_TURNS,
+        min_turns: int = CONTEXT_MIN_TURNS,
+        message_max_tokens: int = CONTEXT_MESSAGE_MAX_TOKENS,
+        memory_max_tokens: int = CONTEXT_MEMORY_MAX_TOKENS,
+        snippets_max_tokens: int = CONTEXT_SNIPPETS_MAX_TOKENS,
+        priority: Sequence[str] | str = CONTEXT_SECTION_PRIORITY,
+    ) -> None:
+        self.budget = budget
+        self.max_turns = max_turns
+        self.min_turns = min_turns
+        self.message_max_tokens = message_max_tokens
+        self.memory_max_tokens = memory_max_tokens
+        self.snippets_max_tokens = snippets_max_tokens
+        self.priority = _priority_order(priority if isinstance(priority, str) else ",".join(priority))
+
+    def assemble(
+        self,
+        prefix: Sequence[Dict[str, Any]],
+        turns: Sequence[Dict[str, Any]],
+        *,
+        memory: Optional[Dict[str, Any]] = None,
+        flow: Optional[Dict[str, Any]] = None,
+        snippets_header: str = "",
+        snippets: Sequence[str] = (),
+        model: Optional[str] = None,
+    ) -> AssembledContext:
+        """Escolhe o que entra no prompt e devolve as mensagens na ordem final.
+
+        `prefix` é o prefixo fixo (system + few‑shots), `turns` a conversa em
+        ordem cronológica (já no formato {"role", "content"}) e `memory`/`flow`
+        as mensagens de memória prontas.
+        """
+        budget = self.budget if self.budget > 0 else None
+        result = AssembledContext(messages=[], budget=self.budget, tokenizer=tokenizer_name(model))
+        used = 0
+
+        def room() -> Optional[int]:
+            return None if budget is None else budget - used
+
+        def take(section: str, tokens: int) -> None:
+            nonlocal used
+            used += tokens
+            result.tokens[section] = result.tokens.get(section, 0) + tokens
+
+        def fit_message(
+            section: str,
+            message: Dict[str, Any],
+            cap: Optional[int],
+            *,
+            required: bool = False,
+            shrink: bool = True,
+        ):
+            """Cabe `message` (cortada no teto e, com `shrink`, no que sobra do
+            orçamento); None se não couber."""
+            content = str(message.get("content") or "")
+            limit = cap if cap and cap > 0 else None
+            if limit is not None and count_tokens(content, model) > limit:
+                content = truncate_to_tokens(content, limit, model)
+            free = room()
+            if free is not None and not required:
+                free -= MESSAGE_OVERHEAD
+                if count_tokens(content, model) > free:
+                    if not shrink or free <= 0:
+                        return None
+                    content = truncate_to_tokens(content, free, model)
+            if content != str(message.get("content") or ""):
+                if not content:
+                    return None
+                if section not in result.truncated:
+                    result.truncated.append(section)
+                message = {**message, "content": content}
+            take(section, message_tokens(message, model))
+            return message
+
+        dynamic = {"memory": memory, "flow": flow}
+        system = list(prefix[:1])
+        fewshots = list(prefix[1:])
+        chosen: Dict[str, Any] = {"system": [], "fewshots": [], "memory": None, "flow": None, "snippets": []}
+        latest = turns[-1:] if turns else []
+        older = list(turns[:-1])[-max(self.max_turns - 1, 0):] if self.max_turns > 1 else []
+        kept_turns: deque = deque()
+        cursor = len(older)  # próximas mensagens anteriores a considerar: older[:cursor]
+
+        def take_turns(limit: int, section: str) -> None:
+            nonlocal cursor
+            count = 0
+            while cursor > 0 and count < limit:
+                msg = fit_message(section, older[cursor - 1], self.message_max_tokens, shrink=False)
+                if msg is None:
+                    break
+                kept_turns.appendleft(msg)
+                cursor -= 1
+                count += 1
+
+        for section in self.priority:
+            if section == "system":
+                for m in system:
+                    chosen["system"].append(m)
+                    take("system", message_tokens(m, model))
+            elif section == "latest":
+                for m in latest:
+                    latest_msg = fit_message("latest", m, self.message_max_tokens, required=True)
+                    latest = [latest_msg]
+            elif section in ("memory", "flow") and dynamic[section]:
+                chosen[section] = fit_message(section, dynamic[section], self.memory_max_tokens)
+                if chosen[section] is None:
+                    result.dropped[section] = 1
+            elif section == "turns":
+                take_turns(self.min_turns, "turns")
+            elif section == "history":
+                take_turns(len(older), "history")
+            elif section == "fewshots":
+                for i, m in enumerate(fewshots):
+                    tokens = message_tokens(m, model)
+                    free = room()
+                    if free is not None and tokens > free:
+                        result.dropped["fewshots"] = len(fewshots) - i
+                        break
+                    chosen["fewshots"].append(m)
+                    take("fewshots", tokens)
+            elif section == "snippets" and snippets:
+                header = count_tokens(snippets_header, model) + MESSAGE_OVERHEAD
+                spent = header
+                for i, line in enumerate(snippets):
+                    tokens = count_tokens(line + "\n", model)
+                    free = room()
+                    over_cap = self.snippets_max_tokens > 0 and spent + tokens > self.snippets_max_tokens
+                    if over_cap or (free is not None and spent + tokens > free):
+                        result.dropped["snippets"] = len(snippets) - i
+                        break
+                    chosen["snippets"].append(line)
+                    spent += tokens
+                if chosen["snippets"]:
+                    take("snippets", spent)
+        if cursor > 0:
+            result.dropped["turns"] = cursor
+
+        messages: List[Dict[str, Any]] = chosen["system"] + chosen["fewshots"]
+        for section in ("memory", "flow"):
+            if chosen[section] is not None:
+                messages.append(chosen[section])
+        if chosen["snippets"]:
+            messages.append({"role": "assistant", "content": snippets_header + "\n".join(chosen["snippets"])})
+        messages.extend(kept_turns)
+        messages.extend(latest)
+        result.messages = messages
+        if budget is not None and used > budget:
+            logging.warning("Prompt acima do orçamento (%d > %d tokens) só com as seções obrigatórias", used, budget)
+        return result
+
+
+class ContextStats:
+    """Médias de tokens por seção das últimas montagens (``GET /metrics``)."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._reports: deque = deque(maxlen=window)
+        self.assembled = 0
+        self.truncated = 0
+        self.over_budget = 0
+
+    def record(self, ctx: AssembledContext) -> None:
+        self.assembled += 1
+        if ctx.truncated or ctx.dropped:
+            self.truncated += 1
+        if ctx.budget > 0 and ctx.total > ctx.budget:
+            self.over_budget += 1
+        self._reports.append(ctx.report())
+
+    def snapshot(self) -> Dict[str, Any]:
+        reports = list(self._reports)
+        avg: Dict[str, float] = {}
+        for rep in reports:
+            for name, tokens in rep["sections"].items():
+                avg[name] = avg.get(name, 0) + tokens
+        n = len(reports) or 1
+        return {
+            "assembled": self.assembled,
+            "trimmed": self.truncated,
+            "overBudget": self.over_budget,
+            "avgTotal": round(sum(r["total"] for r in reports) / n, 1),
+            "avgSections": {k: round(v / n, 1) for k, v in sorted(avg.items())},
+            "last": reports[-1] if reports else None,
+        }
@@ -0,0 +1,99 @@
+"""Buffer de conversa em ordem cronológica.
+
+Em disco o histórico continua no formato original (``messages`` com a mais
+recente primeiro). Em memória os handlers usam ``ConversationBuffer``: a mais
+antiga primeiro, ``append`` em O(1) e janelas "últimas N" sem inverter a lista
+inteira. O buffer tem tamanho máximo; o que passa do limite fica em
+``overflow`` até `update_context` incorporar ao resumo.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .config import CONVERSATION_MAX_MESSAGES
+
+Message = Dict[str, Any]
+
+
+class ConversationBuffer:
+    def __init__(self, messages: Iterable[Message] = (), maxlen: Optional[int] = CONVERSATION_MAX_MESSAGES) -> None:
+        self.maxlen = maxlen
+        self._items: deque[Message] = deque()
+        self.overflow: List[Message] = []
+        self.extend(messages)
+
+    @classmethod
+    def from_newest_first(cls, messages: Iterable[Message], maxlen: Optional[int] = CONVERSATION_MAX_MESSAGES) -> "ConversationBuffer":
+        """Constrói a partir do formato em disco (mais recente primeiro)."""
+        return cls(reversed(list(messages)), maxlen=maxlen)
+
+    @classmethod
+    def coerce(cls, messages: Any) -> "ConversationBuffer":
+        """Aceita um buffer ou a lista do formato em disco (sem limite de tamanho)."""
+        if isinstance(messages, cls):
+            return messages
+        return cls.from_newest_first(messages or [], maxlen=None)
+
+    @classmethod
+    def attach(cls, store: Dict[str, Any], maxlen: Optional[int] = CONVERSATION_MAX_MESSAGES) -> "ConversationBuffer":
+        """Substitui ``store["messages"]`` por um buffer e o retorna."""
+        messages = store.get("messages")
+        if isinstance(messages, cls):
+            return messages
+        buf = cls.from_newest_first(messages or [], maxlen=maxlen)
+        store["messages"] = buf
+        return buf
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    def __iter__(self) -> Iterator[Message]:
+        return iter(self._items)
+
+    def append(self, message: Message) -> Message:
+        self._items.append(message)
+        if self.maxlen is not None and len(self._items) > self.maxlen:
+            self.overflow.append(self._items.popleft())
+        return message
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        for m in messages:
+            self.append(m)
+
+    def reset(self, messages: Iterable[Message]) -> None:
+        """Troca todo o conteúdo (ex.: histórico buscado no GHL, em ordem cronológica)."""
+        self._items.clear()
+        self.overflow = []
+        self.extend(messages)
+
+    def newest(self) -> Optional[Message]:
+        return self._items[-1] if self._items else None
+
+    def last(self, n: int, predicate: Optional[Callable[[Message], bool]] = None) -> List[Message]:
+        """Últimas ``n`` mensagens (que atendem ``predicate``), em ordem cronológica."""
+        source: Iterable[Message] = reversed(self._items)
+        if predicate is not None:
+            source = filter(predicate, source)
+        window = list(islice(source, n))
+        window.reverse()
+        return window
+
+    def popleft(self, n: int) -> List[Message]:
+        """Remove e retorna as ``n`` mensagens mais antigas."""
+        return [self._items.popleft() for _ in range(min(n, len(self._items)))]
+
+    def drain_overflow(self) -> List[Message]:
+        drained, self.overflow = self.overflow, []
+        return drained
+
+    def to_newest_first(self) -> List[Message]:
+        """Formato em disco; inclui o overflow ainda não resumido."""
+        out = list(reversed(self._items))
+        out.extend(reversed(self.overflow))
+        return out
@@ -0,0 +1,284 @@
+"""Histórico por contato em modo journal (snapshot + log append-only).
+
+Cada contato tem um snapshot ``<contact_id>.json`` (mesmo formato do backend
+JSON) e um log ``<contact_id>.log`` com um registro JSON por linha. Salvar um
+contato só acrescenta ao log o que mudou desde o último estado conhecido:
+
+- ``{"op": "append", "message": {...}}`` para cada mensagem nova;
+- ``{"op": "drop", "n": k}`` quando o resumo descarta as k mais antigas;
+- ``{"op": "set", "fields": {...}}`` / ``{"op": "unset", "keys": [...]}`` para
+  os demais campos (context, flow, conversationId, ...).
+
+Quando o log passa de ``JOURNAL_COMPACT_BYTES`` um compactor em background
+reescreve o snapshot e trunca o log. Cada registro tem um ``seq`` e o snapshot
+guarda o último aplicado (``journalSeq``), então uma queda no meio da
+compactação nunca aplica o mesmo registro duas vezes.
+
+Para voltar ao backend JSON, compacte todos os contatos antes::
+
+    python -m zoi_ia.journal_store compact
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import queue
+import threading
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from . import codec
+from .config import JOURNAL_COMPACT_BYTES, MESSAGES_DIR
+from .layout import contact_write_lock, iter_contact_files, resolve_contact_path
+from .storage import _atomic_write, _empty_contact_store, message_digest, plan_message_update
+
+_SEQ_KEY = "journalSeq"
+# locks por faixa de contatos: número fixo, não cresce com a base de contatos
+_LOCK_STRIPES = 64
+
+
+@dataclass
+class _JournalState:
+    """Último estado conhecido de um contato (para calcular o diff do save)."""
+
+    seq: int
+    log_size: int
+    digests: List[str]
+    fields: Dict[str, bytes] = field(default_factory=dict)
+
+
+def _field_values(store: Dict[str, Any]) -> Dict[str, bytes]:
+    return {
+        k: codec.dumpb(v, sort_keys=True)
+        for k, v in store.items()
+        if k not in {"messages", _SEQ_KEY}
+    }
+
+
+class JournalMessageStore:
+    """Implementa ``load``/``save`` com snapshot + log por contato."""
+
+    def __init__(self, base_dir: Path, compact_bytes: int = JOURNAL_COMPACT_BYTES) -> None:
+        self.base_dir = Path(base_dir)
+        self.compact_bytes = compact_bytes
+        self._states: LRUCache = LRUCache(maxsize=4096)
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+        self._locks_guard = threading.Lock()
+        self._pending: "queue.Queue[str]" = queue.Queue()
+        self._queued: set[str] = set()
+        self._worker: Optional[threading.Thread] = None
+
+    # ---- caminhos e locks -------------------------------------------------
+
+    def _paths(self, contact_id: str) -> Tuple[Path, Path]:
+        return (
+            resolve_contact_path(self.base_dir, contact_id, ".json"),
+            resolve_contact_path(self.base_dir, contact_id, ".log"),
+        )
+
+    def _lock(self, contact_id: str) -> threading.Lock:
+        return self._locks[zlib.crc32(contact_id.encode("utf-8")) % _LOCK_STRIPES]
+
+    # ---- leitura ----------------------------------------------------------
+
+    def _read(self, contact_id: str) -> Tuple[Dict[str, Any], _JournalState]:
+        snap_path, log_path = self._paths(contact_id)
+        data: Dict[str, Any] = _empty_contact_store()
+        if snap_path.exists():
+            try:
+                data = codec.loads(snap_path.read_bytes())
+            except Exception:
+                logging.exception("Falha lendo o snapshot de %s; recriando.", contact_id)
+        seq = int(data.pop(_SEQ_KEY, 0) or 0)
+        data.setdefault("messages", [])
+        data.setdefault("context", "")
+
+        # Em memória o replay usa ordem cronológica; no final volta a "mais recente primeiro".
+        chrono: List[Dict[str, Any]] = list(reversed(data["messages"]))
+        log_size = 0
+        if log_path.exists():
+            raw = log_path.read_bytes()
+            log_size = len(raw)
+            for line in raw.splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    rec = codec.loads(line)
+                except codec.CodecError:
+                    # Linha parcial de uma escrita interrompida: descarta.
+                    logging.warning("Registro inválido no journal de %s; ignorando.", contact_id)
+                    continue
+                rec_seq = int(rec.get("seq") or 0)
+                if rec_seq <= seq:
+                    continue
+                seq = rec_seq
+                op = rec.get("op")
+                if op == "append":
+                    chrono.append(rec.get("message") or {})
+                elif op == "drop":
+                    del chrono[: int(rec.get("n") or 0)]
+                elif op == "set":
+                    data.update(rec.get("fields") or {})
+                elif op == "unset":
+                    for key in rec.get("keys") or []:
+                        data.pop(key, None)
+        data["messages"] = list(reversed(chrono))
+        state = _JournalState(
+            seq=seq,
+            log_size=log_size,
+            digests=[message_digest(m) for m in chrono],
+            fields=_field_values(data),
+        )
+        return data, state
+
+    def _state(self, contact_id: str) -> _JournalState:
+        _, log_path = self._paths(contact_id)
+        size = log_path.stat().st_size if log_path.exists() else 0
+        state = self._states.get(contact_id)
+        if state is None or state.log_size != size:
+            # Sem cache (ou log alterado por outro processo): reconstrói do disco.
+            _, state = self._read(contact_id)
+            self._states[contact_id] = state
+        return state
+
+    def load(self, contact_id: str) -> Dict[str, Any]:
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock(contact_id):
+            data, state = self._read(contact_id)
+            self._states[contact_id] = state
+        return data
+
+    # ---- escrita ----------------------------------------------------------
+
+    @staticmethod
+    def _diff(state: _JournalState, chrono: List[Dict[str, Any]]) -> Tuple[int, int, List[str]]:
+        """``(drop, keep, digests)`` do histórico novo em relação ao gravado.
+
+        No caso comum (só mensagens novas no fim) confere a primeira e a última
+        mensagem já gravadas e calcula o digest apenas da cauda nova, então o
+        custo não depende do tamanho do histórico. Se o início mudou (resumo
+        descartou mensagens, histórico substituído) compara tudo.
+        """
+        old = state.digests
+        count = len(old)
+        if count == 0:
+            return 0, 0, [message_digest(m) for m in chrono]
+        if (
+            len(chrono) >= count
+            and message_digest(chrono[count - 1]) == old[-1]
+            and message_digest(chrono[0]) == old[0]
+        ):
+            return 0, count, old + [message_digest(m) for m in chrono[count:]]
+        digests = [message_digest(m) for m in chrono]
+        drop, keep = plan_message_update(old, digests)
+        return drop, keep, digests
+
+    def save(self, contact_id: str, store: Dict[str, Any]) -> None:
+        chrono = list(reversed(store.get("messages") or []))
+        with self._lock(contact_id), contact_write_lock(contact_id):
+            state = self._state(contact_id)
+            drop, keep, digests = self._diff(state, chrono)
+            fields = _field_values(store)
+
+            records: List[Dict[str, Any]] = []
+            if drop:
+                records.append({"op": "drop", "n": drop})
+            for m in chrono[keep:]:
+                records.append({"op": "append", "message": m})
+            changed = {k: store[k] for k, v in fields.items() if state.fields.get(k) != v}
+            if changed:
+                records.append({"op": "set", "fields": changed})
+            removed = [k for k in state.fields if k not in fields]
+            if removed:
+                records.append({"op": "unset", "keys": removed})
+            if not records:
+                return
+
+            lines = []
+            for rec in records:
+                state.seq += 1
+                lines.append(codec.dumpb({"seq": state.seq, **rec}))
+            payload = b"\n".join(lines) + b"\n"
+            _, log_path = self._paths(contact_id)
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            with log_path.open("ab") as fh:
+                fh.write(payload)
+            state.log_size += len(payload)
+            state.digests = digests
+            state.fields = fields
+            needs_compaction = state.log_size >= self.compact_bytes
+        if needs_compaction:
+            self._schedule_compaction(contact_id)
+
+    # ---- compactação ------------------------------------------------------
+
+    def compact(self, contact_id: str) -> None:
+        """Incorpora o log ao snapshot e remove o log."""
+        with self._lock(contact_id), contact_write_lock(contact_id):
+            snap_path, log_path = self._paths(contact_id)
+            if not log_path.exists():
+                return
+            data, state = self._read(contact_id)
+            data[_SEQ_KEY] = state.seq
+            _atomic_write(snap_path, codec.dumpb(data, pretty=True))
+            log_path.unlink()
+            state.log_size = 0
+            self._states[contact_id] = state
+
+    def compact_all(self) -> int:
+        count = 0
+        for contact_id, suffix, _path in sorted(iter_contact_files("messages", self.base_dir)):
+            if suffix == ".log":
+                self.compact(contact_id)
+                count += 1
+        return count
+
+    def _schedule_compaction(self, contact_id: str) -> None:
+        with self._locks_guard:
+            if contact_id in self._queued:
+                return
+            self._queued.add(contact_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._compactor_loop, name="journal-compactor", daemon=True
+                )
+                self._worker.start()
+        self._pending.put(contact_id)
+
+    def _compactor_loop(self) -> None:
+        while True:
+            contact_id = self._pending.get()
+            with self._locks_guard:
+                self._queued.discard(contact_id)
+            try:
+                self.compact(contact_id)
+            except Exception:
+                logging.exception("Falha compactando o journal de %s", contact_id)
+            finally:
+                self._pending.task_done()
+
+    def wait_compactions(self) -> None:
+        """Bloqueia até o compactor esvaziar a fila (útil em testes e no shutdown)."""
+        self._pending.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ferramentas do histórico em modo journal.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmp_ = sub.add_parser("compact", help="incorpora todos os logs aos snapshots")
+    cmp_.add_argument("--messages-dir", type=Path, default=MESSAGES_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "compact":
+        total = JournalMessageStore(args.messages_dir).compact_all()
+        logging.info("%d journals compactados em %s", total, args.messages_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Layout em disco dos arquivos por contato (shards + camada fria).
+
+Com ``STORAGE_SHARD_DEPTH > 0`` os arquivos de cada contato (histórico em
+``MESSAGES_DIR`` e índice em ``EMBEDDINGS_DIR``) ficam em subdiretórios pelo
+prefixo do hash do id (ex.: ``data/messages/3f/a2/<id>.json``), evitando
+diretórios com centenas de milhares de entradas. A leitura é transparente: se
+o arquivo não está no shard, procura no layout plano antigo.
+
+Camada fria: contatos sem atividade há ``COLD_TIER_DAYS`` dias têm todos os
+seus arquivos empacotados e comprimidos (zstd quando ``zstandard`` estiver
+instalado, senão xz) em ``ARCHIVE_DIR``. O primeiro acesso ao contato
+restaura o pacote automaticamente.
+
+O arquivamento roda via cron com o servidor no ar, então quem grava arquivos
+do contato segura :func:`contact_write_lock` (``flock`` em
+``ARCHIVE_DIR/.locks``, válido entre processos) — o mesmo lock que
+``archive_contact`` e ``restore_contact`` usam.
+
+Comandos offline::
+
+    python -m zoi_ia.layout rebalance          # move tudo para o layout configurado
+    python -m zoi_ia.layout archive --days 90  # envia contatos inativos para a camada fria
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import logging
+import lzma
+import os
+import tarfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:  # compressão zstd opcional
+    import zstandard  # type: ignore
+except Exception:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+try:  # lock entre processos (POSIX)
+    import fcntl
+except Exception:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+from . import codec
+from .config import (
+    ARCHIVE_DIR,
+    COLD_TIER_DAYS,
+    EMBEDDINGS_DIR,
+    MESSAGES_DIR,
+    STORAGE_SHARD_DEPTH,
+    STORE_PATH,
+)
+
+# Sufixos dos arquivos de cada contato, por área.
+_AREA_SUFFIXES: Dict[str, Tuple[str, ...]] = {
+    "messages": (".json", ".log"),
+    "embeddings": (".meta.json", ".npz"),
+}
+_BUNDLE_SUFFIXES = (".tar.zst", ".tar.xz")
+
+# Locks por faixa de contatos: o arquivo de lock de cada faixa é fixo, então
+# o número de arquivos não cresce com a base de contatos.
+_LOCK_STRIPES = 64
+_stripe_locks = [threading.RLock() for _ in range(_LOCK_STRIPES)]
+_held = threading.local()
+
+
+@contextmanager
+def contact_write_lock(contact_id: str) -> Iterator[None]:
+    """Exclusão mútua (entre threads e processos) nos arquivos do contato.
+
+    Reentrante na mesma thread: ``save`` pode restaurar o contato da camada
+    fria segurando o lock.
+    """
+    stripe = zlib.crc32(contact_id.encode("utf-8")) % _LOCK_STRIPES
+    held = getattr(_held, "stripes", None)
+    if held is None:
+        held = _held.stripes = {}
+    with _stripe_locks[stripe]:
+        if held.get(stripe) or fcntl is None:
+            held[stripe] = held.get(stripe, 0) + 1
+            try:
+                yield
+            finally:
+                held[stripe] -= 1
+            return
+        lock_path = ARCHIVE_DIR / ".locks" / f"{stripe:02d}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with lock_path.open("a+b") as fh:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            held[stripe] = 1
+            try:
+                yield
+            finally:
+                held[stripe] = 0
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _area_dirs() -> Dict[str, Path]:
+    return {"messages": MESSAGES_DIR, "embeddings": EMBEDDINGS_DIR}
+
+
+def shard_dir(base: Path, contact_id: str, depth: Optional[int] = None) -> Path:
+    depth = STORAGE_SHARD_DEPTH if depth is None else depth
+    if depth <= 0:
+        return base
+    digest = hashlib.sha1(contact_id.encode("utf-8")).hexdigest()
+    return base.joinpath(*(digest[2 * i : 2 * i + 2] for i in range(depth)))
+
+
+def contact_path(base: Path, contact_id: str, suffix: str, depth: Optional[int] = None) -> Path:
+    """Onde o arquivo do contato deve ser gravado no layout configurado."""
+    return shard_dir(base, contact_id, depth) / f"{contact_id}{suffix}"
+
+
+def resolve_contact_path(base: Path, contact_id: str, suffix: str) -> Path:
+    """Localiza o arquivo do contato (shard, layout plano ou camada fria).
+
+    Retorna o caminho existente, ou o caminho preferido quando o contato ainda
+    não tem esse arquivo.
+    """
+    preferred = contact_path(base, contact_id, suffix)
+    if preferred.exists():
+        return preferred
+    flat = base / f"{contact_id}{suffix}"
+    if flat != preferred and flat.exists():
+        return flat
+    if restore_contact(contact_id):
+        for candidate in (preferred, flat):
+            if candidate.exists():
+                return candidate
+    return preferred
+
+
+# ---- camada fria ---------------------------------------------------------
+
+
+def _bundle_paths(contact_id: str) -> List[Path]:
+    folder = shard_dir(ARCHIVE_DIR, contact_id, 2)
+    return [folder / f"{contact_id}{ext}" for ext in _BUNDLE_SUFFIXES]
+
+
+def _compress(raw: bytes) -> Tuple[bytes, str]:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(raw), ".tar.zst"
+    return lzma.compress(raw, preset=6), ".tar.xz"
+
+
+def _decompress(path: Path) -> bytes:
+    data = path.read_bytes()
+    if path.name.endswith(".tar.zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} requer o pacote 'zstandard'")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return lzma.decompress(data)
+
+
+def _contact_files(contact_id: str) -> List[Tuple[str, Path]]:
+    """Arquivos existentes do contato como (nome no pacote, caminho)."""
+    files: List[Tuple[str, Path]] = []
+    for area, base in _area_dirs().items():
+        for suffix in _AREA_SUFFIXES[area]:
+            for path in {contact_path(base, contact_id, suffix), base / f"{contact_id}{suffix}"}:
+                if path.exists():
+                    files.append((f"{area}/{contact_id}{suffix}", path))
+    return files
+
+
+def is_archived(contact_id: str) -> bool:
+    return any(p.exists() for p in _bundle_paths(contact_id))
+
+
+def archive_contact(contact_id: str, older_than: Optional[float] = None) -> bool:
+    """Empacota e comprime os arquivos do contato, removendo os originais.
+
+    Com ``older_than`` (epoch) desiste se algum arquivo mudou depois disso —
+    o contato voltou a ter atividade desde a varredura.
+    """
+    with contact_write_lock(contact_id):
+        files = _contact_files(contact_id)
+        if not files:
+            return False
+        if older_than is not None and any(path.stat().st_mtime >= older_than for _, path in files):
+            logging.info("Contato %s teve atividade recente; não arquivado", contact_id)
+            return False
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            for name, path in files:
+                tar.add(path, arcname=name)
+        data, ext = _compress(buf.getvalue())
+        target = shard_dir(ARCHIVE_DIR, contact_id, 2) / f"{contact_id}{ext}"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(target)
+        for _, path in files:
+            path.unlink()
+        return True
+
+
+def restore_contact(contact_id: str) -> bool:
+    """Descomprime o pacote do contato (se houver) para o layout atual."""
+    bundles = [p for p in _bundle_paths(contact_id) if p.exists()]
+    if not bundles:
+        return False
+    with contact_write_lock(contact_id):
+        bundle = next((p for p in bundles if p.exists()), None)
+        if bundle is None:  # restaurado por outra thread enquanto esperava
+            return True
+        dirs = _area_dirs()
+        with tarfile.open(fileobj=io.BytesIO(_decompress(bundle)), mode="r") as tar:
+            for member in tar.getmembers():
+                area, _, filename = member.name.partition("/")
+                if area not in dirs or not member.isfile() or "/" in filename:
+                    logging.warning("Entrada inesperada em %s: %s", bundle, member.name)
+                    continue
+                suffix = filename[len(contact_id):]
+                if not filename.startswith(contact_id) or suffix not in _AREA_SUFFIXES[area]:
+                    logging.warning("Entrada inesperada em %s: %s", bundle, member.name)
+                    continue
+                target = contact_path(dirs[area], contact_id, suffix)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                fh = tar.extractfile(member)
+                if fh is not None:
+                    target.write_bytes(fh.read())
+        bundle.unlink()
+        logging.info("Contato %s restaurado da camada fria", contact_id)
+        return True
+
+
+# ---- varredura / rebalanceamento -----------------------------------------
+
+
+def _split_contact_file(area: str, path: Path) -> Optional[Tuple[str, str]]:
+    name = path.name
+    for suffix in _AREA_SUFFIXES[area]:
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[: -len(suffix)], suffix
+    return None
+
+
+def iter_contact_files(area: str, base: Optional[Path] = None) -> Iterator[Tuple[str, str, Path]]:
+    """Percorre (contact_id, sufixo, caminho) de uma área, em qualquer layout."""
+    base = _area_dirs()[area] if base is None else base
+    if not base.exists():
+        return
+    for root, _dirs, names in os.walk(base):
+        for name in names:
+            path = Path(root) / name
+            parsed = _split_contact_file(area, path)
+            if parsed:
+                yield parsed[0], parsed[1], path
+
+
+def rebalance(depth: Optional[int] = None) -> int:
+    """Move os arquivos de todas as áreas para o layout de ``depth``. Retorna quantos moveu."""
+    moved = 0
+    for area, base in _area_dirs().items():
+        for contact_id, suffix, path in list(iter_contact_files(area, base)):
+            target = contact_path(base, contact_id, suffix, depth)
+            if target == path:
+                continue
+            if target.exists():
+                # Duas cópias: mantém a mais recente.
+                if target.stat().st_mtime >= path.stat().st_mtime:
+                    path.unlink()
+                    continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            path.replace(target)
+            moved += 1
+    return moved
+
+
+def sweep_inactive(days: float = COLD_TIER_DAYS, exclude: Iterable[str] = ()) -> int:
+    """Arquiva contatos cujo histórico não muda há ``days`` dias."""
+    if days <= 0:
+        return 0
+    cutoff = time.time() - days * 86400
+    skip: Set[str] = set(exclude)
+    last_seen: Dict[str, float] = {}
+    for area in _area_dirs():
+        for contact_id, _suffix, path in iter_contact_files(area):
+            mtime = path.stat().st_mtime
+            last_seen[contact_id] = max(last_seen.get(contact_id, 0.0), mtime)
+    archived = 0
+    for contact_id, mtime in sorted(last_seen.items()):
+        if contact_id in skip or mtime >= cutoff:
+            continue
+        if archive_contact(contact_id, older_than=cutoff):
+            archived += 1
+    return archived
+
+
+def _active_contact_ids() -> List[str]:
+    try:
+        return list(codec.loads(STORE_PATH.read_bytes()).get("contactIds") or [])
+    except Exception:
+        return []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Layout em disco dos arquivos por contato.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reb = sub.add_parser("rebalance", help="move os arquivos para o layout configurado")
+    reb.add_argument("--depth", type=int, default=STORAGE_SHARD_DEPTH)
+    arc = sub.add_parser("archive", help="envia contatos inativos para a camada fria")
+    arc.add_argument("--days", type=float, default=COLD_TIER_DAYS or 90)
+    res = sub.add_parser("restore", help="restaura contatos da camada fria")
+    res.add_argument("contact_ids", nargs="+")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "rebalance":
+        logging.info("%d arquivos movidos para depth=%d", rebalance(args.depth), args.depth)
+    elif args.command == "archive":
+        # contatos com a tag ativa nunca vão para a camada fria
+        total = sweep_inactive(args.days, exclude=_active_contact_ids())
+        logging.info("%d contatos arquivados em %s", total, ARCHIVE_DIR)
+    elif args.command == "restore":
+        for contact_id in args.contact_ids:
+            if not restore_contact(contact_id):
+                logging.warning("Contato %s não está na camada fria", contact_id)
+
+
+if __name__ == "__main__":
+    main()
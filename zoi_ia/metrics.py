@@ -0,0 +1,83 @@
+"""Registro de métricas do processo, expostas em ``GET /metrics``.
+
+Cada componente registra uma função sem argumentos que retorna um dict
+serializável em JSON; o endpoint só agrega os snapshots.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+_PROVIDERS: Dict[str, Callable[[], Any]] = {}
+
+
+def register(name: str, provider: Callable[[], Any]) -> None:
+    _PROVIDERS[name] = provider
+
+
+def unregister(name: str) -> None:
+    _PROVIDERS.pop(name, None)
+
+
+def snapshot() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for name, provider in list(_PROVIDERS.items()):
+        try:
+            out[name] = provider()
+        except Exception:
+            logging.exception("Falha coletando métrica %s", name)
+            out[name] = None
+    return out
+
+
+class LoopLagMonitor:
+    """Mede o atraso do event loop (lag) com um sleep periódico.
+
+    A cada `interval` segundos compara o tempo real decorrido com o esperado;
+    a diferença é o tempo em que o loop ficou ocupado com código bloqueante.
+    """
+
+    def __init__(self, interval: float = 0.25, window: int = 1200) -> None:
+        self.interval = interval
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._max = 0.0
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self._samples.append(lag)
+            self._max = max(self._max, lag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0}
+
+        def pct(p: float) -> float:
+            return round(samples[min(int(p * len(samples)), len(samples) - 1)] * 1000, 2)
+
+        return {
+            "samples": len(samples),
+            "lastMs": round(self._samples[-1] * 1000, 2),
+            "p50Ms": pct(0.50),
+            "p99Ms": pct(0.99),
+            "maxMs": round(self._max * 1000, 2),
+        }
@@ -1,15 +1,10 @@
 from __future__ import annotations
 
-import os
 from typing import List
 
 import numpy as np
 
-try:  # OpenAI embeddings se disponível
-    from openai import AsyncOpenAI
-except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
-
+from ..clients.openai_gateway import GATEWAY, PRIORITY_BACKGROUND
 from ..config import EMBEDDING_MODEL
 
 
@@ -22,15 +17,14 @@ def _hash_embed(text: str, dim: int = 256) -> np.ndarray:
     return (vec / norm).astype(np.float32)
 
 
-async def embed_texts(texts: List[str]) -> np.ndarray:
+async def embed_texts(texts: List[str], *, priority: int = PRIORITY_BACKGROUND) -> np.ndarray:
     if not texts:
         return np.zeros((0, 256), dtype=np.float32)
 
-    api_key = os.getenv("OPENAI_API_KEY")
-    if AsyncOpenAI and api_key:
+    if GATEWAY.available():
         try:
-            client = AsyncOpenAI()
-            resp = await client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+            # circuito aberto ou falha: cai no embedding local abaixo
+            resp = await GATEWAY.embed(texts, model=EMBEDDING_MODEL, priority=priority)
             vecs = [np.array(d.embedding, dtype=np.float32) for d in resp.data]
             stacked = np.vstack(vecs)
             norms = np.linalg.norm(stacked, axis=1, keepdims=True)
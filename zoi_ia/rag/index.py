@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-import json
+import io
 import logging
 import time
 from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Tuple
 
 import numpy as np
 
+from .. import codec
+from ..async_storage import run_io
+from ..clients.openai_gateway import PRIORITY_REPLY
 from ..config import EMBEDDINGS_DIR
+from ..layout import contact_write_lock, resolve_contact_path
+from ..storage import _atomic_write
 from .embedding import embed_texts
 
 
@@ -22,9 +28,8 @@ class IndexedItem:
 
 
 def _paths(contact_id: str) -> Tuple[Path, Path]:
-    base = EMBEDDINGS_DIR / f"{contact_id}"
-    npz = base.with_suffix(".npz")
-    meta = base.with_suffix(".meta.json")
+    npz = resolve_contact_path(EMBEDDINGS_DIR, contact_id, ".npz")
+    meta = resolve_contact_path(EMBEDDINGS_DIR, contact_id, ".meta.json")
     return npz, meta
 
 
@@ -32,7 +37,7 @@ def load_index(contact_id: str) -> Tuple[np.ndarray, List[str], List[Dict]]:
     npz_path, meta_path = _paths(contact_id)
     if not npz_path.exists() or not meta_path.exists():
         return np.zeros((0, 0), dtype=np.float32), [], []
-    meta: List[Dict] = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta: List[Dict] = codec.loads(meta_path.read_bytes())
 
     vectors: np.ndarray
     try:
@@ -71,21 +76,36 @@ def load_index(contact_id: str) -> Tuple[np.ndarray, List[str], List[Dict]]:
 
 
 def _save_index(contact_id: str, vectors: np.ndarray, ids: List[str], meta: List[Dict]) -> None:
-    npz_path, meta_path = _paths(contact_id)
-    npz_path.parent.mkdir(parents=True, exist_ok=True)
-    np.savez_compressed(npz_path, vectors=vectors.astype(np.float32))
-    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    # escrita atômica: uma busca em paralelo com o upsert nunca lê arquivo pela metade
+    buf = io.BytesIO()
+    np.savez_compressed(buf, vectors=vectors.astype(np.float32))
+    with contact_write_lock(contact_id):
+        npz_path, meta_path = _paths(contact_id)
+        _atomic_write(npz_path, buf.getvalue())
+        _atomic_write(meta_path, codec.dumpb(meta, pretty=True))
 
 
 def _mk_id(direction: str, body: str) -> str:
     return f"{direction}:{abs(hash(body))}"
 
 
+def _message_ts(m: Dict) -> float:
+    if m.get("ts"):
+        return float(m["ts"])
+    date = m.get("dateAdded")
+    if date:
+        try:
+            return datetime.fromisoformat(str(date).replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
 async def upsert_messages(contact_id: str, messages: List[Dict]) -> None:
     if not messages:
         return
 
-    existing_vecs, existing_ids, existing_meta = load_index(contact_id)
+    existing_vecs, existing_ids, existing_meta = await run_io(load_index, contact_id)
     have = set(existing_ids)
 
     new_items: List[IndexedItem] = []
@@ -97,7 +117,8 @@ async def upsert_messages(contact_id: str, messages: List[Dict]) -> None:
         iid = m.get("id") or _mk_id(direction, body)
         if iid in have:
             continue
-        ts = float(m.get("ts") or time.time())
+        have.add(iid)
+        ts = _message_ts(m)
         new_items.append(IndexedItem(id=iid, direction=direction, body=body, ts=ts))
 
     if not new_items:
@@ -123,7 +144,7 @@ async def upsert_messages(contact_id: str, messages: List[Dict]) -> None:
     merged_ids = existing_ids + [it.id for it in new_items]
     merged_meta = existing_meta + [it.__dict__ for it in new_items]
 
-    _save_index(contact_id, merged_vecs, merged_ids, merged_meta)
+    await run_io(_save_index, contact_id, merged_vecs, merged_ids, merged_meta)
 
 
 async def search(contact_id: str, query: str, k: int = 5) -> List[Dict]:
@@ -131,11 +152,12 @@ async def search(contact_id: str, query: str, k: int = 5) -> List[Dict]:
 
     if not query:
         return []
-    vectors, ids, meta = load_index(contact_id)
+    vectors, ids, meta = await run_io(load_index, contact_id)
     if vectors.size == 0:
         return []
 
-    query_vec = (await embed_texts([query]))[0]
+    # a busca está no caminho da resposta ao cliente
+    query_vec = (await embed_texts([query], priority=PRIORITY_REPLY))[0]
 
     q = query_vec
     d = vectors.shape[1]
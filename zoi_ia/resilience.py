@@ -0,0 +1,300 @@
+"""Circuit breakers e timeouts adaptativos por dependência externa.
+
+Cada dependência (GHL, chat da OpenAI, embeddings, Whisper, visão, downloads
+de mídia) tem um :class:`CircuitBreaker` próprio, obtido com
+:func:`get_breaker`:
+
+- **closed**: chamadas passam; ``failure_threshold`` falhas seguidas abrem o
+  circuito;
+- **open**: chamadas falham na hora com :class:`CircuitOpenError` (os
+  chamadores já caem nos fallbacks de string vazia / embedding local) até
+  passar ``reset_timeout``;
+- **half_open**: até ``half_open_max`` chamadas de teste passam; sucesso
+  fecha o circuito, falha reabre.
+
+O timeout de cada chamada acompanha o p99 das latências recentes
+(``p99 * ADAPTIVE_TIMEOUT_MULTIPLIER``), limitado entre
+``ADAPTIVE_TIMEOUT_MIN`` e o teto configurado da dependência. Só contam como
+falha timeouts, erros de conexão e respostas 5xx; erros do próprio pedido
+(4xx, arquivo grande demais, ...) não abrem o circuito.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+from .config import (
+    ADAPTIVE_TIMEOUT_MIN,
+    ADAPTIVE_TIMEOUT_MULTIPLIER,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    HTTP_TIMEOUT,
+    MEDIA_DOWNLOAD_TIMEOUT,
+    OPENAI_TIMEOUT,
+    TRANSCRIPTION_TIMEOUT,
+)
+
+try:  # erros transitórios do SDK da OpenAI, se instalado
+    import openai
+
+    _OPENAI_TRANSIENT: tuple = (
+        openai.APIConnectionError,
+        openai.APITimeoutError,
+        openai.InternalServerError,
+    )
+except Exception:  # pragma: no cover
+    _OPENAI_TRANSIENT = ()
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """O circuito da dependência está aberto; a chamada nem foi feita."""
+
+    def __init__(self, name: str, retry_in: float) -> None:
+        super().__init__(f"circuito '{name}' aberto; nova tentativa em {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_dependency_failure(exc: BaseException) -> bool:
+    """True quando ``exc`` indica problema da dependência (e não do pedido)."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    if isinstance(exc, (httpx.TransportError, ConnectionError)):
+        return True
+    if _OPENAI_TRANSIENT and isinstance(exc, _OPENAI_TRANSIENT):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+class AdaptiveTimeout:
+    """Timeout derivado do p99 das últimas latências bem-sucedidas."""
+
+    def __init__(
+        self,
+        ceiling: float,
+        *,
+        floor: float = ADAPTIVE_TIMEOUT_MIN,
+        multiplier: float = ADAPTIVE_TIMEOUT_MULTIPLIER,
+        window: int = 200,
+        min_samples: int = 20,
+    ) -> None:
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def p99(self) -> Optional[float]:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return samples[min(int(0.99 * len(samples)), len(samples) - 1)]
+
+    def current(self) -> float:
+        if self.multiplier <= 0 or len(self._samples) < self.min_samples:
+            return self.ceiling
+        p99 = self.p99() or 0.0
+        return min(max(p99 * self.multiplier, self.floor), self.ceiling)
+
+
+class CircuitBreaker:
+    """Circuit breaker (closed/open/half-open) com timeout adaptativo."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        timeout: float,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+        half_open_max: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = max(half_open_max, 1)
+        self.timeout = AdaptiveTimeout(timeout)
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        # contadores para o snapshot
+        self._calls = 0
+        self._successes = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._rejected = 0
+        self._opened = 0
+        self._last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        logging.warning("Circuito '%s': %s -> %s", self.name, self._state, state)
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self._clock()
+            self._opened += 1
+        if state in (OPEN, HALF_OPEN):
+            self._probes = 0
+        if state == CLOSED:
+            self._failures = 0
+
+    def allow(self) -> None:
+        """Reserva uma chamada ou levanta :class:`CircuitOpenError`."""
+        if not self.enabled:
+            return
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and self._probes < self.half_open_max:
+            self._probes += 1
+            return
+        self._rejected += 1
+        retry_in = max(self.reset_timeout - (self._clock() - self._opened_at), 0.0)
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self, latency: float) -> None:
+        self._successes += 1
+        self.timeout.observe(latency)
+        self._failures = 0
+        if self._state == HALF_OPEN:
+            self._transition(CLOSED)
+
+    def record_failure(self, exc: BaseException) -> None:
+        self._failed += 1
+        self._last_error = type(exc).__name__
+        if not self.enabled:
+            return
+        if self._state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        self._failures += 1
+        if self._state == CLOSED and self._failures >= self.failure_threshold:
+            self._transition(OPEN)
+
+    def release_probe(self) -> None:
+        """Devolve a vaga de teste quando a chamada terminou sem veredito."""
+        if self._state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def current_timeout(self) -> float:
+        return self.timeout.current()
+
+    async def call(self, fn: Callable[[], Awaitable[T]], *, timeout: Optional[float] = None) -> T:
+        """Executa ``fn()`` sob o circuito e o timeout adaptativo.
+
+        Levanta :class:`CircuitOpenError` sem chamar ``fn`` quando o circuito
+        está aberto; estouro de tempo vira ``asyncio.TimeoutError``.
+        """
+        self.allow()
+        self._calls += 1
+        limit = self.current_timeout() if timeout is None else timeout
+        started = self._clock()
+        try:
+            result = await asyncio.wait_for(fn(), limit)
+        except asyncio.CancelledError:
+            self.release_probe()
+            raise
+        except Exception as exc:
+            if isinstance(exc, asyncio.TimeoutError):
+                self._timeouts += 1
+            if is_dependency_failure(exc):
+                self.record_failure(exc)
+            else:
+                # a dependência respondeu; o erro é do pedido
+                self.record_success(self._clock() - started)
+            raise
+        self.record_success(self._clock() - started)
+        return result
+
+    def reset(self) -> None:
+        """Fecha o circuito manualmente (endpoint de admin)."""
+        self._transition(CLOSED)
+
+    def snapshot(self) -> Dict[str, Any]:
+        state = self.state
+        p99 = self.timeout.p99()
+        snap: Dict[str, Any] = {
+            "state": state,
+            "consecutiveFailures": self._failures,
+            "timeoutS": round(self.current_timeout(), 3),
+            "p99Ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "calls": self._calls,
+            "successes": self._successes,
+            "failures": self._failed,
+            "timeouts": self._timeouts,
+            "rejected": self._rejected,
+            "opened": self._opened,
+            "lastError": self._last_error,
+        }
+        if state == OPEN:
+            snap["retryInS"] = round(max(self.reset_timeout - (self._clock() - self._opened_at), 0.0), 3)
+        return snap
+
+
+# Teto do timeout de cada dependência conhecida
+_CEILINGS: Dict[str, float] = {
+    "ghl": HTTP_TIMEOUT,
+    "openai_chat": OPENAI_TIMEOUT,
+    "openai_summary": OPENAI_TIMEOUT,
+    "embeddings": OPENAI_TIMEOUT,
+    "whisper": TRANSCRIPTION_TIMEOUT,
+    "vision": OPENAI_TIMEOUT,
+    "media": MEDIA_DOWNLOAD_TIMEOUT,
+}
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Breaker compartilhado da dependência ``name`` (criado sob demanda)."""
+    breaker = _BREAKERS.get(name)
+    if breaker is None:
+        breaker = _BREAKERS[name] = CircuitBreaker(name, timeout=_CEILINGS.get(name, HTTP_TIMEOUT))
+    return breaker
+
+
+def snapshot() -> Dict[str, Any]:
+    return {name: get_breaker(name).snapshot() for name in sorted(set(_CEILINGS) | set(_BREAKERS))}
+
+
+def reset(name: Optional[str] = None) -> list[str]:
+    """Fecha o circuito ``name`` (ou todos); retorna os nomes afetados."""
+    names = [name] if name else list(_BREAKERS)
+    done = []
+    for n in names:
+        breaker = _BREAKERS.get(n)
+        if breaker is not None:
+            breaker.reset()
+            done.append(n)
+    return done
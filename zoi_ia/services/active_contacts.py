@@ -0,0 +1,159 @@
+"""Conjunto de contatos com a tag ativa, residente no processo.
+
+Substitui o `load_store()`/`save_store()` por evento: a pertinência é um
+`in` sobre um set em memória, e as alterações são gravadas no
+`STORE_PATH` (mesmo formato de antes) com atraso de `STORE_FLUSH_DELAY`
+segundos, agrupando vários eventos em uma única escrita atômica. Se o arquivo
+for alterado por fora (outro processo, edição manual), ele é relido e as
+alterações ainda não gravadas são reaplicadas por cima.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .. import codec
+from ..config import STORE_PATH, STORE_FLUSH_DELAY
+from ..storage import _atomic_write, _now_iso
+
+
+class ActiveContactRegistry:
+    def __init__(
+        self,
+        path: Path = STORE_PATH,
+        flush_delay: float = STORE_FLUSH_DELAY,
+        reload_interval: float = 1.0,
+    ) -> None:
+        self.path = Path(path)
+        self.flush_delay = flush_delay
+        self.reload_interval = reload_interval
+        self._ids: set[str] = set()
+        self._sorted: Optional[List[str]] = None
+        self._last_update: str = _now_iso()
+        # alterações ainda não gravadas: contact_id -> True (add) / False (discard)
+        self._pending: Dict[str, bool] = {}
+        self._file_sig: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._load()
+
+    # ---- disco ------------------------------------------------------------
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self) -> None:
+        data: Dict[str, Any] = {}
+        sig = self._stat()
+        if sig is not None:
+            try:
+                data = codec.loads(self.path.read_bytes())
+            except Exception:
+                logging.exception("Falha lendo o store; recriando.")
+        self._ids = set(data.get("contactIds") or [])
+        for contact_id, present in self._pending.items():
+            if present:
+                self._ids.add(contact_id)
+            else:
+                self._ids.discard(contact_id)
+        self._last_update = data.get("lastUpdate") or self._last_update
+        self._sorted = None
+        self._file_sig = sig
+        self._checked_at = time.monotonic()
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        if self._stat() != self._file_sig:
+            logging.info("Store de contatos alterado externamente; recarregando.")
+            self._load()
+
+    def flush(self) -> None:
+        """Grava o estado atual imediatamente (se houver alterações)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        # Relê antes de gravar para não sobrescrever alterações externas.
+        if self._stat() != self._file_sig:
+            self._load()
+        payload = {"lastUpdate": self._last_update, "contactIds": self.ids()}
+        _atomic_write(self.path, codec.dumpb(payload, pretty=True))
+        self._pending.clear()
+        self._file_sig = self._stat()
+
+    def _schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Fora do event loop (scripts/testes): grava na hora.
+            self.flush()
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_delay, self._flush_safely)
+
+    def _flush_safely(self) -> None:
+        self._flush_handle = None
+        try:
+            self.flush()
+        except Exception:
+            logging.exception("Falha gravando o store de contatos")
+
+    # ---- API --------------------------------------------------------------
+
+    def __contains__(self, contact_id: object) -> bool:
+        self._maybe_reload()
+        return contact_id in self._ids
+
+    def __len__(self) -> int:
+        self._maybe_reload()
+        return len(self._ids)
+
+    def _set(self, contact_id: str, present: bool) -> bool:
+        self._maybe_reload()
+        if (contact_id in self._ids) == present:
+            return False
+        if present:
+            self._ids.add(contact_id)
+        else:
+            self._ids.discard(contact_id)
+        self._pending[contact_id] = present
+        self._sorted = None
+        self._last_update = _now_iso()
+        self._schedule_flush()
+        return True
+
+    def add(self, contact_id: str) -> bool:
+        """Marca o contato como ativo. Retorna True se mudou algo."""
+        return self._set(contact_id, True)
+
+    def discard(self, contact_id: str) -> bool:
+        """Remove o contato. Retorna True se mudou algo."""
+        return self._set(contact_id, False)
+
+    def ids(self) -> List[str]:
+        if self._sorted is None:
+            self._sorted = sorted(self._ids)
+        return self._sorted
+
+    def page(self, offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        self._maybe_reload()
+        ids = self.ids()
+        end = None if limit is None else offset + limit
+        return ids[offset:end]
+
+    @property
+    def last_update(self) -> str:
+        return self._last_update
@@ -1,11 +1,20 @@
-from typing import Dict, Any, List
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional
 
+from .. import async_storage
+from ..conversation import ConversationBuffer
 from ..summarizer import summarize
 from ..config import CONTEXT_SUMMARY_THRESHOLD, CONTEXT_CHUNK_SIZE
+from .locks import KeyedLockManager
 
 
 async def update_context(store: Dict[str, Any], flush_all: bool = False) -> None:
-    messages: List[Dict[str, Any]] = store.get("messages") or []
+    messages = store.get("messages") or []
+    if isinstance(messages, ConversationBuffer):
+        await _update_context_buffer(store, messages, flush_all)
+        return
     if not messages:
         return
 
@@ -27,3 +36,86 @@ async def update_context(store: Dict[str, Any], flush_all: bool = False) -> None
         combined.append({"direction": "context", "body": context})
     store["context"] = await summarize(combined)
     store["messages"] = remaining
+
+
+async def _update_context_buffer(store: Dict[str, Any], buf: ConversationBuffer, flush_all: bool) -> None:
+    # Mesma regra da lista, em ordem cronológica: o overflow do buffer (mais
+    # antigo) sempre entra no resumo, seguido do lote mais antigo quando o
+    # limiar é atingido.
+    to_summarize = buf.drain_overflow()
+    if flush_all:
+        to_summarize += buf.popleft(len(buf))
+    elif len(buf) >= CONTEXT_SUMMARY_THRESHOLD:
+        to_summarize += buf.popleft(CONTEXT_CHUNK_SIZE)
+    if not to_summarize:
+        return
+
+    context = store.get("context") or ""
+    combined: List[Dict[str, Any]] = []
+    if context:
+        combined.append({"direction": "context", "body": context})
+    combined.extend(to_summarize)
+    store["context"] = await summarize(combined, chronological=True)
+
+
+def needs_context_update(store: Dict[str, Any]) -> bool:
+    """True quando `update_context` teria algo a resumir."""
+    messages = store.get("messages") or []
+    if isinstance(messages, ConversationBuffer):
+        return bool(messages.overflow) or len(messages) >= CONTEXT_SUMMARY_THRESHOLD
+    return len(messages) >= CONTEXT_SUMMARY_THRESHOLD
+
+
+class SummaryScheduler:
+    """Atualiza o resumo dos contatos em background, fora do caminho da resposta.
+
+    ``schedule`` agenda no máximo uma atualização pendente por contato; ela
+    pega o lock do contato, relê o histórico do disco, resume e salva. Até lá
+    o que passou do buffer continua salvo no histórico (overflow), então nada
+    se perde se o processo cair antes.
+    """
+
+    def __init__(self, locks: KeyedLockManager) -> None:
+        self._locks = locks
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+        self.runs = 0
+        self.errors = 0
+        self._last_duration: Optional[float] = None
+
+    def schedule(self, contact_id: str) -> None:
+        if contact_id in self._tasks:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(contact_id))
+        self._tasks[contact_id] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(contact_id, None))
+
+    async def _run(self, contact_id: str) -> None:
+        started = time.perf_counter()
+        try:
+            async with self._locks.hold(contact_id):
+                store = await async_storage.load_contact_messages(contact_id)
+                ConversationBuffer.attach(store)
+                if not needs_context_update(store):
+                    return
+                await update_context(store)
+                await async_storage.save_contact_messages(contact_id, store)
+            self.runs += 1
+        except Exception:
+            self.errors += 1
+            logging.exception("Falha atualizando o resumo de %s", contact_id)
+        finally:
+            self._last_duration = time.perf_counter() - started
+
+    async def drain(self) -> None:
+        """Espera as atualizações pendentes (shutdown e testes)."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        last = self._last_duration
+        return {
+            "pending": len(self._tasks),
+            "runs": self.runs,
+            "errors": self.errors,
+            "lastMs": round(last * 1000, 2) if last is not None else None,
+        }
@@ -0,0 +1,254 @@
+"""Agrupamento das mensagens em rajada antes de responder (por contato).
+
+Cada inbound registrado entra na rajada pendente do contato e reinicia o
+timer; a resposta só é gerada depois de ``INBOUND_DEBOUNCE`` segundos sem
+mensagens novas (ou ``INBOUND_DEBOUNCE_MAX`` depois da primeira), uma vez para
+a rajada inteira. Uma mensagem que chega enquanto a resposta ainda está sendo
+gerada cancela essa geração e a rajada segue aberta. Depois que a função de
+resposta marca ``burst.committed`` (logo antes de enfileirar o envio) a
+rajada não é mais cancelada e as próximas mensagens abrem outra.
+
+As rajadas ainda sem resposta ficam em ``INBOUND_DEBOUNCE_STATE``: ``add`` só
+retorna depois de gravá-las (o evento de ingestão pode então ser dado como
+concluído) e ``start()`` reagenda o que sobrou de um restart. No shutdown,
+``stop()`` responde as rajadas pendentes na hora em vez de descartá-las, até
+``INBOUND_DEBOUNCE_DRAIN_TIMEOUT`` segundos; o que não terminar continua
+gravado para o próximo ``start()``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from .. import codec
+from ..async_storage import run_io
+from ..config import (
+    INBOUND_DEBOUNCE,
+    INBOUND_DEBOUNCE_DRAIN_TIMEOUT,
+    INBOUND_DEBOUNCE_MAX,
+    INBOUND_DEBOUNCE_STATE,
+)
+from ..storage import _atomic_write
+
+
+@dataclass
+class Burst:
+    contact_id: str
+    conversation_id: Optional[str] = None
+    bodies: List[str] = field(default_factory=list)
+    # ids (GHL) das mensagens já na rajada: a retentativa de um evento não duplica
+    message_ids: List[str] = field(default_factory=list)
+    first_at: float = field(default_factory=time.monotonic)
+    generating: bool = False
+    committed: bool = False
+    task: Optional["asyncio.Task[None]"] = field(default=None, repr=False)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(b for b in self.bodies if b)
+
+
+ReplyFn = Callable[[Burst], Awaitable[None]]
+
+
+class ReplyDebouncer:
+    def __init__(
+        self,
+        reply: ReplyFn,
+        *,
+        quiet: float = INBOUND_DEBOUNCE,
+        max_wait: float = INBOUND_DEBOUNCE_MAX,
+        path: Path = INBOUND_DEBOUNCE_STATE,
+        drain_timeout: float = INBOUND_DEBOUNCE_DRAIN_TIMEOUT,
+    ) -> None:
+        self.quiet = quiet
+        self.max_wait = max_wait
+        self.path = Path(path)
+        self.drain_timeout = drain_timeout
+        self._reply = reply
+        self._bursts: Dict[str, Burst] = {}
+        self._running: Set["asyncio.Task[None]"] = set()
+        self._save_lock = asyncio.Lock()
+        self._flushing = False
+        # métricas
+        self.messages = 0
+        self.generations = 0
+        self.replies = 0
+        self.cancelled = 0
+        self.timer_resets = 0
+        self.restored = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.quiet > 0
+
+    def touch(self, contact_id: str) -> None:
+        """Chegou mensagem do contato: cancela a resposta pendente (se ainda dá)."""
+        burst = self._bursts.get(contact_id)
+        if burst is None or burst.task is None or burst.committed:
+            return
+        if burst.generating:
+            self.cancelled += 1
+            logging.info("Nova mensagem de %s: cancelando a resposta em geração", contact_id)
+        else:
+            self.timer_resets += 1
+        burst.task.cancel()
+        burst.task = None
+
+    async def add(
+        self,
+        contact_id: str,
+        conversation_id: Optional[str],
+        body: str,
+        message_id: Optional[str] = None,
+    ) -> None:
+        """Junta a mensagem à rajada do contato, reinicia o timer e grava as rajadas."""
+        burst = self._bursts.get(contact_id)
+        if burst is None or burst.committed:
+            burst = self._bursts[contact_id] = Burst(contact_id)
+        elif message_id and message_id in burst.message_ids:
+            # mesma mensagem de novo (retentativa): só garante o timer
+            if burst.task is None:
+                self._schedule(burst)
+            return
+        self.messages += 1
+        burst.bodies.append(body)
+        if message_id:
+            burst.message_ids.append(message_id)
+        if conversation_id is not None:
+            burst.conversation_id = conversation_id
+        self.touch(contact_id)
+        self._schedule(burst)
+        await self._persist()
+
+    def _schedule(self, burst: Burst) -> None:
+        burst.generating = False
+        task = burst.task = asyncio.get_running_loop().create_task(self._run(burst))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    # ---- estado em disco --------------------------------------------------
+
+    def _state(self) -> bytes:
+        now, mono = time.time(), time.monotonic()
+        return codec.dumpb(
+            [
+                {
+                    "contactId": b.contact_id,
+                    "conversationId": b.conversation_id,
+                    "bodies": b.bodies,
+                    "messageIds": b.message_ids,
+                    "firstAt": now - (mono - b.first_at),
+                }
+                for b in self._bursts.values()
+                if not b.committed
+            ]
+        )
+
+    async def _persist(self) -> None:
+        # o estado é lido dentro do lock: a última gravação é sempre a mais nova
+        async with self._save_lock:
+            await run_io(_atomic_write, self.path, self._state())
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        try:
+            return list(codec.loads(self.path.read_bytes()) or [])
+        except Exception:
+            logging.exception("Estado inválido das rajadas em %s; ignorando", self.path)
+            return []
+
+    async def start(self) -> None:
+        """Reagenda as rajadas que ficaram sem resposta no último shutdown."""
+        self._flushing = False
+        now, mono = time.time(), time.monotonic()
+        restored = 0
+        for entry in await run_io(self._load):
+            contact_id = entry.get("contactId")
+            if not contact_id or contact_id in self._bursts:
+                continue
+            burst = self._bursts[contact_id] = Burst(
+                contact_id,
+                conversation_id=entry.get("conversationId"),
+                bodies=list(entry.get("bodies") or []),
+                message_ids=list(entry.get("messageIds") or []),
+                first_at=mono - max(now - float(entry.get("firstAt") or now), 0.0),
+            )
+            restored += 1
+            self._schedule(burst)
+        self.restored += restored
+        if restored:
+            logging.info("Debounce: %d rajadas pendentes retomadas", restored)
+
+    # ---- timer ------------------------------------------------------------
+
+    def _delay(self, burst: Burst) -> float:
+        if self._flushing:
+            return 0.0
+        delay = self.quiet
+        if self.max_wait > 0:
+            delay = min(delay, burst.first_at + self.max_wait - time.monotonic())
+        return max(delay, 0.0)
+
+    async def _run(self, burst: Burst) -> None:
+        contact_id = burst.contact_id
+        try:
+            await asyncio.sleep(self._delay(burst))
+            burst.generating = True
+            self.generations += 1
+            await self._reply(burst)
+            self.replies += 1
+        except asyncio.CancelledError:
+            if burst.committed:
+                raise
+            # a rajada continua aberta; a próxima mensagem agenda outra tentativa
+            return
+        except Exception:
+            logging.exception("Falha respondendo a rajada de %s", contact_id)
+        if self._bursts.get(contact_id) is burst:
+            del self._bursts[contact_id]
+        await self._persist()
+
+    async def drain(self) -> None:
+        """Espera as respostas agendadas (útil em testes)."""
+        while self._running:
+            await asyncio.gather(*list(self._running), return_exceptions=True)
+
+    async def stop(self) -> None:
+        """Responde já as rajadas pendentes e espera (até `drain_timeout`)."""
+        self._flushing = True
+        for burst in list(self._bursts.values()):
+            if burst.task is not None and not burst.generating:
+                # encurta a janela de silêncio: reagenda com atraso zero
+                burst.task.cancel()
+                self._schedule(burst)
+        running = list(self._running)
+        if running:
+            _, late = await asyncio.wait(running, timeout=self.drain_timeout)
+            for task in late:
+                task.cancel()
+            await asyncio.gather(*late, return_exceptions=True)
+            if late:
+                logging.warning("Debounce: %d respostas ficaram para o próximo start", len(late))
+        await self._persist()
+        self._bursts.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "quietS": self.quiet,
+            "pending": sum(1 for b in self._bursts.values() if b.task is not None),
+            "restored": self.restored,
+            "messages": self.messages,
+            "replies": self.replies,
+            "generations": self.generations,
+            "cancelledGenerations": self.cancelled,
+            "timerResets": self.timer_resets,
+            # uma geração por mensagem era o comportamento sem agrupamento
+            "llmCallsSaved": max(self.messages - self.generations, 0),
+        }
@@ -0,0 +1,278 @@
+"""Registro de chaves já vistas (webhookId, ecos das respostas) com TTL.
+
+Substitui os ``set()`` globais do servidor, que cresciam sem limite e se
+perdiam no restart. Cada :class:`DedupStore` guarda um digest de 64 bits por
+chave num LRU exato ordenado por expiração (``DEDUP_TTL``), limitado a
+``DEDUP_MAX_ENTRIES`` entradas — a mais antiga sai primeiro.
+
+Backends (``DEDUP_BACKEND``):
+
+- ``memory``: só o processo atual; o conteúdo vai para um snapshot em
+  ``DEDUP_DIR/<nome>.json`` a cada ``DEDUP_SNAPSHOT_INTERVAL`` segundos e no
+  shutdown, e é restaurado no ``start()``;
+- ``sqlite``: tabela ``dedup`` em ``DEDUP_SQLITE_PATH`` (WAL), compartilhada
+  por vários processos do servidor; o LRU local serve de cache dos acertos.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from .. import codec
+from ..async_storage import run_io
+from ..config import (
+    DEDUP_BACKEND,
+    DEDUP_DIR,
+    DEDUP_MAX_ENTRIES,
+    DEDUP_SNAPSHOT_INTERVAL,
+    DEDUP_SQLITE_PATH,
+    DEDUP_TTL,
+)
+from ..storage import _atomic_write
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dedup (
+    ns TEXT NOT NULL,
+    digest INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (ns, digest)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS dedup_expires ON dedup (expires_at);
+"""
+
+
+def key_digest(key: str) -> int:
+    """Digest de 64 bits (com sinal, cabe num INTEGER do SQLite)."""
+    raw = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(raw, "big", signed=True)
+
+
+class _SharedTable:
+    """Tabela ``dedup`` num arquivo SQLite (uma conexão por thread)."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def claim(self, ns: str, digest: int, expires_at: float, now: float) -> bool:
+        """Grava a chave; False se outro processo já a tinha (e não expirou)."""
+        cur = self._conn().execute(
+            "INSERT INTO dedup (ns, digest, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (ns, digest) DO UPDATE SET expires_at = excluded.expires_at "
+            "WHERE dedup.expires_at <= ?",
+            (ns, digest, expires_at, now),
+        )
+        return cur.rowcount == 1
+
+    def put(self, ns: str, digest: int, expires_at: float) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO dedup (ns, digest, expires_at) VALUES (?, ?, ?)",
+            (ns, digest, expires_at),
+        )
+
+    def contains(self, ns: str, digest: int, now: float) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM dedup WHERE ns = ? AND digest = ? AND expires_at > ?",
+            (ns, digest, now),
+        ).fetchone()
+        return row is not None
+
+    def remove(self, ns: str, digest: int, now: float) -> bool:
+        cur = self._conn().execute(
+            "DELETE FROM dedup WHERE ns = ? AND digest = ? AND expires_at > ?",
+            (ns, digest, now),
+        )
+        return cur.rowcount == 1
+
+    def purge(self, now: float) -> int:
+        return self._conn().execute("DELETE FROM dedup WHERE expires_at <= ?", (now,)).rowcount
+
+
+class DedupStore:
+    def __init__(
+        self,
+        name: str,
+        *,
+        ttl: float = DEDUP_TTL,
+        max_entries: int = DEDUP_MAX_ENTRIES,
+        backend: str = DEDUP_BACKEND,
+        snapshot_dir: Path = DEDUP_DIR,
+        sqlite_path: Path = DEDUP_SQLITE_PATH,
+        snapshot_interval: float = DEDUP_SNAPSHOT_INTERVAL,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 1)
+        self.snapshot_path = Path(snapshot_dir) / f"{name}.json"
+        self.snapshot_interval = snapshot_interval
+        self._clock = clock
+        self._shared = _SharedTable(sqlite_path) if backend == "sqlite" else None
+        # digest -> expiração; a ordem de inserção é a ordem de expiração (TTL fixo)
+        self._entries: "OrderedDict[int, float]" = OrderedDict()
+        self._dirty = False
+        self._task: Optional["asyncio.Task[None]"] = None
+        # métricas
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @property
+    def backend(self) -> str:
+        return "sqlite" if self._shared is not None else "memory"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---- memória ----------------------------------------------------------
+
+    def _prune(self, now: float) -> None:
+        entries = self._entries
+        while entries:
+            digest, expires_at = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            del entries[digest]
+
+    def _local_has(self, digest: int, now: float) -> bool:
+        expires_at = self._entries.get(digest)
+        return expires_at is not None and expires_at > now
+
+    def _local_add(self, digest: int, expires_at: float) -> None:
+        self._entries[digest] = expires_at
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+        self._dirty = True
+
+    # ---- API --------------------------------------------------------------
+
+    async def check_and_add(self, key: str) -> bool:
+        """Registra `key`; True se ela já tinha sido vista (duplicata)."""
+        now = self._clock()
+        self._prune(now)
+        digest = key_digest(key)
+        if self._local_has(digest, now):
+            self.hits += 1
+            return True
+        expires_at = now + self.ttl
+        if self._shared is not None and not await run_io(self._shared.claim, self.name, digest, expires_at, now):
+            self._local_add(digest, expires_at)
+            self.hits += 1
+            return True
+        self._local_add(digest, expires_at)
+        self.misses += 1
+        return False
+
+    async def add(self, key: str) -> None:
+        now = self._clock()
+        self._prune(now)
+        digest = key_digest(key)
+        self._local_add(digest, now + self.ttl)
+        if self._shared is not None:
+            await run_io(self._shared.put, self.name, digest, now + self.ttl)
+
+    async def contains(self, key: str) -> bool:
+        now = self._clock()
+        digest = key_digest(key)
+        if self._shared is not None:
+            # outro processo pode ter removido a chave: a tabela é quem decide
+            return await run_io(self._shared.contains, self.name, digest, now)
+        return self._local_has(digest, now)
+
+    async def pop(self, key: str) -> bool:
+        """Remove `key`; True se ela estava registrada."""
+        now = self._clock()
+        digest = key_digest(key)
+        found = self._local_has(digest, now)
+        if self._entries.pop(digest, None) is not None:
+            self._dirty = True
+        if self._shared is not None:
+            found = await run_io(self._shared.remove, self.name, digest, now)
+        return found
+
+    # ---- snapshot ---------------------------------------------------------
+
+    def _load_snapshot(self) -> int:
+        if not self.snapshot_path.exists():
+            return 0
+        try:
+            data = codec.loads(self.snapshot_path.read_bytes())
+        except Exception:
+            logging.exception("Snapshot de dedup inválido: %s", self.snapshot_path)
+            return 0
+        now = self._clock()
+        for digest, expires_at in sorted(data.get("entries") or [], key=lambda e: e[1]):
+            if expires_at > now:
+                self._local_add(int(digest), float(expires_at))
+        self._dirty = False
+        return len(self._entries)
+
+    def _save_snapshot(self) -> None:
+        entries = [[digest, expires_at] for digest, expires_at in self._entries.items()]
+        _atomic_write(self.snapshot_path, codec.dumpb({"name": self.name, "entries": entries}))
+
+    async def flush(self) -> None:
+        if self._shared is not None or not self._dirty:
+            return
+        self._dirty = False
+        self._prune(self._clock())
+        await run_io(self._save_snapshot)
+
+    async def _periodic(self) -> None:
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                if self._shared is not None:
+                    await run_io(self._shared.purge, self._clock())
+                else:
+                    await self.flush()
+            except Exception:
+                logging.exception("Falha salvando o dedup %s", self.name)
+
+    async def start(self) -> None:
+        """Restaura o snapshot e agenda os snapshots periódicos."""
+        if self._shared is None:
+            restored = await run_io(self._load_snapshot)
+            if restored:
+                logging.info("Dedup %s: %d chaves restauradas", self.name, restored)
+        if self._task is None and self.snapshot_interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._periodic())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlS": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
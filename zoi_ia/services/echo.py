@@ -0,0 +1,75 @@
+"""Reconhecimento do eco das respostas da IA no webhook de outbound.
+
+Toda resposta enviada pelo agente volta como um OutboundMessage. A resposta é
+registrada em duas tabelas com TTL (:class:`DedupStore`):
+
+- ``expect`` (ao enfileirar): conversa + corpo, o fallback enquanto o envio
+  não devolveu o id da mensagem;
+- ``confirm`` (depois do envio): o ``messageId`` retornado pelo GHL; a entrada
+  por corpo sai, então uma mensagem igual enviada depois por um atendente
+  ("Perfeito!") não é confundida com eco.
+
+``match`` compara pelo ``messageId`` do evento e só usa o corpo quando um dos
+lados não tem id (evento sem id, envio que não devolveu id ou eco que chegou
+antes da resposta do envio).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+from .dedup import DedupStore
+
+
+def _body_key(conversation_id: Optional[str], body: Optional[str]) -> str:
+    return f"{conversation_id or ''}\x00{(body or '').strip()}"
+
+
+class EchoTable:
+    def __init__(self, name: str = "ai-replies", **store_kwargs: Any) -> None:
+        self.ids = DedupStore(f"{name}-ids", **store_kwargs)
+        self.bodies = DedupStore(f"{name}-bodies", **store_kwargs)
+        # métricas
+        self.id_hits = 0
+        self.body_hits = 0
+        self.misses = 0
+        self.unconfirmed = 0
+
+    @property
+    def stores(self) -> tuple:
+        return (self.ids, self.bodies)
+
+    async def expect(self, conversation_id: Optional[str], body: str) -> None:
+        """Resposta a caminho: reconhece o eco pelo corpo até o envio confirmar."""
+        await self.bodies.add(_body_key(conversation_id, body))
+
+    async def confirm(self, conversation_id: Optional[str], body: str, message_id: Optional[str]) -> None:
+        """Resposta enviada: passa a reconhecer o eco pelo id da mensagem."""
+        if not message_id:
+            # sem id o corpo continua sendo o único jeito de reconhecer o eco
+            self.unconfirmed += 1
+            return
+        await self.ids.add(message_id)
+        await self.bodies.pop(_body_key(conversation_id, body))
+
+    async def match(self, message_id: Optional[str], conversation_id: Optional[str], body: Optional[str]) -> bool:
+        """True (e consome a entrada) se o evento é o eco de uma resposta nossa."""
+        if message_id and await self.ids.pop(message_id):
+            self.id_hits += 1
+            await self.bodies.pop(_body_key(conversation_id, body))
+            return True
+        if await self.bodies.pop(_body_key(conversation_id, body)):
+            self.body_hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "idHits": self.id_hits,
+            "bodyHits": self.body_hits,
+            "misses": self.misses,
+            "unconfirmedSends": self.unconfirmed,
+            "pendingIds": len(self.ids),
+            "pendingBodies": len(self.bodies),
+        }
@@ -0,0 +1,120 @@
+"""Sincronização incremental do histórico de conversas do GHL.
+
+Percorre a conversa página a página (cursor ``lastMessageId``, da mais recente
+para a mais antiga) até encontrar a marca d'água salva no store do contato
+(``store["sync"][conversation_id]``), então só o que é novo é baixado. Cada
+página pode ser entregue a um callback assim que chega (ex.: indexação RAG),
+e só as ``keep`` mensagens mais recentes ficam em memória, de modo que um
+backfill longo não carrega a conversa inteira.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..clients.ghl_client import fetch_messages_page
+from ..config import CONVERSATION_MAX_MESSAGES, HISTORY_PAGE_SIZE, HISTORY_SYNC_MAX, RAG_ENABLED
+from ..conversation import ConversationBuffer
+from ..rag.index import upsert_messages
+
+SYNC_KEY = "sync"
+
+PageCallback = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+def _reached_mark(message: Dict[str, Any], mark: Dict[str, Any]) -> bool:
+    if not mark:
+        return False
+    if mark.get("lastMessageId") and message.get("id") == mark["lastMessageId"]:
+        return True
+    # a mensagem da marca pode ter sido apagada: para pela data
+    date, mark_date = message.get("dateAdded"), mark.get("dateAdded")
+    return bool(date and mark_date and date < mark_date)
+
+
+async def sync_conversation(
+    store: Dict[str, Any],
+    conversation_id: str,
+    *,
+    on_page: Optional[PageCallback] = None,
+    page_size: int = HISTORY_PAGE_SIZE,
+    max_messages: int = HISTORY_SYNC_MAX,
+    keep: int = CONVERSATION_MAX_MESSAGES,
+) -> List[Dict[str, Any]]:
+    """Baixa as mensagens novas desde a última sincronização.
+
+    Atualiza a marca d'água em ``store`` e retorna até ``keep`` mensagens novas
+    (as mais recentes), em ordem cronológica. ``on_page`` recebe cada página
+    de mensagens novas, também em ordem cronológica.
+    """
+    marks: Dict[str, Any] = store.setdefault(SYNC_KEY, {})
+    mark = marks.get(conversation_id) or {}
+    recent: List[Dict[str, Any]] = []  # mais recente primeiro
+    newest: Optional[Dict[str, Any]] = None
+    fetched = 0
+    cursor: Optional[str] = None
+    complete = False
+    try:
+        while True:
+            page, cursor = await fetch_messages_page(
+                conversation_id, limit=page_size, last_message_id=cursor
+            )
+            fresh: List[Dict[str, Any]] = []
+            reached = False
+            for message in page:
+                if _reached_mark(message, mark):
+                    reached = True
+                    break
+                fresh.append(message)
+            if fresh:
+                newest = newest or fresh[0]
+                fetched += len(fresh)
+                if len(recent) < keep:
+                    recent.extend(fresh[: keep - len(recent)])
+                if on_page is not None:
+                    await on_page(list(reversed(fresh)))
+            if reached or not cursor or fetched >= max_messages:
+                complete = True
+                break
+    except Exception:
+        logging.exception("Falha sincronizando a conversa %s", conversation_id)
+    # Sem chegar ao fim, avançar a marca deixaria um buraco no histórico.
+    if complete and newest is not None and newest.get("id"):
+        marks[conversation_id] = {"lastMessageId": newest["id"], "dateAdded": newest.get("dateAdded")}
+    return list(reversed(recent))
+
+
+def _message_key(message: Dict[str, Any]) -> Any:
+    return message.get("id") or (message.get("direction"), message.get("body"))
+
+
+async def sync_into_store(
+    contact_id: str,
+    store: Dict[str, Any],
+    conversation_id: str,
+    *,
+    index: bool = RAG_ENABLED,
+) -> List[Dict[str, Any]]:
+    """Sincroniza a conversa e incorpora as mensagens novas ao buffer do store.
+
+    Na primeira sincronização o buffer é substituído pelo histórico (como o
+    fetch antigo fazia); nas seguintes, só o que ainda não está nele é
+    acrescentado. Com ``index``, cada página vai para o índice RAG ao chegar.
+    """
+    first = not (store.get(SYNC_KEY) or {}).get(conversation_id)
+    on_page: Optional[PageCallback] = None
+    if index:
+
+        async def on_page(messages: List[Dict[str, Any]]) -> None:
+            await upsert_messages(contact_id, messages)
+
+    synced = await sync_conversation(store, conversation_id, on_page=on_page)
+    buffer = ConversationBuffer.attach(store)
+    if first or not buffer:
+        buffer.reset(synced)
+    else:
+        known = {_message_key(m) for m in buffer}
+        buffer.extend(m for m in synced if _message_key(m) not in known)
+    store["historyFetched"] = True
+    return synced
@@ -0,0 +1,318 @@
+"""Fila persistente de ingestão dos webhooks (responde 202, processa depois).
+
+O handler só valida, deduplica e grava o evento bruto no journal
+(``INGEST_JOURNAL``, um registro JSON por linha) antes de responder; um pool
+de ``INGEST_WORKERS`` workers consome a fila. Cada contato cai sempre no mesmo
+worker (hash do id), então os eventos de um contato são processados em ordem
+e contatos diferentes seguem em paralelo. As gravações no journal rodam no
+pool de I/O e podem terminar fora de ordem; os eventos só entram na fila dos
+workers na ordem do ``seq``.
+
+O journal só recebe acréscimos:
+
+- ``{"op": "add", "item": {...}}`` quando o evento entra na fila;
+- ``{"op": "done", "id": ...}`` quando termina (com sucesso ou desistência).
+
+No ``start()`` os eventos sem ``done`` são retomados na ordem de chegada e o
+journal é reescrito só com eles; o mesmo acontece em operação quando ele passa
+de ``INGEST_COMPACT_BYTES``. Um evento que falha é tentado de novo até
+``INGEST_MAX_ATTEMPTS`` vezes e depois vai para ``<journal>.failed``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable, Deque, Dict, List, Optional
+
+from .. import codec
+from ..async_storage import run_io
+from ..config import (
+    INGEST_COMPACT_BYTES,
+    INGEST_FSYNC,
+    INGEST_JOURNAL,
+    INGEST_MAX_ATTEMPTS,
+    INGEST_WORKERS,
+)
+from ..storage import _atomic_write
+
+Item = Dict[str, Any]
+ProcessFn = Callable[[Item], Awaitable[None]]
+
+
+class IngestQueue:
+    def __init__(
+        self,
+        process: ProcessFn,
+        *,
+        path: Path = INGEST_JOURNAL,
+        workers: int = INGEST_WORKERS,
+        max_attempts: int = INGEST_MAX_ATTEMPTS,
+        compact_bytes: int = INGEST_COMPACT_BYTES,
+        fsync: bool = INGEST_FSYNC,
+        retry_delay: float = 1.0,
+    ) -> None:
+        self.path = Path(path)
+        self.workers = max(workers, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self.retry_delay = retry_delay
+        self._process = process
+        self._pending: Dict[str, Item] = {}  # ordem de chegada
+        self._per_contact: Dict[str, int] = {}
+        # seq -> item gravado (None enquanto a gravação não terminou), em ordem de seq
+        self._appending: Dict[int, Optional[Item]] = {}
+        self._queues: List["asyncio.Queue[Item]"] = []
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._file: Optional[BinaryIO] = None
+        self._file_lock = threading.Lock()
+        self._journaled: Dict[str, Item] = {}  # o que o journal tem pendente (com `_file_lock`)
+        self._last_seq = 0
+        self._started_at: Optional[float] = None
+        # métricas
+        self.accepted = 0
+        self.processed = 0
+        self.failed = 0
+        self.retries = 0
+        self._busy_since: List[Optional[float]] = []
+        self._busy_total: List[float] = []
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    # ---- journal ----------------------------------------------------------
+
+    def _open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = codec.dumpb(record) + b"\n"
+        with self._file_lock:
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            if record["op"] == "add":
+                self._journaled[record["item"]["id"]] = record["item"]
+            else:
+                self._journaled.pop(record["id"], None)
+            if self._file.tell() > self.compact_bytes > 0:
+                self._rewrite()
+
+    def _rewrite(self) -> None:
+        """Reescreve o journal só com os pendentes (chamar com `_file_lock`)."""
+        if self._file is not None:
+            self._file.close()
+        data = b"".join(codec.dumpb({"op": "add", "item": item}) + b"\n" for item in self._journaled.values())
+        _atomic_write(self.path, data)
+        self._open()
+
+    def _replay(self) -> List[Item]:
+        items: Dict[str, Item] = {}
+        if self.path.exists():
+            for line in self.path.read_bytes().splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    rec = codec.loads(line)
+                except codec.CodecError:
+                    # linha parcial de uma escrita interrompida
+                    logging.warning("Registro inválido no journal de ingestão; ignorando.")
+                    continue
+                if rec.get("op") == "add" and rec.get("item"):
+                    items[rec["item"]["id"]] = rec["item"]
+                elif rec.get("op") == "done":
+                    items.pop(rec.get("id"), None)
+        pending = sorted(items.values(), key=lambda i: int(i.get("seq") or 0))
+        with self._file_lock:
+            self._journaled = {item["id"]: item for item in pending}
+            self._rewrite()
+        return pending
+
+    def _dead_letter(self, item: Item) -> None:
+        target = self.path.with_name(self.path.name + ".failed")
+        with open(target, "ab") as fh:
+            fh.write(codec.dumpb(item) + b"\n")
+
+    def _close(self) -> None:
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._journaled = {}
+
+    # ---- fila -------------------------------------------------------------
+
+    def _next_seq(self) -> int:
+        self._last_seq = max(time.time_ns(), self._last_seq + 1)
+        return self._last_seq
+
+    def _partition(self, contact_id: str) -> int:
+        return zlib.crc32(contact_id.encode("utf-8")) % self.workers
+
+    def _dispatch(self, item: Item) -> None:
+        self._pending[item["id"]] = item
+        contact_id = item["contactId"]
+        self._per_contact[contact_id] = self._per_contact.get(contact_id, 0) + 1
+        self._queues[self._partition(contact_id)].put_nowait(item)
+
+    def _flush_appended(self) -> None:
+        """Despacha os eventos já gravados, sem passar à frente de um anterior."""
+        while self._appending:
+            seq = next(iter(self._appending))
+            item = self._appending[seq]
+            if item is None:
+                return
+            del self._appending[seq]
+            self._dispatch(item)
+
+    def has_pending(self, contact_id: str) -> bool:
+        """Há eventos do contato ainda na fila (ou em processamento)?"""
+        return self._per_contact.get(contact_id, 0) > 0
+
+    async def start(self) -> None:
+        """Sobe os workers e retoma os eventos pendentes do journal."""
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._started_at = time.monotonic()
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._busy_since = [None] * self.workers
+        self._busy_total = [0.0] * self.workers
+        pending = await run_io(self._replay)
+        for item in pending:
+            self._last_seq = max(self._last_seq, int(item.get("seq") or 0))
+            self._dispatch(item)
+        self._tasks = [loop.create_task(self._worker(i)) for i in range(self.workers)]
+        if pending:
+            logging.info("Ingestão: %d eventos pendentes retomados", len(pending))
+
+    async def stop(self) -> None:
+        """Para os workers; o que não terminou continua no journal."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+        self._per_contact.clear()
+        self._appending.clear()
+        await run_io(self._close)
+
+    async def enqueue(self, kind: str, contact_id: str, payload: Dict[str, Any]) -> Item:
+        """Grava o evento no journal e agenda o processamento (retorna o item)."""
+        item: Item = {
+            "id": uuid.uuid4().hex,
+            "seq": self._next_seq(),
+            "kind": kind,
+            "contactId": contact_id,
+            "payload": payload,
+            "receivedAt": time.time(),
+        }
+        seq = item["seq"]
+        self._appending[seq] = None
+        try:
+            await run_io(self._append, {"op": "add", "item": item})
+        except BaseException:
+            self._appending.pop(seq, None)
+            self._flush_appended()
+            raise
+        self.accepted += 1
+        if seq in self._appending:  # stop() no meio da gravação descarta
+            self._appending[seq] = item
+            self._flush_appended()
+        return item
+
+    async def _handle(self, item: Item) -> None:
+        attempts = 0
+        while True:
+            try:
+                await self._process(item)
+                self.processed += 1
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                attempts += 1
+                logging.exception(
+                    "Falha processando evento %s (%s) de %s [tentativa %d]",
+                    item["id"], item["kind"], item["contactId"], attempts,
+                )
+                if attempts >= self.max_attempts:
+                    self.failed += 1
+                    await run_io(self._dead_letter, {**item, "attempts": attempts})
+                    return
+                self.retries += 1
+                await asyncio.sleep(self.retry_delay * (2 ** (attempts - 1)))
+
+    def _finish(self, item: Item) -> None:
+        self._pending.pop(item["id"], None)
+        contact_id = item["contactId"]
+        left = self._per_contact.get(contact_id, 1) - 1
+        if left > 0:
+            self._per_contact[contact_id] = left
+        else:
+            self._per_contact.pop(contact_id, None)
+        self._latencies.append(time.time() - float(item.get("receivedAt") or time.time()))
+
+    async def _worker(self, index: int) -> None:
+        queue = self._queues[index]
+        while True:
+            item = await queue.get()
+            started = time.monotonic()
+            self._busy_since[index] = started
+            try:
+                await self._handle(item)
+                self._finish(item)
+                await run_io(self._append, {"op": "done", "id": item["id"]})
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Falha registrando a conclusão do evento %s", item["id"])
+            finally:
+                self._busy_since[index] = None
+                self._busy_total[index] += time.monotonic() - started
+                queue.task_done()
+
+    async def drain(self) -> None:
+        """Espera a fila esvaziar (útil em testes)."""
+        await asyncio.gather(*(q.join() for q in self._queues))
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        oldest = min((float(i.get("receivedAt") or now) for i in self._pending.values()), default=now)
+        mono = time.monotonic()
+        elapsed = mono - self._started_at if self._started_at is not None else 0.0
+        busy = [
+            total + (mono - since if since is not None else 0.0)
+            for total, since in zip(self._busy_total, self._busy_since)
+        ]
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 1)
+
+        return {
+            "depth": len(self._pending),
+            "oldestAgeS": round(now - oldest, 2),
+            "workers": self.workers,
+            "busyWorkers": sum(1 for since in self._busy_since if since is not None),
+            "utilization": round(sum(busy) / (elapsed * self.workers), 3) if elapsed > 0 else 0.0,
+            "workerDepth": [q.qsize() for q in self._queues],
+            "accepted": self.accepted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "latencyP50Ms": pct(0.50),
+            "latencyP99Ms": pct(0.99),
+        }
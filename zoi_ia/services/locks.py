@@ -0,0 +1,90 @@
+"""Locks assíncronos por chave (contato).
+
+Eventos do mesmo contato executam em ordem de chegada; contatos diferentes
+seguem em paralelo. O lock de uma chave existe só enquanto há alguém usando ou
+esperando por ele. Estatísticas de espera ficam num LRU separado para mostrar
+os contatos "quentes" mesmo depois que o lock foi coletado.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List
+
+from cachetools import LRUCache
+
+
+@dataclass
+class _Entry:
+    lock: asyncio.Lock
+    refs: int = 0
+
+
+@dataclass
+class KeyStats:
+    events: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    max_depth: int = 0
+
+
+class KeyedLockManager:
+    def __init__(self, stats_size: int = 1024) -> None:
+        self._entries: Dict[str, _Entry] = {}
+        self._stats: LRUCache = LRUCache(maxsize=stats_size)
+
+    def depth(self, key: str) -> int:
+        """Eventos em execução + na fila para a chave."""
+        entry = self._entries.get(key)
+        return entry.refs if entry else 0
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(asyncio.Lock())
+        entry.refs += 1
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = KeyStats()
+        stats.max_depth = max(stats.max_depth, entry.refs)
+
+        started = time.perf_counter()
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            self._release_ref(key, entry)
+            raise
+        waited = time.perf_counter() - started
+        stats.events += 1
+        stats.total_wait += waited
+        stats.max_wait = max(stats.max_wait, waited)
+        try:
+            yield
+        finally:
+            entry.lock.release()
+            self._release_ref(key, entry)
+
+    def _release_ref(self, key: str, entry: _Entry) -> None:
+        entry.refs -= 1
+        if entry.refs == 0 and self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        hot: List[Dict[str, Any]] = []
+        for key, st in sorted(self._stats.items(), key=lambda kv: kv[1].total_wait, reverse=True)[:top]:
+            hot.append(
+                {
+                    "key": key,
+                    "depth": self.depth(key),
+                    "events": st.events,
+                    "totalWaitMs": round(st.total_wait * 1000, 2),
+                    "avgWaitMs": round(st.total_wait * 1000 / st.events, 2) if st.events else 0.0,
+                    "maxWaitMs": round(st.max_wait * 1000, 2),
+                    "maxDepth": st.max_depth,
+                }
+            )
+        return {"activeKeys": len(self._entries), "hot": hot}
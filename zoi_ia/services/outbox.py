@@ -0,0 +1,263 @@
+"""Outbox persistente das respostas geradas pela IA.
+
+O webhook só grava a resposta na fila (um arquivo JSON por item em
+``OUTBOX_DIR``) e retorna; um worker por conversa entrega os itens em ordem,
+com retentativas e backoff exponencial. Itens ainda não entregues sobrevivem
+a um restart e são retomados no ``start()``. Depois de
+``OUTBOX_MAX_ATTEMPTS`` falhas o item vai para ``OUTBOX_DIR/failed`` e a fila
+da conversa segue. Uma falha definitiva (a função de envio levanta
+:class:`PermanentSendError`, ex.: credenciais ausentes ou 4xx do GHL) vai
+direto para ``failed``, sem segurar as respostas seguintes da conversa.
+
+``enqueue`` aceita a origem da resposta (``source``, ex.: o id do evento de
+ingestão); ``has_source`` diz se ela já foi enfileirada, para que a
+retentativa de um evento não gere uma segunda resposta.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Union
+
+from .. import codec
+from ..async_storage import run_io
+from ..clients.ghl_client import PermanentSendError
+from ..config import OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX, OUTBOX_DIR, OUTBOX_MAX_ATTEMPTS
+from ..storage import _atomic_write
+
+Item = Dict[str, Any]
+# Origens lembradas por `has_source` (as mais antigas saem primeiro)
+_SOURCES_MAX = 10_000
+# Retorna o id da mensagem enviada ("" se desconhecido); None/False = falha
+SendFn = Callable[[str, Optional[str], str], Awaitable[Union[str, bool, None]]]
+DeliveredFn = Callable[[Item], Awaitable[None]]
+
+
+class Outbox:
+    def __init__(
+        self,
+        send: SendFn,
+        *,
+        on_delivered: Optional[DeliveredFn] = None,
+        path: Path = OUTBOX_DIR,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        backoff_base: float = OUTBOX_BACKOFF_BASE,
+        backoff_max: float = OUTBOX_BACKOFF_MAX,
+    ) -> None:
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._send = send
+        self._on_delivered = on_delivered
+        self._queues: Dict[str, Deque[Item]] = {}
+        self._workers: Dict[str, "asyncio.Task[None]"] = {}
+        self._last_seq = 0
+        self._started = False
+        self._sources: "OrderedDict[str, None]" = OrderedDict()
+        # métricas
+        self.delivered = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retries = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    # ---- disco ------------------------------------------------------------
+
+    def _item_path(self, item: Item) -> Path:
+        return self.path / f"{item['seq']:020d}-{item['id']}.json"
+
+    def _write(self, item: Item) -> None:
+        _atomic_write(self._item_path(item), codec.dumpb(item))
+
+    def _remove(self, item: Item) -> None:
+        self._item_path(item).unlink(missing_ok=True)
+
+    def _dead_letter(self, item: Item) -> None:
+        target = self.path / "failed" / self._item_path(item).name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write(target, codec.dumpb(item))
+        self._remove(item)
+
+    def _load_pending(self) -> List[Item]:
+        items: List[Item] = []
+        if not self.path.exists():
+            return items
+        for file in sorted(self.path.glob("*.json")):
+            try:
+                items.append(codec.loads(file.read_bytes()))
+            except Exception:
+                logging.exception("Item inválido no outbox: %s", file.name)
+        return items
+
+    # ---- fila -------------------------------------------------------------
+
+    def _next_seq(self) -> int:
+        # time_ns mantém a ordem entre restarts; o max evita empate no mesmo ns
+        self._last_seq = max(time.time_ns(), self._last_seq + 1)
+        return self._last_seq
+
+    @staticmethod
+    def _key(item: Item) -> str:
+        return item.get("conversationId") or item["contactId"]
+
+    def _remember(self, source: Optional[str]) -> None:
+        if not source:
+            return
+        self._sources[source] = None
+        self._sources.move_to_end(source)
+        while len(self._sources) > _SOURCES_MAX:
+            self._sources.popitem(last=False)
+
+    def has_source(self, source: str) -> bool:
+        """Já há (ou houve, recentemente) uma resposta enfileirada com esta origem?"""
+        return source in self._sources
+
+    def _dispatch(self, item: Item) -> None:
+        self._remember(item.get("source"))
+        key = self._key(item)
+        self._queues.setdefault(key, deque()).append(item)
+        if key not in self._workers:
+            self._workers[key] = asyncio.get_running_loop().create_task(self._worker(key))
+
+    async def start(self) -> None:
+        """Retoma os itens pendentes gravados em disco."""
+        if self._started:
+            return
+        self._started = True
+        pending = await run_io(self._load_pending)
+        for item in pending:
+            self._last_seq = max(self._last_seq, int(item.get("seq") or 0))
+            self._dispatch(item)
+        if pending:
+            logging.info("Outbox: %d respostas pendentes retomadas", len(pending))
+
+    async def stop(self) -> None:
+        """Para os workers; o que não foi entregue continua em disco."""
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+        self._started = False
+
+    async def enqueue(
+        self,
+        contact_id: str,
+        conversation_id: Optional[str],
+        body: str,
+        *,
+        source: Optional[str] = None,
+    ) -> Item:
+        """Grava a resposta no outbox e agenda a entrega (retorna o item)."""
+        item: Item = {
+            "id": uuid.uuid4().hex,
+            "seq": self._next_seq(),
+            "contactId": contact_id,
+            "conversationId": conversation_id,
+            "body": body,
+            "createdAt": time.time(),
+            "attempts": 0,
+        }
+        if source:
+            item["source"] = source
+        await run_io(self._write, item)
+        self._dispatch(item)
+        return item
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay + random.uniform(0, delay * 0.1)
+
+    async def _worker(self, key: str) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                item = queue[0]
+                ok = False
+                permanent = False
+                try:
+                    result = await self._send(item["contactId"], item.get("conversationId"), item["body"])
+                    ok = result is not None and result is not False
+                    if isinstance(result, str) and result:
+                        item["messageId"] = result
+                except PermanentSendError as exc:
+                    permanent = True
+                    item["error"] = str(exc)
+                except Exception:
+                    logging.exception("Falha enviando resposta do outbox %s", item["id"])
+                if ok:
+                    queue.popleft()
+                    await run_io(self._remove, item)
+                    self.delivered += 1
+                    self._latencies.append(time.time() - float(item.get("createdAt") or time.time()))
+                    if self._on_delivered is not None:
+                        try:
+                            await self._on_delivered(item)
+                        except Exception:
+                            logging.exception("Falha pós-entrega do item %s", item["id"])
+                    continue
+                item["attempts"] = int(item.get("attempts") or 0) + 1
+                if permanent or item["attempts"] >= self.max_attempts:
+                    queue.popleft()
+                    self.failed += 1
+                    self.rejected += permanent
+                    if permanent:
+                        logging.error(
+                            "Outbox: resposta %s para %s recusada (%s); sem novas tentativas",
+                            item["id"],
+                            item["contactId"],
+                            item["error"],
+                        )
+                    else:
+                        logging.error(
+                            "Outbox: desistindo da resposta %s para %s após %d tentativas",
+                            item["id"],
+                            item["contactId"],
+                            item["attempts"],
+                        )
+                    await run_io(self._dead_letter, item)
+                    continue
+                self.retries += 1
+                await run_io(self._write, item)
+                await asyncio.sleep(self._backoff(item["attempts"]))
+        finally:
+            if self._workers.get(key) is asyncio.current_task():
+                del self._workers[key]
+                if not queue:
+                    self._queues.pop(key, None)
+
+    async def drain(self) -> None:
+        """Espera os workers atuais esvaziarem as filas (útil em testes)."""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        pending = [item for queue in self._queues.values() for item in queue]
+        now = time.time()
+        oldest = min((float(i.get("createdAt") or now) for i in pending), default=now)
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 1)
+
+        return {
+            "backlog": len(pending),
+            "conversations": len(self._queues),
+            "oldestPendingS": round(now - oldest, 1),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "latencyP50Ms": pct(0.50),
+            "latencyP99Ms": pct(0.99),
+        }
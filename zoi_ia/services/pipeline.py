@@ -0,0 +1,161 @@
+"""Execução de estágios assíncronos com dependências (grafo) e medição de tempo.
+
+Cada estágio é uma corrotina sem argumentos que começa assim que todos os
+estágios de que depende terminam; estágios independentes rodam em paralelo.
+Um estágio obrigatório que falha cancela os dependentes e a exceção sobe em
+``run``; um estágio opcional (``optional=True``) só é logado e os dependentes
+seguem com resultado None.
+
+Os tempos de cada execução (início relativo e duração por estágio, total)
+vão para um :class:`PipelineStats`, exposto em ``GET /metrics``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class _Stage:
+    name: str
+    fn: Callable[[], Awaitable[Any]]
+    after: Tuple[str, ...]
+    optional: bool
+
+
+@dataclass
+class StageTiming:
+    start: float
+    duration: float
+    ok: bool = True
+
+
+@dataclass
+class PipelineRun:
+    total: float = 0.0
+    stages: Dict[str, StageTiming] = field(default_factory=dict)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "totalMs": round(self.total * 1000, 2),
+            "stages": {
+                name: {"startMs": round(t.start * 1000, 2), "ms": round(t.duration * 1000, 2), "ok": t.ok}
+                for name, t in self.stages.items()
+            },
+        }
+
+
+class PipelineStats:
+    def __init__(self, window: int = 500) -> None:
+        self._totals: Deque[float] = deque(maxlen=window)
+        self._stages: Dict[str, Deque[float]] = {}
+        self.runs = 0
+        self.failures = 0
+        self.last: Optional[Dict[str, Any]] = None
+
+    def record(self, run: PipelineRun, failed: bool) -> None:
+        self.runs += 1
+        self.failures += int(failed)
+        self._totals.append(run.total)
+        for name, timing in run.stages.items():
+            self._stages.setdefault(name, deque(maxlen=self._totals.maxlen)).append(timing.duration)
+        self.last = run.report()
+
+    @staticmethod
+    def _pct(values: Iterable[float]) -> Dict[str, Optional[float]]:
+        ordered = sorted(values)
+        if not ordered:
+            return {"p50Ms": None, "p99Ms": None}
+
+        def at(p: float) -> float:
+            return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+        return {"p50Ms": at(0.50), "p99Ms": at(0.99)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "total": self._pct(self._totals),
+            "stages": {name: self._pct(values) for name, values in sorted(self._stages.items())},
+            "last": self.last,
+        }
+
+
+class StageGraph:
+    def __init__(self, name: str, stats: Optional[PipelineStats] = None) -> None:
+        self.name = name
+        self.stats = stats
+        self._stages: Dict[str, _Stage] = {}
+        self.results: Dict[str, Any] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        *,
+        after: Iterable[str] = (),
+        optional: bool = False,
+    ) -> None:
+        after = tuple(after)
+        missing = [dep for dep in after if dep not in self._stages]
+        if missing:
+            # só aceita dependências já declaradas: garante que não há ciclos
+            raise ValueError(f"estágio {name!r} depende de estágios desconhecidos: {missing}")
+        self._stages[name] = _Stage(name, fn, after, optional)
+
+    async def run(self) -> PipelineRun:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        run = PipelineRun()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(stage: _Stage) -> Any:
+            if stage.after:
+                await asyncio.gather(*(tasks[dep] for dep in stage.after))
+            begin = loop.time()
+            try:
+                result = await stage.fn()
+            except Exception:
+                run.stages[stage.name] = StageTiming(begin - started, loop.time() - begin, ok=False)
+                if not stage.optional:
+                    raise
+                logging.exception("Estágio opcional %s/%s falhou", self.name, stage.name)
+                result = None
+            else:
+                run.stages[stage.name] = StageTiming(begin - started, loop.time() - begin)
+            self.results[stage.name] = result
+            return result
+
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.create_task(execute(stage), name=f"{self.name}:{stage.name}")
+        failed = False
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            failed = True
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            run.total = loop.time() - started
+            if self.stats is not None:
+                self.stats.record(run, failed)
+            logging.debug("Pipeline %s: %s", self.name, run.report())
+        return run
+
+
+async def bounded_gather(factories: List[Callable[[], Awaitable[Any]]], limit: int) -> List[Any]:
+    """Roda as corrotinas com no máximo `limit` simultâneas; mantém a ordem."""
+    semaphore = asyncio.Semaphore(max(limit, 1))
+
+    async def guarded(factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            return await factory()
+
+    return list(await asyncio.gather(*(guarded(f) for f in factories)))
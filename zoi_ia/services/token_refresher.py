@@ -0,0 +1,151 @@
+"""Renovação dos tokens OAuth do GHL enquanto o servidor roda.
+
+Cada `TokenRefresher` cuida de um arquivo de token (via `TokenProvider`):
+uma tarefa em background renova o token ``TOKEN_REFRESH_MARGIN`` segundos
+antes do ``expires_at`` e publica o novo bundle em memória e em disco de uma
+vez. ``refresh()`` também pode ser chamado sob demanda (ex.: resposta 401);
+chamadas concorrentes aguardam a mesma renovação em andamento, já que o
+refresh_token do GHL só pode ser usado uma vez.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..async_storage import run_io
+from ..config import TOKEN_REFRESH_MARGIN
+from ..storage import TokenProvider, _now_iso
+
+# Recebe o bundle atual e retorna o novo (mesmo formato do arquivo).
+RefreshFn = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def seconds_until_expiry(data: Dict[str, Any]) -> Optional[float]:
+    raw = data.get("expires_at")
+    if not raw:
+        return None
+    try:
+        expires = datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+    except ValueError:
+        logging.warning("expires_at inválido: %r", raw)
+        return None
+    if expires.tzinfo is None:
+        expires = expires.replace(tzinfo=timezone.utc)
+    return (expires - datetime.now(timezone.utc)).total_seconds()
+
+
+class TokenRefresher:
+    def __init__(
+        self,
+        provider: TokenProvider,
+        refresh: RefreshFn,
+        *,
+        name: str,
+        margin: float = TOKEN_REFRESH_MARGIN,
+        retry_delay: float = 30.0,
+        check_interval: float = 60.0,
+    ) -> None:
+        self.provider = provider
+        self.name = name
+        self.margin = margin
+        self.retry_delay = retry_delay
+        self.check_interval = check_interval
+        self._refresh_fn = refresh
+        self._inflight: Optional["asyncio.Future[Optional[str]]"] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh: Optional[str] = None
+
+    async def refresh(self, stale_token: Optional[str] = None) -> Optional[str]:
+        """Renova o token (single-flight) e retorna o access_token novo.
+
+        Com ``stale_token``, não renova se o token atual já for outro (alguém
+        renovou depois que o chamador leu o token). Retorna None se falhar.
+        """
+        if self._inflight is None:
+            current = self.provider.access_token
+            if stale_token is not None and current and current != stale_token:
+                return current
+            self._inflight = asyncio.ensure_future(self._do_refresh())
+            self._inflight.add_done_callback(self._clear_inflight)
+        return await asyncio.shield(self._inflight)
+
+    def _clear_inflight(self, _fut: "asyncio.Future[Optional[str]]") -> None:
+        self._inflight = None
+
+    async def _do_refresh(self) -> Optional[str]:
+        current = dict(self.provider.data())
+        if not current.get("refresh_token"):
+            logging.warning("Token %s sem refresh_token; gere um novo com oauth.py", self.name)
+            self.failures += 1
+            return None
+        try:
+            new = await self._refresh_fn(current)
+            bundle = {**current, **{k: v for k, v in new.items() if v is not None}}
+            await run_io(self.provider.update, bundle)
+        except Exception:
+            self.failures += 1
+            logging.exception("Falha renovando o token %s", self.name)
+            return None
+        self.refreshes += 1
+        self.last_refresh = _now_iso()
+        logging.info("Token %s renovado (expira em %s)", self.name, bundle.get("expires_at"))
+        return bundle.get("access_token")
+
+    # ---- background -------------------------------------------------------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            remaining = seconds_until_expiry(self.provider.data())
+            if remaining is None:
+                # Sem token/expires_at: confere de novo depois (o arquivo pode mudar).
+                await asyncio.sleep(self.check_interval)
+                continue
+            wait = remaining - self.margin
+            if wait > 0:
+                await asyncio.sleep(min(wait, self.check_interval))
+                continue
+            if await self.refresh() is None:
+                await asyncio.sleep(self.retry_delay)
+
+    def snapshot(self) -> Dict[str, Any]:
+        remaining = seconds_until_expiry(self.provider.data())
+        return {
+            "expiresInS": round(remaining) if remaining is not None else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "lastRefresh": self.last_refresh,
+        }
+
+
+_LOCATION_REFRESHER: Optional[TokenRefresher] = None
+
+
+def set_location_refresher(refresher: Optional[TokenRefresher]) -> None:
+    """Define o refresher usado pelos clientes HTTP ao receber 401."""
+    global _LOCATION_REFRESHER
+    _LOCATION_REFRESHER = refresher
+
+
+async def refresh_location_token(stale_token: Optional[str]) -> Optional[str]:
+    """Renova o token da Location após um 401; None se não houver refresher."""
+    if _LOCATION_REFRESHER is None:
+        return None
+    return await _LOCATION_REFRESHER.refresh(stale_token)
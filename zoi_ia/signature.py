@@ -0,0 +1,144 @@
+"""Verificação da assinatura dos webhooks do GHL (``X-Wh-Signature``).
+
+As chaves públicas são lidas uma vez, na criação do :class:`WebhookVerifier`.
+``WEBHOOK_PUBLIC_KEY_PEM`` pode trazer vários blocos PEM (rotação de chave):
+a assinatura vale se bater com qualquer um, começando pela última chave que
+validou. Só chaves RSA são aceitas (o GHL assina com RSA/SHA-256); as demais
+são recusadas na carga. Payloads a partir de ``SIGNATURE_OFFLOAD_BYTES`` são verificados numa
+thread, fora do event loop. O tempo de cada verificação vai para ``snapshot``
+(``GET /metrics``).
+
+Sem a biblioteca ``cryptography`` a verificação é pulada (com aviso), como
+antes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import logging
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from .config import PUBLIC_KEY_PEM, SIGNATURE_OFFLOAD_BYTES, VERIFY_SIGNATURE
+
+try:  # dependência opcional
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+except Exception:  # pragma: no cover
+    load_pem_public_key = None  # type: ignore
+
+_PEM_BLOCK = re.compile(rb"-----BEGIN PUBLIC KEY-----.+?-----END PUBLIC KEY-----", re.S)
+
+
+def split_pem_keys(pem: bytes) -> List[bytes]:
+    """Separa os blocos ``PUBLIC KEY`` de um PEM com uma ou mais chaves."""
+    return _PEM_BLOCK.findall(pem or b"")
+
+
+class WebhookVerifier:
+    def __init__(
+        self,
+        pem: bytes = PUBLIC_KEY_PEM,
+        *,
+        enabled: bool = VERIFY_SIGNATURE,
+        offload_bytes: int = SIGNATURE_OFFLOAD_BYTES,
+        window: int = 1000,
+    ) -> None:
+        self.enabled = enabled
+        self.offload_bytes = offload_bytes
+        self._keys: List[Any] = []
+        self._preferred = 0
+        self._available = load_pem_public_key is not None
+        if enabled and not self._available:
+            logging.warning("biblioteca 'cryptography' não instalada; pulando verificação de assinatura")
+        elif enabled:
+            for block in split_pem_keys(pem):
+                try:
+                    key = load_pem_public_key(block)
+                except Exception:
+                    logging.exception("Chave pública de webhook inválida; ignorando")
+                    continue
+                if not isinstance(key, RSAPublicKey):
+                    logging.error("Chave pública de webhook não é RSA (%s); ignorando", type(key).__name__)
+                    continue
+                self._keys.append(key)
+            if not self._keys:
+                logging.error("Nenhuma chave pública de webhook válida; todas as assinaturas serão recusadas")
+        # métricas
+        self.verified = 0
+        self.rejected = 0
+        self.offloaded = 0
+        self.key_hits: List[int] = [0] * len(self._keys)
+        self._durations: Deque[float] = deque(maxlen=window)
+
+    @property
+    def keys(self) -> int:
+        return len(self._keys)
+
+    def _check(self, payload: bytes, signature: bytes) -> bool:
+        # a última chave que validou primeiro: na rotação, quase sempre acerta de cara
+        for i in sorted(range(len(self._keys)), key=lambda i: i != self._preferred):
+            try:
+                self._keys[i].verify(signature, payload, padding.PKCS1v15(), hashes.SHA256())
+            except InvalidSignature:
+                continue
+            except Exception:
+                # qualquer outra falha da biblioteca conta como assinatura que não bateu
+                logging.exception("Falha verificando a assinatura com a chave %d", i)
+                continue
+            self._preferred = i
+            self.key_hits[i] += 1
+            return True
+        return False
+
+    def verify(self, payload: bytes, signature_b64: str) -> bool:
+        """Confere a assinatura (base64) de `payload`; bloqueia enquanto verifica."""
+        if not self.enabled or not self._available:
+            return True
+        started = time.perf_counter()
+        try:
+            signature = base64.b64decode(signature_b64, validate=True)
+            ok = self._check(payload, signature)
+        except (binascii.Error, ValueError):
+            ok = False
+        finally:
+            self._durations.append(time.perf_counter() - started)
+        if ok:
+            self.verified += 1
+        else:
+            self.rejected += 1
+            logging.error("Assinatura inválida para payload de %d bytes", len(payload))
+        return ok
+
+    async def verify_async(self, payload: bytes, signature_b64: str) -> bool:
+        """Como `verify`, mas payloads grandes são verificados numa thread."""
+        if self.offload_bytes > 0 and len(payload) >= self.offload_bytes and self.enabled and self._available:
+            self.offloaded += 1
+            return await asyncio.to_thread(self.verify, payload, signature_b64)
+        return self.verify(payload, signature_b64)
+
+    def snapshot(self) -> Dict[str, Any]:
+        durations = sorted(self._durations)
+
+        def pct(p: float) -> Optional[float]:
+            if not durations:
+                return None
+            return round(durations[min(int(p * len(durations)), len(durations) - 1)] * 1e6, 1)
+
+        return {
+            "enabled": self.enabled and self._available,
+            "keys": self.keys,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "offloaded": self.offloaded,
+            "keyHits": list(self.key_hits),
+            "verifyP50Us": pct(0.50),
+            "verifyP99Us": pct(0.99),
+        }
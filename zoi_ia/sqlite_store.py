@@ -0,0 +1,245 @@
+"""Backend SQLite (WAL) para o histórico de mensagens por contato.
+
+Cada mensagem é uma linha em ``messages`` (ordem cronológica por ``seq``) e os
+campos do contato (context, flow, conversationId, ...) ficam em ``contacts``.
+Salvar um contato grava só a diferença em relação ao que já está no banco:
+mensagens novas são inseridas e as que o resumo descartou são removidas, sem
+reescrever o histórico inteiro a cada webhook.
+
+Migração única a partir da árvore JSON existente::
+
+    python -m zoi_ia.sqlite_store migrate
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from . import codec
+from .config import MESSAGES_DIR, SQLITE_PATH
+from .layout import iter_contact_files
+from .storage import (
+    _empty_contact_store,
+    _now_iso,
+    message_digest,
+    plan_message_update,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    contact_id TEXT PRIMARY KEY,
+    conversation_id TEXT,
+    context TEXT NOT NULL DEFAULT '',
+    flow TEXT,
+    extra TEXT NOT NULL DEFAULT '{}',
+    last_update TEXT
+);
+CREATE TABLE IF NOT EXISTS messages (
+    contact_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    direction TEXT,
+    body TEXT,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (contact_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Chaves do store que viram colunas; o resto vai para `extra` (JSON).
+_COLUMN_KEYS = {"messages", "context", "flow", "conversationId", "lastUpdate"}
+
+
+class SQLiteMessageStore:
+    """Implementa ``load``/``save`` do histórico sobre um arquivo SQLite."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 não compartilha conexões entre threads; uma por thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def load(self, contact_id: str) -> Dict[str, Any]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT conversation_id, context, flow, extra, last_update FROM contacts WHERE contact_id = ?",
+            (contact_id,),
+        ).fetchone()
+        if row is None:
+            return _empty_contact_store()
+        conversation_id, context, flow, extra, last_update = row
+        rows = conn.execute(
+            "SELECT data FROM messages WHERE contact_id = ? ORDER BY seq DESC",
+            (contact_id,),
+        ).fetchall()
+
+        data: Dict[str, Any] = {}
+        try:
+            data.update(codec.loads(extra or "{}"))
+        except codec.CodecError:
+            logging.warning("Campo extra inválido para %s; ignorando.", contact_id)
+        data["lastUpdate"] = last_update or _now_iso()
+        # O formato em memória continua o do JSON: mais recente primeiro.
+        data["messages"] = [codec.loads(r[0]) for r in rows]
+        data["context"] = context or ""
+        if flow is not None:
+            data["flow"] = codec.loads(flow)
+        if conversation_id is not None:
+            data["conversationId"] = conversation_id
+        return data
+
+    @staticmethod
+    def _sync_messages(
+        conn: sqlite3.Connection, contact_id: str, chrono: List[Dict[str, Any]]
+    ) -> Tuple[int, int, List[str]]:
+        """Remove do banco o que o resumo descartou; retorna ``(keep, next_seq, digests)``.
+
+        ``digests`` são os de ``chrono[keep:]``, as mensagens a inserir. No caso
+        comum (só mensagens novas no fim) confere a primeira e a última linha
+        gravadas e calcula o digest apenas da cauda nova, sem ler todos os
+        digests do contato. Se o início mudou compara tudo.
+        """
+        count, first_seq, last_seq = conn.execute(
+            "SELECT COUNT(*), MIN(seq), MAX(seq) FROM messages WHERE contact_id = ?",
+            (contact_id,),
+        ).fetchone()
+        if count == 0:
+            return 0, 0, [message_digest(m) for m in chrono]
+        if len(chrono) >= count:
+            ends = dict(
+                conn.execute(
+                    "SELECT seq, digest FROM messages WHERE contact_id = ? AND seq IN (?, ?)",
+                    (contact_id, first_seq, last_seq),
+                ).fetchall()
+            )
+            if message_digest(chrono[count - 1]) == ends[last_seq] and message_digest(chrono[0]) == ends[first_seq]:
+                return count, last_seq + 1, [message_digest(m) for m in chrono[count:]]
+
+        existing = conn.execute(
+            "SELECT seq, digest FROM messages WHERE contact_id = ? ORDER BY seq",
+            (contact_id,),
+        ).fetchall()
+        digests = [message_digest(m) for m in chrono]
+        drop, keep = plan_message_update([d for _, d in existing], digests)
+        if drop == len(existing):
+            conn.execute("DELETE FROM messages WHERE contact_id = ?", (contact_id,))
+        elif drop:
+            conn.execute(
+                "DELETE FROM messages WHERE contact_id = ? AND seq < ?",
+                (contact_id, existing[drop][0]),
+            )
+        return keep, existing[-1][0] + 1, digests[keep:]
+
+    def save(self, contact_id: str, store: Dict[str, Any]) -> None:
+        chrono: List[Dict[str, Any]] = list(reversed(store.get("messages") or []))
+        extra = {k: v for k, v in store.items() if k not in _COLUMN_KEYS}
+        flow = store.get("flow")
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keep, next_seq, digests = self._sync_messages(conn, contact_id, chrono)
+            conn.executemany(
+                "INSERT INTO messages (contact_id, seq, direction, body, digest, data) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        contact_id,
+                        next_seq + i,
+                        m.get("direction"),
+                        m.get("body"),
+                        digests[i],
+                        codec.dumps(m),
+                    )
+                    for i, m in enumerate(chrono[keep:])
+                ],
+            )
+            conn.execute(
+                """
+                INSERT INTO contacts (contact_id, conversation_id, context, flow, extra, last_update)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(contact_id) DO UPDATE SET
+                    conversation_id = excluded.conversation_id,
+                    context = excluded.context,
+                    flow = excluded.flow,
+                    extra = excluded.extra,
+                    last_update = excluded.last_update
+                """,
+                (
+                    contact_id,
+                    store.get("conversationId"),
+                    store.get("context") or "",
+                    codec.dumps(flow) if flow is not None else None,
+                    codec.dumps(extra),
+                    store.get("lastUpdate") or _now_iso(),
+                ),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def migrate_json_tree(messages_dir: Path = MESSAGES_DIR, db_path: Path = SQLITE_PATH) -> int:
+    """Importa todos os ``<contact_id>.json`` de ``messages_dir`` para o SQLite.
+
+    Os arquivos JSON não são removidos. Retorna a quantidade de contatos migrados.
+    """
+    engine = SQLiteMessageStore(db_path)
+    count = 0
+    try:
+        for contact_id, suffix, path in sorted(iter_contact_files("messages", Path(messages_dir))):
+            if suffix != ".json":
+                continue
+            try:
+                data = codec.loads(path.read_bytes())
+            except Exception:
+                logging.exception("Falha lendo %s; pulando.", path)
+                continue
+            if not isinstance(data, dict):
+                logging.warning("Formato inesperado em %s; pulando.", path)
+                continue
+            data.setdefault("messages", [])
+            data.setdefault("context", "")
+            engine.save(contact_id, data)
+            count += 1
+    finally:
+        engine.close()
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ferramentas do backend SQLite do histórico.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="importa data/messages/*.json para o SQLite")
+    mig.add_argument("--messages-dir", type=Path, default=MESSAGES_DIR)
+    mig.add_argument("--db", type=Path, default=SQLITE_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "migrate":
+        total = migrate_json_tree(args.messages_dir, args.db)
+        logging.info("%d contatos migrados para %s", total, args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,128 @@
-import json
+import hashlib
 import logging
+import os
+import threading
+import time
 from datetime import datetime, timezone
-from typing import Any, Dict, Tuple, Optional
+from typing import Any, Dict, List, Optional, Protocol, Tuple, Union
 
 from pathlib import Path
-from .config import STORE_PATH, MESSAGES_DIR, LOCATION_TOKEN_PATH
+from .config import STORE_PATH, MESSAGES_DIR, LOCATION_TOKEN_PATH, STORAGE_BACKEND, SQLITE_PATH
+from . import codec
+from .conversation import ConversationBuffer
+from .layout import contact_write_lock, resolve_contact_path
 
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _atomic_write(path: Path, data: str) -> None:
+def _atomic_write(path: Path, data: Union[str, bytes]) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     tmp = path.with_suffix(path.suffix + ".tmp")
-    tmp.write_text(data, encoding="utf-8")
+    if isinstance(data, bytes):
+        tmp.write_bytes(data)
+    else:
+        tmp.write_text(data, encoding="utf-8")
     tmp.replace(path)
 
 
+def _empty_contact_store() -> Dict[str, Any]:
+    return {"lastUpdate": _now_iso(), "messages": [], "context": ""}
+
+
+def message_digest(message: Dict[str, Any]) -> str:
+    """Identifica o conteúdo de uma mensagem para detectar o que mudou."""
+    return hashlib.sha1(codec.dumpb(message, sort_keys=True)).hexdigest()
+
+
+def plan_message_update(old: List[str], new: List[str]) -> Tuple[int, int]:
+    """Compara dois históricos (digests em ordem cronológica).
+
+    Os handlers só acrescentam mensagens novas no fim e o resumo de contexto só
+    descarta as mais antigas do início. Retorna ``(drop, keep)`` tal que
+    ``new == old[drop:] + new[keep:]``: basta remover as ``drop`` primeiras e
+    gravar ``new[keep:]``. Um histórico substituído resulta em
+    ``(len(old), 0)``, ou seja, regravação completa.
+
+    Só as posições de ``old`` iguais a ``new[0]`` são candidatas a início do
+    trecho mantido, então o custo é O(n) no caso comum (um único candidato).
+    """
+    if new:
+        first = new[0]
+        for drop, digest in enumerate(old):
+            if digest != first:
+                continue
+            keep = len(old) - drop
+            if keep <= len(new) and old[drop:] == new[:keep]:
+                return drop, keep
+    return len(old), 0
+
+
+class MessageStore(Protocol):
+    """Motor de persistência do histórico por contato."""
+
+    def load(self, contact_id: str) -> Dict[str, Any]: ...
+
+    def save(self, contact_id: str, store: Dict[str, Any]) -> None: ...
+
+
+class JsonMessageStore:
+    """Um arquivo JSON por contato em ``MESSAGES_DIR`` (formato original)."""
+
+    def load(self, contact_id: str) -> Dict[str, Any]:
+        MESSAGES_DIR.mkdir(parents=True, exist_ok=True)
+        path = resolve_contact_path(MESSAGES_DIR, contact_id, ".json")
+        if path.exists():
+            try:
+                data = codec.loads(path.read_bytes())
+                data.setdefault("messages", [])
+                data.setdefault("context", "")
+                return data
+            except Exception:
+                logging.exception("Falha lendo o histórico de %s; recriando.", contact_id)
+        return _empty_contact_store()
+
+    def save(self, contact_id: str, store: Dict[str, Any]) -> None:
+        data = codec.dumpb(store, pretty=True)
+        with contact_write_lock(contact_id):
+            path = resolve_contact_path(MESSAGES_DIR, contact_id, ".json")
+            _atomic_write(path, data)
+
+
+_ENGINES: Dict[Tuple[str, str], MessageStore] = {}
+
+
+def get_message_store(backend: Optional[str] = None) -> MessageStore:
+    """Retorna o motor configurado em ``STORAGE_BACKEND`` (instância por processo)."""
+    backend = (backend or STORAGE_BACKEND or "json").lower()
+    if backend == "sqlite":
+        key = (backend, str(SQLITE_PATH))
+        engine = _ENGINES.get(key)
+        if engine is None:
+            from .sqlite_store import SQLiteMessageStore
+
+            engine = SQLiteMessageStore(SQLITE_PATH)
+            _ENGINES[key] = engine
+        return engine
+    if backend == "journal":
+        key = (backend, str(MESSAGES_DIR))
+        engine = _ENGINES.get(key)
+        if engine is None:
+            from .journal_store import JournalMessageStore
+
+            engine = JournalMessageStore(MESSAGES_DIR)
+            _ENGINES[key] = engine
+        return engine
+    if backend != "json":
+        logging.warning("STORAGE_BACKEND desconhecido (%s); usando json.", backend)
+    return JsonMessageStore()
+
+
 def load_store() -> Dict[str, Any]:
     if STORE_PATH.exists():
         try:
-            return json.loads(STORE_PATH.read_text(encoding="utf-8"))
+            return codec.loads(STORE_PATH.read_bytes())
         except Exception:
             logging.exception("Falha lendo o store; recriando.")
     return {"lastUpdate": _now_iso(), "contactIds": []}
@@ -29,46 +130,105 @@ def load_store() -> Dict[str, Any]:
 
 def save_store(store: Dict[str, Any]) -> None:
     store["lastUpdate"] = _now_iso()
-    payload = json.dumps(store, ensure_ascii=False, indent=2)
-    _atomic_write(STORE_PATH, payload)
+    _atomic_write(STORE_PATH, codec.dumpb(store, pretty=True))
 
 
 def load_contact_messages(contact_id: str) -> Dict[str, Any]:
-    MESSAGES_DIR.mkdir(parents=True, exist_ok=True)
-    path = MESSAGES_DIR / f"{contact_id}.json"
-    if path.exists():
-        try:
-            data = json.loads(path.read_text(encoding="utf-8"))
-            data.setdefault("messages", [])
-            data.setdefault("context", "")
-            return data
-        except Exception:
-            logging.exception("Falha lendo o histórico de %s; recriando.", contact_id)
-    return {"lastUpdate": _now_iso(), "messages": [], "context": ""}
+    return get_message_store().load(contact_id)
 
 
 def save_contact_messages(contact_id: str, store: Dict[str, Any]) -> None:
     store["lastUpdate"] = _now_iso()
     store.setdefault("context", "")
-    path = MESSAGES_DIR / f"{contact_id}.json"
-    payload = json.dumps(store, ensure_ascii=False, indent=2)
-    _atomic_write(path, payload)
+    messages = store.get("messages")
+    if isinstance(messages, ConversationBuffer):
+        # Em memória o histórico é cronológico; em disco, mais recente primeiro.
+        store = {**store, "messages": messages.to_newest_first()}
+    get_message_store().save(contact_id, store)
+
+
+class TokenProvider:
+    """Token OAuth de um arquivo JSON mantido em memória.
+
+    O arquivo só é relido quando muda (mtime/tamanho), e essa checagem é feita
+    no máximo a cada ``check_interval`` segundos; enquanto o arquivo não
+    existir, cada acesso tenta de novo. ``update`` troca o token em memória e em
+    disco de uma vez (usado pelo refresh).
+    """
+
+    def __init__(self, path: Path, check_interval: float = 1.0) -> None:
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._data: Dict[str, Any] = {}
+        self._sig: Optional[Tuple[int, int]] = None
+        self._checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh_from_disk(self) -> None:
+        now = time.monotonic()
+        if self._sig is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            sig = self._stat()
+            if sig == self._sig:
+                return
+            data: Dict[str, Any] = {}
+            if sig is None:
+                logging.warning("Token não encontrado em %s", self.path)
+            else:
+                try:
+                    loaded = codec.loads(self.path.read_bytes())
+                    data = loaded if isinstance(loaded, dict) else {}
+                except Exception:
+                    logging.exception("Falha lendo %s", self.path.name)
+            self._data = data
+            self._sig = sig
+
+    def data(self) -> Dict[str, Any]:
+        """Conteúdo atual do arquivo de token (não alterar o dict retornado)."""
+        self._refresh_from_disk()
+        return self._data
+
+    @property
+    def access_token(self) -> Optional[str]:
+        return self.data().get("access_token")
+
+    def credentials(self) -> Tuple[Optional[str], Optional[str]]:
+        data = self.data()
+        return data.get("access_token"), data.get("location_id")
+
+    def update(self, data: Dict[str, Any]) -> None:
+        """Grava o novo token em disco e o publica em memória."""
+        with self._lock:
+            _atomic_write(self.path, codec.dumpb(data, pretty=True))
+            self._data = dict(data)
+            self._sig = self._stat()
+            self._checked_at = time.monotonic()
+
+
+_TOKEN_PROVIDERS: Dict[str, TokenProvider] = {}
+
+
+def get_token_provider(path: Optional[Path] = None) -> TokenProvider:
+    """Provider compartilhado do arquivo de token (padrão: ``LOCATION_TOKEN_PATH``)."""
+    path = Path(LOCATION_TOKEN_PATH if path is None else path)
+    provider = _TOKEN_PROVIDERS.get(str(path))
+    if provider is None:
+        provider = _TOKEN_PROVIDERS[str(path)] = TokenProvider(path)
+    return provider
 
 
 def load_location_token() -> Optional[str]:
-    try:
-        data = json.loads(LOCATION_TOKEN_PATH.read_text(encoding="utf-8"))
-        return data.get("access_token")
-    except Exception:
-        logging.exception("Falha lendo location_token.json")
-        return None
+    return get_token_provider().access_token
 
 
 def load_location_credentials() -> Tuple[Optional[str], Optional[str]]:
-    try:
-        data = json.loads(LOCATION_TOKEN_PATH.read_text(encoding="utf-8"))
-        return data.get("access_token"), data.get("location_id")
-    except Exception:
-        logging.exception("Falha lendo location_token.json")
-        return None, None
-
+    return get_token_provider().credentials()
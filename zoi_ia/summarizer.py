@@ -1,15 +1,13 @@
 import asyncio
-import json
 import logging
 import os
 from typing import Dict, List
 
 from cachetools import TTLCache
 
-try:
-    from openai import AsyncOpenAI
-except Exception:  # pragma: no cover - fallback se openai não instalado
-    AsyncOpenAI = None
+from . import codec
+from .clients.openai_gateway import GATEWAY, PRIORITY_BACKGROUND
+from .resilience import CircuitOpenError
 
 try:
     from transformers import pipeline  # type: ignore
@@ -21,30 +19,44 @@ _CACHE = TTLCache(maxsize=128, ttl=3600)
 DEFAULT_MAX_MESSAGES = 50
 
 
-async def summarize(messages: List[Dict[str, str]], max_messages: int = DEFAULT_MAX_MESSAGES, timeout: float = 10.0) -> str:
-    """Gera um resumo textual das mensagens."""
+async def summarize(
+    messages: List[Dict[str, str]],
+    max_messages: int = DEFAULT_MAX_MESSAGES,
+    timeout: float | None = None,
+    *,
+    chronological: bool = False,
+) -> str:
+    """Gera um resumo textual das mensagens.
+
+    Por padrão `messages` vem no formato em disco (mais recente primeiro); com
+    `chronological=True` já chega na ordem da conversa e não é invertida.
+    """
     if not messages:
         return ""
-    msgs = list(reversed(messages[:max_messages]))
+    if chronological:
+        msgs = list(messages[-max_messages:])
+    else:
+        msgs = list(reversed(messages[:max_messages]))
     _CACHE.expire()
-    key = json.dumps(msgs, ensure_ascii=False, sort_keys=True)
+    key = codec.dumpb(msgs, sort_keys=True)
     cached = _CACHE.get(key)
     if cached is not None:
         return cached
     text = "\n".join(f"{m.get('direction')}: {m.get('body')}" for m in msgs)
     summary = text
     try:
-        if AsyncOpenAI:
-            client = AsyncOpenAI()
-            resp = await asyncio.wait_for(
-                client.chat.completions.create(
-                    model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
-                    messages=[
-                        {"role": "system", "content": "Resuma a conversa de forma sucinta."},
-                        {"role": "user", "content": text},
-                    ],
-                ),
+        if GATEWAY.available():
+            resp = await GATEWAY.chat(
+                [
+                    {"role": "system", "content": "Resuma a conversa de forma sucinta."},
+                    {"role": "user", "content": text},
+                ],
+                model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+                priority=PRIORITY_BACKGROUND,
                 timeout=timeout,
+                # circuito próprio: prompts longos do resumo não inflam o p99 das
+                # respostas e falhas aqui não suspendem o atendimento
+                breaker="openai_summary",
             )
             summary = resp.choices[0].message.content.strip()
         elif pipeline:
@@ -53,6 +65,10 @@ async def summarize(messages: List[Dict[str, str]], max_messages: int = DEFAULT_
                 summarizer, text, max_length=60, min_length=10, do_sample=False
             )
             summary = result[0]["summary_text"].strip()
+    except CircuitOpenError as exc:
+        # não guarda no cache: o resumo real vem quando o circuito fechar
+        logging.warning("Resumo suspenso: %s", exc)
+        return summary
     except Exception as exc:  # pragma: no cover - log e usa fallback
         logging.exception("Falha ao resumir mensagens: %s", exc)
     _CACHE[key] = summary
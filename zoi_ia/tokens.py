@@ -0,0 +1,65 @@
+"""Contagem de tokens compartilhada (montagem do contexto e orçamento da OpenAI).
+
+Usa ``tiktoken`` quando instalado; sem ele — ou se o vocabulário não puder ser
+carregado (o primeiro uso baixa o arquivo) — uma estimativa de ~4 caracteres
+por token.
+"""
+
+from __future__ import annotations
+
+import logging
+from functools import lru_cache
+from typing import Optional
+
+try:  # tokenizador local opcional
+    import tiktoken  # type: ignore
+except Exception:  # pragma: no cover
+    tiktoken = None  # type: ignore
+
+DEFAULT_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    if model:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except Exception:
+            pass  # modelo desconhecido: usa o vocabulário padrão
+    try:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception:
+        logging.warning("Tokenizador %s indisponível; usando estimativa por caracteres", DEFAULT_ENCODING)
+        return None
+
+
+def get_encoding(model: Optional[str] = None):
+    """Encoding do tiktoken para ``model`` ou None (estimativa por caracteres)."""
+    return _encoding(model)
+
+
+def warm_up(*models: Optional[str]) -> None:
+    """Carrega os vocabulários de ``models`` (e o padrão) antes do primeiro uso.
+
+    O primeiro uso pode baixar o arquivo do vocabulário; chame fora do event
+    loop (``run_io``).
+    """
+    for model in (*models, None):
+        _encoding(model)
+
+
+def tokenizer_name(model: Optional[str] = None) -> str:
+    enc = _encoding(model)
+    return enc.name if enc is not None else "heuristic"
+
+
+@lru_cache(maxsize=1024)
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
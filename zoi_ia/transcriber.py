@@ -9,23 +9,19 @@ configurável) quando disponível. Em caso de falha, retorna string vazia.
 
 import io
 import logging
-import os
 from typing import Iterable, Optional, Tuple
 
-import httpx
-
-try:  # OpenAI opcional
-    from openai import AsyncOpenAI
-except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
-
 from .config import (
     AUDIO_MAX_MB,
     AUDIO_MIME_WHITELIST,
     AUDIO_EXT_WHITELIST,
     GHL_API_URL,
+    MEDIA_DOWNLOAD_TIMEOUT,
     TRANSCRIPTION_MODEL,
 )
+from .clients import http
+from .clients.openai_gateway import GATEWAY, PRIORITY_MEDIA
+from .resilience import CircuitOpenError, get_breaker
 from .storage import load_location_token
 
 
@@ -94,8 +90,7 @@ async def _download_audio(url: str, *, max_bytes: int) -> Tuple[bytes, Optional[
         except Exception:
             pass
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=headers, timeout=30.0)
+    async with http.stream("GET", url, headers=headers, timeout=MEDIA_DOWNLOAD_TIMEOUT) as resp:
         resp.raise_for_status()
         ctype = resp.headers.get("content-type")
 
@@ -129,7 +124,12 @@ async def transcribe_from_url(url: str) -> str:
     loga e retorna string vazia.
     """
     try:
-        data, ctype = await _download_audio(url, max_bytes=AUDIO_MAX_MB * 1024 * 1024)
+        # o tempo do download cresce com o tamanho do áudio; o limite adaptativo
+        # (p99 dos downloads pequenos) abriria o circuito em notas de voz longas
+        data, ctype = await get_breaker("media").call(
+            lambda: _download_audio(url, max_bytes=AUDIO_MAX_MB * 1024 * 1024),
+            timeout=MEDIA_DOWNLOAD_TIMEOUT,
+        )
         # Se o Content-Type não parecer de áudio, mas a extensão indicar que é,
         # seguimos em frente; caso contrário, ignoramos.
         if ctype and not is_audio_mime(ctype):
@@ -137,21 +137,26 @@ async def transcribe_from_url(url: str) -> str:
                 logging.info("Ignorando URL não‑áudio (%s): %s", ctype, url)
                 return ""
         filename = _guess_filename(url, ctype)
+    except CircuitOpenError as exc:
+        logging.warning("Download de áudio suspenso: %s", exc)
+        return ""
     except Exception as exc:
         logging.exception("Falha ao baixar áudio: %s", exc)
         return ""
 
-    if AsyncOpenAI is None or not os.getenv("OPENAI_API_KEY"):
+    if not GATEWAY.available():
         logging.warning("OpenAI indisponível para transcrição; retornando vazio.")
         return ""
 
     try:
-        client = AsyncOpenAI()
         filebuf = _mk_named_buffer(data, filename)
-        resp = await client.audio.transcriptions.create(model=TRANSCRIPTION_MODEL, file=filebuf)
+        resp = await GATEWAY.transcribe(filebuf, model=TRANSCRIPTION_MODEL, priority=PRIORITY_MEDIA)
         # OpenAI v1 retorna campo `text`
         text = getattr(resp, "text", None) or (resp.get("text") if isinstance(resp, dict) else None)
         return (text or "").strip()
+    except CircuitOpenError as exc:
+        logging.warning("Transcrição suspensa: %s", exc)
+        return ""
     except Exception as exc:  # pragma: no cover
         logging.exception("Falha na transcrição do áudio: %s", exc)
         return ""
@@ -8,23 +8,19 @@ caso de falha ou ausência de chave, retorna string vazia.
 
 import io
 import logging
-import os
 from typing import Iterable, Optional, Tuple
 
-import httpx
-
-try:
-    from openai import AsyncOpenAI
-except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
-
 from .config import (
     IMAGE_MAX_MB,
     IMAGE_MIME_WHITELIST,
     IMAGE_EXT_WHITELIST,
     GHL_API_URL,
+    MEDIA_DOWNLOAD_TIMEOUT,
     VISION_MODEL,
 )
+from .clients import http
+from .clients.openai_gateway import GATEWAY, PRIORITY_MEDIA
+from .resilience import CircuitOpenError
 from .storage import load_location_token
 
 
@@ -61,8 +57,7 @@ async def _download_image(url: str, *, max_bytes: int) -> Tuple[bytes, Optional[
         except Exception:
             pass
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=headers, timeout=30.0)
+    async with http.stream("GET", url, headers=headers, timeout=MEDIA_DOWNLOAD_TIMEOUT) as resp:
         resp.raise_for_status()
         ctype = resp.headers.get("content-type")
         # tamanho
@@ -80,11 +75,10 @@ async def _download_image(url: str, *, max_bytes: int) -> Tuple[bytes, Optional[
 async def describe_image_from_url(url: str) -> str:
     """Gera uma descrição concisa da imagem (pt-BR)."""
     # Não precisamos enviar o binário; o modelo aceita URL pública.
-    if AsyncOpenAI is None or not os.getenv("OPENAI_API_KEY"):
+    if not GATEWAY.available():
         logging.warning("OpenAI indisponível para visão; retornando vazio.")
         return ""
     try:
-        client = AsyncOpenAI()
         messages = [
             {
                 "role": "user",
@@ -100,8 +94,11 @@ async def describe_image_from_url(url: str) -> str:
                 ],
             }
         ]
-        resp = await client.chat.completions.create(model=VISION_MODEL, messages=messages)
+        resp = await GATEWAY.chat(messages, model=VISION_MODEL, priority=PRIORITY_MEDIA, breaker="vision")
         return (resp.choices[0].message.content or "").strip()
+    except CircuitOpenError as exc:
+        logging.warning("Descrição de imagem suspensa: %s", exc)
+        return ""
     except Exception as exc:  # pragma: no cover
         logging.exception("Falha ao descrever imagem: %s", exc)
         return ""